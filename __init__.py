@@ -44,7 +44,9 @@ cors = CORS(
        'https://open-coding-society.github.io',
        'https://pages.opencodingsociety.com',
    ],
-   methods=["GET", "POST", "PUT", "OPTIONS"]
+   methods=["GET", "POST", "PUT", "OPTIONS"],
+   # Post list endpoints return their next-page cursor in a header
+   expose_headers=["X-Next-Cursor"]
 )
 
 
@@ -131,6 +133,15 @@ app.config['KASM_API_KEY'] = os.environ.get('KASM_API_KEY') or None
 app.config['KASM_API_KEY_SECRET'] = os.environ.get('KASM_API_KEY_SECRET') or None
 
 
+# Stock game quote settings (point STOCK_QUOTE_URL at a local stub server for tests)
+app.config['STOCK_QUOTE_URL'] = os.environ.get('STOCK_QUOTE_URL') or 'https://financialmodelingprep.com/api/v3/quote'
+app.config['STOCK_QUOTE_API_KEY'] = os.environ.get('STOCK_QUOTE_API_KEY') or 'xAxPbodLC12nNCwa5gHiK6YZVQecllPA'
+app.config['STOCK_QUOTE_BATCH_SIZE'] = int(os.environ.get('STOCK_QUOTE_BATCH_SIZE') or 100)
+app.config['STOCK_SYMBOL_CACHE_TTL'] = int(os.environ.get('STOCK_SYMBOL_CACHE_TTL') or 5)
+# Seconds between background sweeps of expired stock accounts (0 disables the sweeper thread)
+app.config['STOCK_EXPIRY_SWEEP_INTERVAL'] = int(os.environ.get('STOCK_EXPIRY_SWEEP_INTERVAL') or 0)
+
+
 #GROQ settings
 app.config['GROQ_API_KEY'] = os.environ.get('GROQ_API_KEY')
 
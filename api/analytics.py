@@ -1,18 +1,25 @@
 from flask import Blueprint, request, jsonify, g
 from flask_restful import Api, Resource
 from flask_login import current_user, login_required
-from datetime import datetime
+from datetime import datetime, timedelta
 from api.jwt_authorize import token_required
 from __init__ import db
 from model.github import GitHubUser, GitHubOrg
-from model.user import User
-import time
+from model.github_cache import github_cache
+from model.github_client import github_client
+from model.academic_calendar import academic_calendar
+from model import github_warehouse
+from model.user import User, Section, UserSection
+from model.classroom import classroom_student
 
 # Gas-game analytics (Phase 4)
 from sqlalchemy import func, case
 from model.game_session import GameSession
 from model.player_interaction import PlayerInteraction
 from model.question import Question
+from model.gasgame_stats import QuestionStat, SessionDayStat
+from model.response_sketch import merged_sketches
+from model.gasgame_cohorts import cohort_report, BUCKETS
 
 
 
@@ -20,31 +27,24 @@ analytics_api = Blueprint('analytics_api', __name__, url_prefix='/api/analytics'
 api = Api(analytics_api)
 
 
+@analytics_api.after_request
+def add_retry_after(response):
+    """Surface the GitHub client's retry hint as a Retry-After header."""
+    if response.status_code == 429 and response.is_json:
+        retry_after = (response.get_json(silent=True) or {}).get('retry_after')
+        if retry_after is not None:
+            response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
 
 def get_date_range(body):
-    start_date = body.get('start_date')
-    end_date = body.get('end_date')
-    
+    """Dates from the request body, or the current trimester's window."""
+    start_date = body.get('start_date') if body else None
+    end_date = body.get('end_date') if body else None
+
     if not start_date or not end_date:
-        today = datetime.today()
-        year = today.year
-
-        if datetime(year, 6, 15) <= today <= datetime(year, 11, 14):  # Trimester 1
-            start_date = datetime(year, 6, 1)
-            end_date = datetime(year, 11, 14)
-        elif datetime(year, 11, 15) <= today or today <= datetime(year, 3, 31):  # Trimester 2 (extended to March 31)
-            if today.month <= 3:  # If Jan–Mar, adjust to previous year
-                year -= 1  
-            start_date = datetime(year, 9, 1)
-            end_date = datetime(year + 1, 3, 31)  # Now includes all of March
-        elif datetime(year, 4, 1) <= today <= datetime(year, 6, 14):  # Trimester 3 (fixed start)
-            start_date = datetime(year, 4, 1)
-            end_date = datetime(year, 6, 14)
-        else:
-            raise ValueError(f"Date {today.strftime('%Y-%m-%d')} is out of the defined trimesters")
-
-        start_date = start_date.strftime('%Y-%m-%d')
-        end_date = end_date.strftime('%Y-%m-%d')
+        start_date, end_date = academic_calendar.term_for().range()
 
     return start_date, end_date
 
@@ -128,17 +128,19 @@ def gasgame_player_analytics(user_id: int):
             "avg_attempts": avg_attempts,
         },
         "recent_sessions": recent_sessions,
+        "response_time": merged_sketches('player', [user_id], request.args.get('days', type=int))[user_id].summary(histogram=True),
     }), 200
 
 
 @analytics_api.route('/questions', methods=['GET'])
 def gasgame_question_analytics():
-    """Phase 4: Question difficulty and success rates."""
+    """Phase 4: Question difficulty and success rates, read from the question_stats rollup."""
     limit = request.args.get('limit', default=50, type=int)
     limit = max(1, min(limit, 500))
     category = request.args.get('category', default=None, type=str)
     difficulty = request.args.get('difficulty_level', default=None, type=int)
 
+    attempts = func.coalesce(QuestionStat.attempt_count, 0)
     base = (
         db.session.query(
             Question.id.label('question_id'),
@@ -146,12 +148,12 @@ def gasgame_question_analytics():
             Question.difficulty_level.label('difficulty_level'),
             Question.category.label('category'),
             Question.college_board_aligned.label('college_board_aligned'),
-            func.count(PlayerInteraction.id).label('attempt_count'),
-            func.sum(case((PlayerInteraction.is_correct.is_(True), 1), else_=0)).label('correct_count'),
-            func.avg(PlayerInteraction.response_time_ms).label('avg_response_time_ms'),
+            attempts.label('attempt_count'),
+            QuestionStat.correct_count.label('correct_count'),
+            QuestionStat.response_count.label('response_count'),
+            QuestionStat.response_time_sum_ms.label('response_time_sum_ms'),
         )
-        .outerjoin(PlayerInteraction, PlayerInteraction.question_id == Question.id)
-        .group_by(Question.id)
+        .outerjoin(QuestionStat, QuestionStat.question_id == Question.id)
     )
 
     if category:
@@ -159,7 +161,8 @@ def gasgame_question_analytics():
     if difficulty is not None:
         base = base.filter(Question.difficulty_level == difficulty)
 
-    rows = base.order_by(func.count(PlayerInteraction.id).desc(), Question.id.asc()).limit(limit).all()
+    rows = base.order_by(attempts.desc(), Question.id.asc()).limit(limit).all()
+    sketches = merged_sketches('question', [r.question_id for r in rows], request.args.get('days', type=int))
 
     results = []
     for r in rows:
@@ -174,7 +177,8 @@ def gasgame_question_analytics():
             "attempt_count": attempt_count,
             "correct_count": correct_count,
             "correct_rate": round(correct_count / attempt_count, 4) if attempt_count else None,
-            "avg_response_time_ms": round(float(r.avg_response_time_ms), 2) if r.avg_response_time_ms is not None else None,
+            "avg_response_time_ms": round(r.response_time_sum_ms / r.response_count, 2) if r.response_count else None,
+            "response_time": sketches[r.question_id].summary(),
         })
 
     return jsonify({
@@ -183,35 +187,83 @@ def gasgame_question_analytics():
     }), 200
 
 
-@analytics_api.route('/sessions', methods=['GET'])
-def gasgame_session_analytics():
-    """Phase 4: Session analytics (completion time, retry rates)."""
-    limit = request.args.get('limit', default=500, type=int)
-    limit = max(1, min(limit, 5000))
+@analytics_api.route('/questions/<int:question_id>/response_times', methods=['GET'])
+def gasgame_question_response_times(question_id: int):
+    """Response-time percentiles and histogram for one question, optionally over the last ?days=N."""
+    question = Question.query.get(question_id)
+    if not question:
+        return jsonify({"error": "Question not found", "question_id": question_id}), 404
 
-    sessions = (
-        GameSession.query
-        .order_by(GameSession.start_time.desc())
-        .limit(limit)
-        .all()
-    )
+    days = request.args.get('days', default=None, type=int)
+    sketch = merged_sketches('question', [question_id], days)[question_id]
+    return jsonify({
+        "question_id": question_id,
+        "days": days,
+        **sketch.summary(histogram=True),
+    }), 200
 
-    total_sessions = len(sessions)
-    completed = [s for s in sessions if s.is_completed and s.start_time and s.end_time]
-    completed_sessions = len(completed)
 
-    durations = [(s.end_time - s.start_time).total_seconds() for s in completed]
-    avg_completion_time_s = round(sum(durations) / len(durations), 2) if durations else None
+@analytics_api.route('/cohorts', methods=['GET'])
+def gasgame_cohort_analytics():
+    """Retention and completion by first-seen cohort (?bucket=day|week&periods=N&from=&to=)."""
+    bucket = request.args.get('bucket', default='week', type=str)
+    if bucket not in BUCKETS:
+        return jsonify({"error": f"bucket must be one of {', '.join(BUCKETS)}"}), 400
+    periods = max(1, min(request.args.get('periods', default=12, type=int), 366))
+
+    try:
+        start = datetime.strptime(request.args['from'], '%Y-%m-%d').date() if request.args.get('from') else None
+        end = datetime.strptime(request.args['to'], '%Y-%m-%d').date() if request.args.get('to') else None
+    except ValueError:
+        return jsonify({"error": "from/to must be YYYY-MM-DD"}), 400
+    if start and end and start > end:
+        return jsonify({"error": "from must not be after to"}), 400
+
+    return jsonify(cohort_report(bucket, start, end, periods)), 200
 
-    retry_sessions = sum(1 for s in sessions if (s.attempts_count or 0) > 0)
+
+# School years /calendar answers either side of the current one
+CALENDAR_YEAR_SPAN = 10
+
+
+@analytics_api.route('/calendar', methods=['GET'])
+def academic_calendar_terms():
+    """The current term and every term of a school year (?year=, default the current one)."""
+    current = academic_calendar.term_for()
+    year = request.args.get('year', default=current.school_year, type=int)
+    if abs(year - current.school_year) > CALENDAR_YEAR_SPAN:
+        return jsonify({"error": f"year must be within {CALENDAR_YEAR_SPAN} years of {current.school_year}"}), 400
+    return jsonify({
+        "current": current.read(),
+        "school_year": year,
+        "terms": [term.read() for term in academic_calendar.terms(year)],
+    }), 200
+
+
+@analytics_api.route('/sessions', methods=['GET'])
+def gasgame_session_analytics():
+    """Phase 4: Session analytics (completion time, retry rates), read from the session_day_stats rollup."""
+    days = request.args.get('days', default=None, type=int)
+
+    query = db.session.query(
+        func.coalesce(func.sum(SessionDayStat.session_count), 0),
+        func.coalesce(func.sum(SessionDayStat.completed_count), 0),
+        func.coalesce(func.sum(SessionDayStat.duration_sum_s), 0),
+        func.coalesce(func.sum(SessionDayStat.attempts_sum), 0),
+        func.coalesce(func.sum(SessionDayStat.retry_count), 0),
+    )
+    if days:
+        query = query.filter(SessionDayStat.day > datetime.utcnow().date() - timedelta(days=days))
+    total_sessions, completed_sessions, duration_sum_s, attempts_sum, retry_sessions = query.one()
 
     return jsonify({
         "summary": {
-            "total_sessions": total_sessions,
-            "completed_sessions": completed_sessions,
+            "days": days,
+            "total_sessions": int(total_sessions),
+            "completed_sessions": int(completed_sessions),
             "completion_rate": round(completed_sessions / total_sessions, 4) if total_sessions else 0,
-            "avg_completion_time_s": avg_completion_time_s,
-            "avg_attempts": round(sum((s.attempts_count or 0) for s in sessions) / total_sessions, 2) if total_sessions else 0,
+            "avg_completion_time_s": round(duration_sum_s / completed_sessions, 2) if completed_sessions else None,
+            "avg_attempts": round(attempts_sum / total_sessions, 2) if total_sessions else 0,
             "retry_rate": round(retry_sessions / total_sessions, 4) if total_sessions else 0,
         }
     }), 200
@@ -260,8 +312,9 @@ class UserCommits(Resource):
             
             start_date, end_date = get_date_range(body)
 
-            github_user_resource = GitHubUser()
-            response = github_user_resource.get_commit_stats(current_user.uid, start_date, end_date)
+            # Served from the local warehouse once the user has been ingested
+            response = github_warehouse.get_commit_stats(current_user.uid, start_date, end_date) \
+                or GitHubUser().get_commit_stats(current_user.uid, start_date, end_date)
             
             if response[1] != 200:
                 return response
@@ -281,8 +334,9 @@ class UserPrs(Resource):
             
             start_date, end_date = get_date_range(body)
 
-            github_user_resource = GitHubUser()
-            response = github_user_resource.get_pr_stats(current_user.uid, start_date, end_date)
+            # Served from the local warehouse once the user has been ingested
+            response = github_warehouse.get_pr_stats(current_user.uid, start_date, end_date) \
+                or GitHubUser().get_pr_stats(current_user.uid, start_date, end_date)
             
             if response[1] != 200:
                 return response
@@ -303,8 +357,9 @@ class UserIssues(Resource):
             
             start_date, end_date = get_date_range(body)
 
-            github_user_resource = GitHubUser()
-            response = github_user_resource.get_issue_stats(current_user.uid, start_date, end_date)
+            # Served from the local warehouse once the user has been ingested
+            response = github_warehouse.get_issue_stats(current_user.uid, start_date, end_date) \
+                or GitHubUser().get_issue_stats(current_user.uid, start_date, end_date)
             
             if response[1] != 200:
                 return response
@@ -346,8 +401,9 @@ class UserReceivedIssueComments(Resource):
             
             start_date, end_date = get_date_range(body)
 
-            github_user_resource = GitHubUser()
-            response = github_user_resource.get_total_received_issue_comments(current_user.uid, start_date, end_date)
+            # Served from the local warehouse once the user has been ingested
+            response = github_warehouse.get_total_received_issue_comments(current_user.uid, start_date, end_date) \
+                or GitHubUser().get_total_received_issue_comments(current_user.uid, start_date, end_date)
             
             if response[1] != 200:
                 return response
@@ -446,13 +502,11 @@ class AdminUserCommits(Resource):
             if not user:
                 return {'message': 'User not found'}, 404
 
-            github_user_resource = GitHubUser()
-            
             # Retrieve the commit statistics for the given user, filtered by the date range
-            response = github_user_resource.get_commit_stats(user.uid, start_date, end_date)
-            
-            if response is None or len(response) < 2:
-                return {'message': 'Error fetching commits for this user'}, 500
+            response = self.retry_request(user.uid, start_date, end_date)
+
+            if response[1] != 200:
+                return response
 
             return jsonify({
                 'uid': user.uid,
@@ -462,38 +516,106 @@ class AdminUserCommits(Resource):
         except Exception as e:
             return {'message': str(e)}, 500
 
-    def check_rate_limit(self, response):
-        """Check if the rate limit is exceeded based on response headers"""
-        remaining = int(response.headers.get('X-RateLimit-Remaining', 0))
-        reset_time = int(response.headers.get('X-RateLimit-Reset', time.time()))
-        if remaining == 0:
-            # If no requests remaining, calculate the time to wait
-            wait_time = reset_time - time.time()
-            print(f"Rate limit exceeded. Waiting for {wait_time} seconds.")
-            time.sleep(wait_time + 5)  # Adding a buffer time to avoid immediate retry
-            return True
-        return False
-
     def retry_request(self, user_uid, start_date, end_date, retries=3):
-        """Retry the request in case of rate limiting or server error"""
-        attempt = 0
-        while attempt < retries:
+        """
+        Retry get_commit_stats on transient GitHub server errors.
+
+        Rate limiting is not retried here: the GitHub client answers 429
+        with a retry_after hint and the caller decides when to come back.
+        """
+        github_user_resource = GitHubUser()
+        for attempt in range(retries):
+            data, status = github_user_resource.get_commit_stats(user_uid, start_date, end_date)
+            if status < 500:
+                return data, status
+            print(f"Attempt {attempt + 1}: GitHub server error {status}, retrying...")
+        return data, status
+
+
+class AdminBatchAnalytics(Resource):
+    @token_required()
+    def get(self):
+        """
+        GitHub stats for a whole section or classroom in one call.
+
+        Query params: `section` (abbreviation) or `classroom` (id), and an
+        optional comma separated `stats` subset of commits,prs,issues.
+        """
+        try:
+            if g.current_user.role != 'Admin':
+                return {'message': 'Access denied: Admins only.'}, 403
+
             try:
-                github_user_resource = GitHubUser()
-                response = github_user_resource.get_commit_stats(user_uid, start_date, end_date)
-
-                if response.status_code == 500:
-                    print(f"Attempt {attempt + 1}: Server error, retrying...")
-                    time.sleep(5 * (2 ** attempt))  # Exponential backoff
-                elif response.status_code == 403:
-                    if self.check_rate_limit(response):
-                        return self.retry_request(user_uid, start_date, end_date)
-                else:
-                    return response.json()  # Successfully processed the request
+                body = request.get_json()
             except Exception as e:
-                print(f"Error occurred: {e}")
-            attempt += 1
-        return None  # If retries are exhausted
+                body = {}
+            start_date, end_date = get_date_range(body or {})
+
+            section = request.args.get('section')
+            classroom = request.args.get('classroom', type=int)
+            if section:
+                query = db.session.query(User._uid, User._name) \
+                    .join(UserSection, UserSection.user_id == User.id) \
+                    .join(Section, Section.id == UserSection.section_id) \
+                    .filter(Section._abbreviation == section)
+            elif classroom is not None:
+                query = db.session.query(User._uid, User._name) \
+                    .join(classroom_student, classroom_student.c.student_id == User.id) \
+                    .filter(classroom_student.c.classroom_id == classroom)
+            else:
+                return {'message': 'section or classroom is required'}, 400
+            members = query.order_by(User._uid).all()
+            if not members:
+                return {'message': 'No users found for this group'}, 404
+
+            kinds = request.args.get('stats')
+            kinds = tuple(k for k in kinds.split(',') if k in GitHubUser.BATCH_KINDS) if kinds else GitHubUser.BATCH_KINDS
+            # Term-aligned ranges are answered from fresh warehouse term totals where present
+            stored = github_warehouse.get_term_totals([uid for uid, _ in members], start_date, end_date)
+            live = iter(GitHubUser().get_batch_stats([uid for uid, _ in members if uid not in stored], start_date, end_date, kinds))
+            rows = [self._stored_row(stored[uid], kinds) if uid in stored else next(live) for uid, _ in members]
+            names = dict(members)
+            for row in rows:
+                row['name'] = names[row['uid']]
+
+            totals = {key: sum(row.get(key, 0) for row in rows)
+                      for key in ('commits', 'lines_added', 'lines_deleted', 'prs', 'issues') if any(key in row for row in rows)}
+            return jsonify({
+                'section': section,
+                'classroom': classroom,
+                'start_date': start_date,
+                'end_date': end_date,
+                'users': rows,
+                'totals': totals
+            })
+        except Exception as e:
+            return {'message': str(e)}, 500
+
+    @staticmethod
+    def _stored_row(totals, kinds):
+        row = {'uid': totals['uid'], 'errors': {}}
+        if 'commits' in kinds:
+            row.update({key: totals[key] for key in ('commits', 'lines_added', 'lines_deleted')})
+        for kind in ('prs', 'issues'):
+            if kind in kinds:
+                row[kind] = totals[kind]
+        return row
+
+
+class GitHubCacheAPI(Resource):
+    @token_required()
+    def get(self):
+        if g.current_user.role != 'Admin':
+            return {'message': 'Access denied: Admins only.'}, 403
+        return jsonify({**github_cache.stats(), 'rate_limit': github_client.limiter.stats()})
+
+    @token_required()
+    def delete(self):
+        if g.current_user.role != 'Admin':
+            return {'message': 'Access denied: Admins only.'}, 403
+        uid = request.args.get('uid')
+        github_cache.invalidate(uid)
+        return {'message': f"GitHub cache cleared for {uid or 'all users'}"}, 200
 
 
 api.add_resource(GitHubUserAPI, '/github/user')
@@ -506,4 +628,6 @@ api.add_resource(UserReceivedIssueComments, '/github/user/received_issue_comment
 api.add_resource(GitHubOrgUsers, '/github/org/<string:org_name>/users')
 api.add_resource(GitHubOrgRepos, '/github/org/<string:org_name>/repos')
 api.add_resource(AdminUserCommits, '/commits/<string:uid>')  # Admin endpoint for commits
-api.add_resource(AdminUserIssues, '/issues/<string:uid>')  # Admin endpoint for issues
\ No newline at end of file
+api.add_resource(AdminUserIssues, '/issues/<string:uid>')  # Admin endpoint for issues
+api.add_resource(AdminBatchAnalytics, '/github/batch')  # Admin endpoint for a section or classroom
+api.add_resource(GitHubCacheAPI, '/github/cache')  # Admin endpoint for the GitHub response cache
\ No newline at end of file
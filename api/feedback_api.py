@@ -1,5 +1,5 @@
 import os
-import requests
+from model.http_client import http_client
 from flask import Blueprint, request, jsonify, session 
 from flask_restful import Api, Resource
 from model.feedback import Feedback
@@ -44,7 +44,7 @@ class FeedbackAPI:
             }
 
             try:
-                response = requests.post(
+                response = http_client.post(
                     f"https://api.github.com/repos/Open-Coding-Society/pages/issues",
                     headers=headers,
                     json=payload
@@ -84,7 +84,7 @@ class FeedbackAPI:
                         issue_number = parts[-1]
 
                         # Call GitHub API to get issue status
-                        response = requests.get(
+                        response = http_client.get(
                             f"https://api.github.com/repos/{GITHUB_REPO}/issues/{issue_number}",
                             headers=headers
                         )
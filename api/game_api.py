@@ -9,6 +9,7 @@ from __init__ import db
 from model.npc import Npc
 from model.game_session import GameSession
 from model.player_interaction import PlayerInteraction
+from model.gasgame_stats import record_session_start
 
 
 game_api = Blueprint('game_api', __name__, url_prefix='/api/game')
@@ -55,6 +56,8 @@ def start_game():
 
     try:
         db.session.add(session)
+        db.session.flush()  # applies the start_time default
+        record_session_start(session)
         db.session.commit()
     except Exception:
         db.session.rollback()
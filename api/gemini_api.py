@@ -20,6 +20,7 @@ from __init__ import app
 from flask import Blueprint, request, jsonify, current_app, g
 from flask_restful import Api, Resource
 import requests
+from model.http_client import http_client
 from api.jwt_authorize import token_required
 
 gemini_api = Blueprint('gemini_api', __name__, url_prefix='/api')
@@ -91,7 +92,7 @@ class GeminiAPI:
                 current_app.logger.debug(f"Payload: {payload}")
                 
                 # Make request to Gemini API
-                response = requests.post(
+                response = http_client.post(
                     endpoint,
                     headers={'Content-Type': 'application/json'},
                     json=payload,
@@ -191,7 +192,7 @@ class GeminiAPI:
                         }]
                     }
                     
-                    response = requests.post(
+                    response = http_client.post(
                         test_endpoint,
                         headers={'Content-Type': 'application/json'},
                         json=test_payload,
@@ -259,7 +260,7 @@ class GeminiAPI:
             }
             
             try:
-                response = requests.post(
+                response = http_client.post(
                     endpoint,
                     headers={'Content-Type': 'application/json'},
                     json=test_payload,
@@ -1,6 +1,6 @@
 from flask import Blueprint, request, jsonify, current_app
 from flask_restful import Api, Resource
-import requests
+from model.http_client import http_client
 
 groq_api = Blueprint('groq_api', __name__, url_prefix='/api')
 api = Api(groq_api)
@@ -20,7 +20,7 @@ class GroqAPI:
                 return {'message': 'API key not configured'}, 500
 
             try:
-                response = requests.post(
+                response = http_client.post(
                     "https://api.groq.com/openai/v1/chat/completions",
                     headers={
                         'Authorization': f'Bearer {api_key}',
@@ -1,9 +1,12 @@
+import os
 from datetime import datetime
 
 from flask import Blueprint, jsonify
 from sqlalchemy import text
 
 from __init__ import db
+from model.http_client import http_client
+from model.microblog_stream import microblog_broker
 
 
 health_api = Blueprint('health_api', __name__, url_prefix='/api')
@@ -31,3 +34,15 @@ def health():
         payload['db_error'] = db_error
 
     return jsonify(payload), (200 if db_ok else 503)
+
+
+@health_api.route('/health/http', methods=['GET'])
+def health_http():
+    """Per-host latency and error metrics for outbound HTTP calls made by this worker."""
+    return jsonify({'pid': os.getpid(), 'hosts': http_client.stats()}), 200
+
+
+@health_api.route('/health/stream', methods=['GET'])
+def health_stream():
+    """Live microblog streams open on this worker."""
+    return jsonify({'pid': os.getpid(), **microblog_broker.stats()}), 200
@@ -2,10 +2,11 @@
 MicroBlog API
 Handles CRUD operations for micro blog posts, replies, reactions, and topics
 """
-from flask import Blueprint, request, jsonify, g
+from flask import Blueprint, request, jsonify, g, Response, stream_with_context
 from flask_restful import Api, Resource
 from api.jwt_authorize import token_required
 from model.microblog import MicroBlog, Topic
+from model.microblog_stream import stream_events, microblog_broker, BUSY_RETRY_AFTER
 from __init__ import db
 
 
@@ -81,30 +82,35 @@ class MicroBlogAPI:
            """Get micro blog posts with optional filtering"""
            # Query parameters
            limit = request.args.get('limit', 200, type=int)
+           cursor = request.args.get('cursor')
            topic_id = request.args.get('topicId', type=int)
            page_path = request.args.get('pagePath')
            user_id = request.args.get('userId', type=int)
            search = request.args.get('search')
           
            try:
+               next_cursor = None
                if search:
                    microblogs = MicroBlog.search_content(search, limit)
                elif topic_id:
-                   microblogs = MicroBlog.get_by_topic(topic_id, limit)
+                   microblogs, next_cursor = MicroBlog.get_by_topic(topic_id, limit, cursor)
                elif page_path:
                    topic = Topic.get_by_page_path(page_path)
                    if topic:
-                       microblogs = MicroBlog.get_by_topic(topic.id, limit)
+                       microblogs, next_cursor = MicroBlog.get_by_topic(topic.id, limit, cursor)
                    else:
                        microblogs = []
                elif user_id:
-                   microblogs = MicroBlog.get_by_user(user_id, limit)
+                   microblogs, next_cursor = MicroBlog.get_by_user(user_id, limit, cursor)
                else:
-                   microblogs = MicroBlog.get_all(limit)
+                   microblogs, next_cursor = MicroBlog.get_all(limit, cursor)
                return jsonify({
                    'microblogs': microblogs,
-                   'count': len(microblogs)
+                   'count': len(microblogs),
+                   'next_cursor': next_cursor
                })
+           except ValueError as e:
+               return {'message': str(e)}, 400
            except Exception as e:
                return {'message': f'Error retrieving micro blog posts: {str(e)}'}, 500
       
@@ -256,6 +262,10 @@ class MicroBlogAPI:
                return {'message': 'Reaction type is required'}, 400
 
 
+           if len(reaction_type) > 32:
+               return {'message': 'Reaction type must be 32 characters or less'}, 400
+
+
            # --- Validate user authentication ---
            user_id = getattr(current_user, 'id', None)
            if not user_id:
@@ -273,11 +283,6 @@ class MicroBlogAPI:
                microblog.add_reaction(user_id, reaction_type)
 
 
-               # Refresh the record to make sure we return updated data
-               from __init__ import db
-               db.session.refresh(microblog)
-
-
                return jsonify({
                    'message': 'Reaction added successfully',
                    'microblog': microblog.read()
@@ -474,6 +479,7 @@ class TopicAPI:
           
            # Query parameters
            limit = request.args.get('limit', 20, type=int)
+           cursor = request.args.get('cursor')
           
            try:
                # Get topic by page key
@@ -490,7 +496,7 @@ class TopicAPI:
               
                # Get recent posts for this topic
                user_id = current_user.id if current_user else None
-               posts = topic.get_recent_posts(limit=limit, user_id=user_id)
+               posts, next_cursor = topic.get_recent_posts(limit=limit, user_id=user_id, cursor=cursor)
               
                # Check if user can post more messages
                can_post = False
@@ -501,14 +507,63 @@ class TopicAPI:
                    'topic': topic.read(),
                    'microblogs': posts,
                    'count': len(posts),
+                   'next_cursor': next_cursor,
                    'canPost': can_post,
                    'userPostCount': topic.get_user_post_count(user_id) if user_id else 0
                })
               
+           except ValueError as e:
+               return {'message': str(e)}, 400
            except Exception as e:
                return {'message': f'Error retrieving page microblogs: {str(e)}'}, 500
 
 
+   class _PageStream(Resource):
+       """Live updates for a page's microblogs as server-sent events"""
+      
+       def get(self, page_key):
+           """
+           Stream new posts, replies and reaction deltas for a page (same access rules as _PageMicroblogs).
+           Events: post, reply, reaction; resume with the Last-Event-ID header or ?lastEventId=
+           """
+           current_user = None
+           try:
+               from api.jwt_authorize import get_current_user
+               current_user = get_current_user()
+           except:
+               pass  # No auth provided, continue as anonymous
+          
+           topic = Topic.get_by_page_key(page_key)
+           if not topic:
+               return {'message': 'Page topic not found'}, 404
+           if not topic._is_active:
+               return {'message': 'This discussion is currently disabled'}, 403
+           if not topic._allow_anonymous and not current_user:
+               return {'message': 'Authentication required to view this discussion'}, 401
+          
+           last_event_id = request.headers.get('Last-Event-ID') or request.args.get('lastEventId')
+           try:
+               last_event_id = int(last_event_id) if last_event_id else None
+           except ValueError:
+               return {'message': 'Last-Event-ID must be an integer'}, 400
+          
+           # Over capacity: a non-200 ends the EventSource, so the page falls back to polling
+           subscription = microblog_broker.subscribe(page_key)
+           if subscription is None:
+               return {'message': 'Live updates are busy; poll instead'}, 503, {'Retry-After': str(BUSY_RETRY_AFTER)}
+          
+           # The stream never touches the database; release the connection before it starts
+           db.session.remove()
+           response = Response(
+               stream_with_context(stream_events(subscription, last_event_id)),
+               mimetype='text/event-stream',
+               headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+           )
+           # Covers clients that disconnect before the stream's first read
+           response.call_on_close(lambda: microblog_broker.unsubscribe(subscription))
+           return response
+
+
    class _AutoCreate(Resource):
        """Auto-create topic for a page if it doesn't exist"""
       
@@ -517,6 +572,7 @@ class TopicAPI:
            """Auto-create or get topic for a page"""
            # Query parameters
            limit = request.args.get('limit', 50, type=int)
+           cursor = request.args.get('cursor')
            topic_id = request.args.get('topicId', type=int)
            user_id = request.args.get('userId', type=int)
            search = request.args.get('search')
@@ -524,28 +580,32 @@ class TopicAPI:
 
 
            try:
+               next_cursor = None
                if search:
                    microblogs = MicroBlog.search_content(search, limit)
                elif topic_id:
-                   microblogs = MicroBlog.get_by_topic(topic_id, limit)
+                   microblogs, next_cursor = MicroBlog.get_by_topic(topic_id, limit, cursor)
                elif page_path:
                    topic = Topic.get_by_page_path(page_path)
                    if topic:
-                       microblogs = MicroBlog.get_by_topic(topic.id, limit)
+                       microblogs, next_cursor = MicroBlog.get_by_topic(topic.id, limit, cursor)
                    else:
-                       return jsonify({'microblogs': [], 'count': 0, 'message': 'No topic found for this pagePath'}), 200
+                       return jsonify({'microblogs': [], 'count': 0, 'next_cursor': None, 'message': 'No topic found for this pagePath'}), 200
                elif user_id:
-                   microblogs = MicroBlog.get_by_user(user_id, limit)
+                   microblogs, next_cursor = MicroBlog.get_by_user(user_id, limit, cursor)
                else:
-                   microblogs = MicroBlog.get_all(limit)
+                   microblogs, next_cursor = MicroBlog.get_all(limit, cursor)
 
 
                return jsonify({
                    'microblogs': microblogs,
-                   'count': len(microblogs)
+                   'count': len(microblogs),
+                   'next_cursor': next_cursor
                })
 
 
+           except ValueError as e:
+               return {'message': str(e)}, 400
            except Exception as e:
                return {'message': f'Error retrieving micro blog posts: {str(e)}'}, 500
 
@@ -561,5 +621,6 @@ api.add_resource(MicroBlogAPI._Reaction, '/microblog/reaction', endpoint='microb
 # Topic endpoints
 api.add_resource(TopicAPI._CRUD, '/microblog/topics', endpoint='microblog_topic_crud')
 api.add_resource(TopicAPI._PageMicroblogs, '/microblog/page/<string:page_key>', endpoint='microblog_page_posts')
+api.add_resource(TopicAPI._PageStream, '/microblog/page/<string:page_key>/stream', endpoint='microblog_page_stream')
 api.add_resource(TopicAPI._AutoCreate, '/microblog/topics/auto-create', endpoint='microblog_topic_autocreate')
 
@@ -6,6 +6,7 @@ from model.npc import Npc
 from model.game_session import GameSession
 from model.question import Question
 from model.player_interaction import PlayerInteraction
+from model.gasgame_stats import record_interaction
 
 
 npc_api = Blueprint('npc_api', __name__, url_prefix='/api/npc')
@@ -100,6 +101,7 @@ def interact():
     )
     try:
         db.session.add(interaction)
+        record_interaction(interaction)
         db.session.commit()
     except Exception:
         db.session.rollback()
@@ -7,6 +7,7 @@ from flask_restful import Api, Resource
 from __init__ import db
 from model.post import Post
 from model.user import User
+from model.pagination import DEFAULT_PAGE_SIZE
 from api.jwt_authorize import token_required
 
 
@@ -15,6 +16,11 @@ post_api = Blueprint('post_api', __name__, url_prefix='/api/post')
 api = Api(post_api)
 
 
+def _cursor_headers(next_cursor):
+    """List endpoints keep returning a bare array; the next page's cursor travels in a header"""
+    return {'X-Next-Cursor': next_cursor} if next_cursor else {}
+
+
 class PostAPI(Resource):
     """
     POST API - Create a new post
@@ -75,13 +81,16 @@ class PostListAPI(Resource):
     """
     def get(self):
         """
-        Get all top-level posts with their replies
+        Get a page of top-level posts with their replies
         Returns posts in reverse chronological order
+        Query parameters: ?limit=N&cursor=... (the X-Next-Cursor header of the previous page)
         Public endpoint - anyone can view posts
         """
         try:
-            posts = Post.get_all()
-            return posts, 200
+            posts, next_cursor = Post.get_all(request.args.get('cursor'), request.args.get('limit', DEFAULT_PAGE_SIZE, type=int))
+            return posts, 200, _cursor_headers(next_cursor)
+        except ValueError as e:
+            return {'message': str(e)}, 400
         except Exception as e:
             return {'message': f'Error fetching posts: {str(e)}'}, 500
 
@@ -93,16 +102,19 @@ class PostPageAPI(Resource):
     """
     def get(self):
         """
-        Get all posts for a specific page
-        Query parameter: ?url=/lesson/url
+        Get a page of posts for a specific page
+        Query parameters: ?url=/lesson/url&limit=N&cursor=...
         """
         try:
             page_url = request.args.get('url')
             if not page_url:
                 return {'message': 'Page URL is required'}, 400
             
-            posts = Post.get_by_page(page_url)
-            return posts, 200
+            posts, next_cursor = Post.get_by_page(page_url, request.args.get('cursor'),
+                                                  request.args.get('limit', DEFAULT_PAGE_SIZE, type=int))
+            return posts, 200, _cursor_headers(next_cursor)
+        except ValueError as e:
+            return {'message': str(e)}, 400
         except Exception as e:
             return {'message': f'Error fetching posts: {str(e)}'}, 500
 
@@ -259,8 +271,11 @@ class PostUserAPI(Resource):
             if not user:
                 return {'message': 'User not found'}, 404
             
-            posts = Post.get_by_user(user_id)
-            return posts, 200
+            posts, next_cursor = Post.get_by_user(user_id, request.args.get('cursor'),
+                                                  request.args.get('limit', DEFAULT_PAGE_SIZE, type=int))
+            return posts, 200, _cursor_headers(next_cursor)
+        except ValueError as e:
+            return {'message': str(e)}, 400
         except Exception as e:
             return {'message': f'Error fetching user posts: {str(e)}'}, 500
 
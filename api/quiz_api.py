@@ -6,6 +6,7 @@ from __init__ import db
 from model.game_session import GameSession
 from model.question import Question
 from model.player_interaction import PlayerInteraction
+from model.gasgame_stats import record_answer
 
 
 quiz_api = Blueprint('quiz_api', __name__, url_prefix='/api/quiz')
@@ -84,6 +85,10 @@ def answer():
     answered_gas_holder = interaction.npc_id == session.gas_holder_npc_id
     is_correct = bool(answer_matches and answered_gas_holder)
 
+    was_correct = interaction.is_correct
+    old_response_time_ms = interaction.response_time_ms
+    old_attempts = session.attempts_count
+
     try:
         interaction.user_answer = str(user_answer)
         interaction.is_correct = bool(is_correct)
@@ -95,6 +100,7 @@ def answer():
         else:
             session.attempts_count += 1
 
+        record_answer(session, interaction, was_correct, old_response_time_ms, old_attempts)
         db.session.commit()
     except Exception:
         db.session.rollback()
@@ -1,18 +1,32 @@
 import json, jwt
 from flask import Blueprint, request, jsonify, current_app, Response, g
 from flask_restful import Api, Resource # used for REST API building
-from datetime import datetime
-import requests
+from datetime import datetime, timezone
 from api.jwt_authorize import token_required
 from model.user import User
-from model.stocks import StockUser,StockTransaction,TableStock, UserTransactionStock
+from model.stocks import StockUser,StockTransaction,TableStock, UserTransactionStock, StockPosition
+from model.stock_engine import matching_engine, backdated_fill_time
+from model.stock_quotes import refresh_prices
+from model.stock_history import INTERVALS, DEFAULT_WINDOWS, get_bars
+from model.stock_leaderboard import leaderboard
 
 stock_api = Blueprint('stock_api', __name__,
                    url_prefix='/stock')
 
 # API docs https://flask-restful.readthedocs.io/en/latest/api.html
 api = Api(stock_api)
-""" For this code to work, first you would need to bulk update the stock table by using the data in the csv file: stocks_table_exp.csv. 
+
+
+def _naive_utc(value):
+    """Parse an ISO 8601 time; offsets are converted to the naive UTC times bars are stored in."""
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+""" For this code to work, first you would need to bulk update the stock table by using the data in the csv file: stocks_table_exp.csv
+(run: flask custom import_stocks stocks_table_exp.csv). 
 Then the first thing to run is _initilize_user to create a new user in the StockUser table. 
 A possible post request of postman:{"uid":"niko","quantity":10,"symbol": "AAPL"}.
 All db change are found in the model/user.py file"""
@@ -21,38 +35,28 @@ class StockAPI:
     # Supposed to be called when user first starts
     class _Singleupdata(Resource):
         def post(self):
-            #updates stock price:
-            body = request.get_json()
+            #updates stock price for one symbol through the batched refresh path
+            body = request.get_json(silent=True) or {}
             symbol = body.get("symbol")
-            isloop = False
-            api_key = 'xAxPbodLC12nNCwa5gHiK6YZVQecllPA'  # Replace with your FMP API key
-            url = f'https://financialmodelingprep.com/api/v3/quote/{symbol}?apikey={api_key}'
-            stocks = TableStock.updatestockprice(self,body,isloop)
-            response = requests.get(url)
-            for stock in stocks:
-                if stock.symbol == symbol:
-                    
-                    if response.status_code == 200:
-                        data = response.json()
-                        
-                        if data:  # Check if the list is not empty
-                            latest_price = data[0].get('price')
-                            # Use .get() to avoid KeyError
-                            if latest_price is not None:
-                                print("this is stock:" + str(stock))
-                                isloop = True
-                                price = TableStock.updatestockprice(self,body,isloop,latest_price,stock)
-                                print(f"Updated price for {symbol} to {latest_price}")
-                            else:
-                                print(f"Price data not found for {symbol}")
-                        else:
-                            print(f"Empty data for {symbol}")
-                    else:
-                        print(f"Failed to fetch data for {symbol}. Status code: {response.status_code}")
-                    print("this is new price" +  str(price))
-                    data = jsonify(str(price))
-                    print("this is data" + str(data))
-            return data         
+            if not isinstance(symbol, str) or not symbol.strip():
+                return {'error': 'symbol is required'}, 400
+            # Quotes and table_stocks are keyed by the uppercase ticker
+            symbol = symbol.strip().upper()
+            result = refresh_prices([symbol])
+            if result['failed']:
+                return {'error': f'Failed to fetch data for {symbol}'}, 502
+            price = result['prices'].get(symbol)
+            if not result['updated'] or price is None:
+                return {'error': f'Price data not found for {symbol}'}, 404
+            print(f"Updated price for {symbol} to {price}")
+            return jsonify(str(price))
+    class _Bulkupdate(Resource):
+        @token_required("Admin")
+        def post(self):
+            """Refreshes prices for every symbol in table_stocks (admins only; 'flask custom refresh_stock_prices' is the scheduled job)"""
+            result = refresh_prices()
+            del result['prices']
+            return jsonify(result)
     class _initilize_user(Resource):
         @token_required()
         def get(self):
@@ -83,55 +87,92 @@ class StockAPI:
     # contains no logic for project yet
     class _initial_stockbuy(Resource):
         def post(self):
+            # seeds a holding dated one year back, matched through the engine
             body = request.get_json()
-            body = request.get_json()
-            userbal = StockUser.get_balance(self,body)
-            stockval = TableStock.get_price(self,body)
-            quantity = body.get("quantity")
-            isbuy = True
-            transactionval = quantity * stockval
-            if userbal >= transactionval:
-                # update user bal
-                StockUser.updatebal(self,body,transactionval)
-                # create stocktransacotin log
-                u=StockTransaction.createlog_initialbuy(self,body)
-                UserTransactionStock.multilog_buy_initial(self,body = body,value = transactionval,transactionid=u)
-                # update stock quantity
-                TableStock.updatequantity(self,body,isbuy)
-                return jsonify("Transaction successful")
-            else:
-                return jsonify({'error': 'Insufficient funds'}), 400
+            result, status = matching_engine.execute(body.get("uid"), body.get("symbol"), body.get("quantity"), filled_at=backdated_fill_time())
+            if status != 200:
+                return result, status
+            return jsonify("Transaction successful")
             
             
     class _tranaction_buy(Resource):
         def post(self):
             body = request.get_json()
-            userbal = StockUser.get_balance(self,body)
-            stockval = TableStock.get_price(self,body)
-            quantity = body.get("quantity")
-            isbuy = True
-            transactionval = quantity * stockval
-            if userbal >= transactionval:
-                # update user bal
-                StockUser.updatebal(self,body,transactionval)
-                # create stocktransacotin log
-                u=StockTransaction.createlog_buy(self,body)
-                UserTransactionStock.multilog_buy(self,body = body,value = transactionval,transactionid=u)
-                # update stock quantity
-                TableStock.updatequantity(self,body,isbuy)
-                return jsonify("Transaction successful")
-            else:
-                return jsonify({'error': 'Insufficient funds'}), 400
+            result, status = matching_engine.execute(body.get("uid"), body.get("symbol"), body.get("quantity"))
+            if status != 200:
+                return result, status
+            return jsonify("Transaction successful")
     class _transaction_sell(Resource):
         def post(self):
             body = request.get_json()
-            quantity = body.get("quantity")
-            symbol = body.get("symbol")
-            avaliable_quantity = UserTransactionStock.check_stock_quantity(self,body)
-            if avaliable_quantity >= quantity :
-                UserTransactionStock.check_tax(self,body)
-            else:
-                return jsonify({'error':'No stock to sell'}), 400
+            # method picks which tax lots are sold: fifo (default), lifo or hifo
+            result, status = matching_engine.execute(body.get("uid"), body.get("symbol"), body.get("quantity"), side='sell', lot_method=body.get("method", "fifo"))
+            if status != 200:
+                return result, status
+            return jsonify("Transaction successful")
+    class _Portfolio(Resource):
+        def post(self):
+            """Open positions for a stock user, read from the stock_positions table"""
+            body = request.get_json()
+            userid = StockUser.get_userid(self, body.get("uid"))
+            if userid is None:
+                return {'error': "Can't find user in StockUser table. Possible fix: Run /initilize first to log user in StockUser table"}, 404
+            positions = [position.read() for position in StockPosition.get_by_user(userid)]
+            return jsonify({
+                "uid": body.get("uid"),
+                "positions": positions,
+                "market_value": sum(p["market_value"] or 0 for p in positions),
+            })
+    class _History(Resource):
+        def get(self, symbol):
+            """OHLC bars for a symbol, e.g. /stock/history/AAPL?interval=1h&from=2025-01-01&to=2025-01-08"""
+            interval = request.args.get('interval', '1h')
+            if interval not in INTERVALS:
+                return {'error': f"interval must be one of {', '.join(INTERVALS)}"}, 400
+            try:
+                end = _naive_utc(request.args['to']) if request.args.get('to') else datetime.utcnow()
+                start = _naive_utc(request.args['from']) if request.args.get('from') else end - DEFAULT_WINDOWS[interval]
+            except ValueError:
+                return {'error': 'from/to must be ISO 8601 dates'}, 400
+            stockid = TableStock.get_stockid(self, symbol)
+            if stockid is None:
+                return {'error': 'No such stock exists'}, 404
+            bars = get_bars(stockid, interval, start, end)
+            return jsonify({
+                "symbol": symbol,
+                "interval": interval,
+                "from": start.isoformat(),
+                "to": end.isoformat(),
+                "bars": bars,
+            })
+    class _Leaderboard(Resource):
+        def get(self):
+            """Top accounts by total value; pass ?uid= to include that user's rank"""
+            limit = max(1, min(request.args.get('limit', 10, type=int), 500))
+            uid = request.args.get('uid')
+            return jsonify({
+                "leaders": leaderboard.top(limit),
+                "user": leaderboard.rank_of(uid) if uid else None,
+                "total_users": leaderboard.size(),
+            })
+    class _OrderBook(Resource):
+        def get(self, symbol):
+            """Best bid/ask and available quantity held by the matching engine"""
+            book = matching_engine.get_book(symbol)
+            if book is None:
+                return {'error': 'No such stock exists'}, 404
+            return jsonify(book.read())
+    class _Tax(Resource):
+        def post(self):
+            """Open tax lots and realized short/long-term gains, optionally for one symbol"""
+            body = request.get_json()
+            if StockUser.get_userid(self, body.get("uid")) is None:
+                return {'error': "Can't find user in StockUser table. Possible fix: Run /initilize first to log user in StockUser table"}, 404
+            return jsonify(UserTransactionStock.check_tax(self, body))
+    class _CacheStats(Resource):
+        def get(self):
+            """Hit/miss counters for the symbol index and matching engine books"""
+            return jsonify(matching_engine.stats())
     class _Account_expirary(Resource):
         def post(self):
             body= request.get_json()
@@ -151,4 +192,11 @@ class StockAPI:
     api.add_resource(_Account_expirary, '/expire')
     api.add_resource(_initial_stockbuy, '/initialbuy')
     api.add_resource(_Singleupdata,'/singleupdate')
+    api.add_resource(_Bulkupdate, '/bulkupdate')
+    api.add_resource(_OrderBook, '/book/<string:symbol>')
+    api.add_resource(_Portfolio, '/portfolio')
+    api.add_resource(_History, '/history/<string:symbol>')
+    api.add_resource(_Leaderboard, '/leaderboard')
+    api.add_resource(_Tax, '/tax')
+    api.add_resource(_CacheStats, '/cache')
 
@@ -52,14 +52,24 @@ from api.study import study_api
 from api.feedback_api import feedback_api
 from model.study import Study, initStudies
 from model.classroom import Classroom
-from model.post import Post, init_posts
-from model.microblog import MicroBlog, Topic, init_microblogs
+from model.post import Post, init_posts, ensure_post_indexes
+from model.microblog import MicroBlog, Topic, init_microblogs, upgrade_microblog_schema, backfill_engagement
+from model.microblog_search import ensure_search_index
+from model.stocks import StockPosition, StockLot, upgrade_stock_schema
+from model.stock_quotes import refresh_prices
+from model.stock_history import compact_ticks
+from model.stock_import import import_stocks
+from model.stock_expiry import sweep_expired_accounts, start_expiry_sweeper
+from model.github_warehouse import ingest_all, start_github_ingester
+from model.http_client import http_client
+from model.gasgame_stats import rebuild_gasgame_stats
 from hacks.jokes import initJokes 
 # from model.announcement import Announcement ##temporary revert
 
 # server only Views
 
 import os
+import click
 import requests
 
 # Load environment variables
@@ -106,6 +116,18 @@ with app.app_context():
     initJokes()
     initCandyland()
     initGasGame()
+    upgrade_stock_schema()
+    upgrade_microblog_schema()
+    ensure_search_index()
+    ensure_post_indexes()
+
+# Background sweep of expired stock game accounts (one worker holds the lease)
+if app.config['STOCK_EXPIRY_SWEEP_INTERVAL'] > 0:
+    start_expiry_sweeper(app.config['STOCK_EXPIRY_SWEEP_INTERVAL'])
+
+# Background ingestion of GitHub activity into the analytics warehouse (one worker holds the lease)
+if app.config['GITHUB_INGEST_INTERVAL'] > 0:
+    start_github_ingester(app.config['GITHUB_INGEST_INTERVAL'])
 
 # Tell Flask-Login the view function name of your login route
 login_manager.login_view = "login"
@@ -226,7 +248,7 @@ def kasm_users():
         }
 
         # Perform the POST request
-        response = requests.post(url, json=data, timeout=10)  # Added timeout for reliability
+        response = http_client.post(url, json=data, timeout=10)  # Added timeout for reliability
 
         # Validate the API response
         if response.status_code != 200:
@@ -286,7 +308,7 @@ def delete_user_kasm(user_id):
             "target_user": {"user_id": user_id},
             "force": False
         }
-        response = requests.post(url, json=data)
+        response = http_client.post(url, json=data)
 
         if response.status_code == 200:
             return {'message': 'User deleted successfully'}, 200
@@ -333,6 +355,75 @@ def generate_data():
     initUsers()
     init_microblogs()
 
+# Define a command to replay the stock ledger into stock_positions
+@custom_cli.command('rebuild_positions')
+@click.option('--verify', is_flag=True, help='Only report mismatches, do not rewrite the table')
+def rebuild_positions(verify):
+    mismatches = StockPosition.rebuild(verify_only=verify)
+    for mismatch in mismatches:
+        print(f"Mismatch: {mismatch}")
+    print(f"{len(mismatches)} position(s) out of sync with the ledger" + ("" if verify else ", table rebuilt"))
+
+# Define a command to create tax lots for ledger history recorded before lots existed
+@custom_cli.command('backfill_lots')
+@click.option('--method', default='fifo', type=click.Choice(['fifo', 'lifo', 'hifo']), help='Lot order used to replay past sells')
+def backfill_lots(method):
+    created = StockLot.backfill(method)
+    print(f"Created {created} tax lot(s)")
+
+# Define a command to bulk load the stock universe into table_stocks
+@custom_cli.command('import_stocks')
+@click.argument('path', default='stocks_table_exp.csv')
+@click.option('--chunk-size', default=1000, show_default=True, help='Rows per batch')
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'parquet']), default=None, help='Defaults to the file extension')
+@click.option('--overwrite-quantity', is_flag=True, help='Also reset available shares of existing stocks from the file')
+def import_stocks_command(path, chunk_size, fmt, overwrite_quantity):
+    result = import_stocks(path, chunk_size, fmt, overwrite_quantity)
+    print(f"Inserted {result['inserted']}, updated {result['updated']} stocks in {result['seconds']}s ({result['rows_per_second']} rows/sec)")
+
+# Define a command to archive and reset expired stock game accounts
+@custom_cli.command('sweep_stock_accounts')
+@click.option('--batch-size', default=100, show_default=True, help='Accounts reset per commit')
+def sweep_stock_accounts(batch_size):
+    result = sweep_expired_accounts(batch_size)
+    print(f"Reset {result['reset']} expired stock account(s), backfilled expiry for {result['backfilled']}")
+
+# Define a command to refresh every stock price in batched quote requests
+@custom_cli.command('refresh_stock_prices')
+def refresh_stock_prices():
+    result = refresh_prices()
+    print(f"Updated {result['updated']} of {result['requested']} stocks in {result['seconds']}s")
+    if result['failed']:
+        print(f"Failed to fetch: {', '.join(result['failed'])}")
+
+# Define a command to pack finished days of price ticks into day rows
+@custom_cli.command('compact_price_history')
+def compact_price_history():
+    packed = compact_ticks()
+    print(f"Packed {packed} price tick(s) into day rows")
+
+# Define a command to pull new GitHub activity into the analytics warehouse
+@custom_cli.command('ingest_github')
+@click.option('--uid', 'uids', multiple=True, help='Only ingest these users (repeatable)')
+def ingest_github(uids):
+    result = ingest_all(list(uids) or None)
+    print(f"Ingested {result['added']} for {result['users']} user(s) in {result['seconds']}s")
+    for uid, errors in result['failed'].items():
+        print(f"  {uid}: GitHub returned {errors}")
+
+# Define a command to recompute the gas-game analytics rollups from raw sessions and interactions
+@custom_cli.command('rebuild_gasgame_stats')
+def rebuild_gasgame_stats_command():
+    result = rebuild_gasgame_stats()
+    print(f"Rebuilt stats for {result['questions']} question(s) and {result['days']} day(s), {result['sketches']} response-time sketch(es), {result['players']} player(s)")
+
+# Define a command to move microblog reactions/replies out of the _data JSON
+@custom_cli.command('backfill_microblog_engagement')
+@click.option('--batch-size', default=500, show_default=True, help='Posts per commit')
+def backfill_microblog_engagement(batch_size):
+    moved = backfill_engagement(batch_size)
+    print(f"Moved {moved['reactions']} reaction(s) and {moved['replies']} reply(ies) from {moved['posts']} post(s)")
+
 # Register the custom command group with the Flask application
 app.cli.add_command(custom_cli)
         
@@ -0,0 +1,159 @@
+"""
+Academic Calendar
+Precomputed trimester windows used to pick the default analytics date
+range and to key cached and warehoused GitHub data by term.
+
+Each school year (named for the calendar year it starts in) has three
+terms. A term has a data window (start..end, the dates queried) and an
+active window (the days on which it is the current term); the two differ
+because Trimester 2 reports from September although it only becomes
+current on November 15.
+
+The default rule can be overridden per school year with the
+ACADEMIC_CALENDAR setting, a JSON object such as
+    {"2025": [{"name": "T1", "start": "2025-06-01", "end": "2025-11-14",
+               "active_from": "2025-06-15"}, ...]}
+Lookups never raise: days outside every active window fall back to the
+closest preceding term.
+"""
+import json
+import os
+import threading
+from bisect import bisect_right
+from datetime import date, datetime
+
+from __init__ import app
+
+
+app.config.setdefault('ACADEMIC_CALENDAR', os.environ.get('ACADEMIC_CALENDAR') or '{}')
+
+
+class Term:
+    """One trimester: a data window plus the days on which it is current."""
+
+    def __init__(self, school_year, name, start, end, active_from):
+        self.school_year = school_year
+        self.name = name
+        self.start = start
+        self.end = end
+        self.active_from = active_from
+
+    @property
+    def key(self):
+        return f'{self.school_year}-{self.name}'
+
+    @property
+    def partition(self):
+        """Storage key: the term key plus its dates, so a calendar change never reuses old data."""
+        return f'{self.key}:{self.start.isoformat()}..{self.end.isoformat()}'
+
+    def range(self):
+        """(start_date, end_date) as the YYYY-MM-DD strings analytics expect."""
+        return self.start.isoformat(), self.end.isoformat()
+
+    def read(self):
+        return {
+            "key": self.key,
+            "school_year": self.school_year,
+            "name": self.name,
+            "start_date": self.start.isoformat(),
+            "end_date": self.end.isoformat(),
+            "active_from": self.active_from.isoformat(),
+        }
+
+
+def default_terms(year):
+    """The standing trimester rule for the school year starting in `year`."""
+    return [
+        Term(year, 'T1', date(year, 6, 1), date(year, 11, 14), date(year, 6, 15)),
+        # Trimester 2 is extended through March 31
+        Term(year, 'T2', date(year, 9, 1), date(year + 1, 3, 31), date(year, 11, 15)),
+        Term(year, 'T3', date(year + 1, 4, 1), date(year + 1, 6, 14), date(year + 1, 4, 1)),
+    ]
+
+
+class AcademicCalendar:
+    """
+    AcademicCalendar
+
+    Terms are built once per school year and kept in lists sorted by
+    active_from and by (start, end), so resolving a day or a range is a
+    bisect or dict lookup rather than a chain of date comparisons.
+    """
+
+    def __init__(self, overrides=None):
+        self._overrides = overrides or {}
+        self._years = set()
+        # (terms sorted by active_from, their active_from dates, {(start, end): term}),
+        # swapped as one tuple so readers never see a half-built index
+        self._index = ([], [], {})
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls):
+        try:
+            raw = json.loads(app.config['ACADEMIC_CALENDAR'] or '{}')
+            overrides = {
+                int(year): [
+                    Term(int(year), t['name'], date.fromisoformat(t['start']), date.fromisoformat(t['end']),
+                         date.fromisoformat(t.get('active_from') or t['start']))
+                    for t in terms
+                ]
+                for year, terms in raw.items()
+            }
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            print(f"Ignoring invalid ACADEMIC_CALENDAR setting: {e}")
+            overrides = {}
+        return cls(overrides)
+
+    def _ensure_years(self, *years):
+        missing = [year for year in years if year not in self._years]
+        if not missing:
+            return
+        with self._lock:
+            terms = list(self._index[0])
+            for year in missing:
+                if year not in self._years:
+                    terms.extend(self._overrides.get(year) or default_terms(year))
+            terms.sort(key=lambda term: term.active_from)
+            self._index = (terms, [term.active_from for term in terms], {(term.start, term.end): term for term in terms})
+            self._years.update(missing)
+
+    def term_for(self, day=None):
+        """The term current on `day` (default today)."""
+        day = day or date.today()
+        if isinstance(day, datetime):
+            day = day.date()
+        # Neighbouring school years can own days near the June boundary
+        self._ensure_years(day.year - 1, day.year, day.year + 1)
+        terms, active_from, _ = self._index
+        return terms[max(bisect_right(active_from, day) - 1, 0)]
+
+    def term_for_range(self, start_date, end_date):
+        """The term whose data window is exactly start..end, or None."""
+        try:
+            start, end = date.fromisoformat(str(start_date)), date.fromisoformat(str(end_date))
+        except ValueError:
+            return None
+        self._ensure_years(start.year - 1, start.year)
+        return self._index[2].get((start, end))
+
+    def partition_key(self, start_date, end_date):
+        """Canonical key for a date range: the term's partition when it is one, else start..end."""
+        term = self.term_for_range(start_date, end_date)
+        return term.partition if term else f'{start_date}..{end_date}'
+
+    def terms_overlapping(self, start, end):
+        """Every term whose data window intersects start..end (dates)."""
+        self._ensure_years(*range(start.year - 1, end.year + 1))
+        return [term for term in self._index[0] if term.start <= end and term.end >= start]
+
+    def terms(self, school_year):
+        self._ensure_years(school_year)
+        return [term for term in self._index[0] if term.school_year == school_year]
+
+
+# Shared calendar, built from ACADEMIC_CALENDAR at import with the
+# surrounding school years precomputed
+academic_calendar = AcademicCalendar.from_config()
+academic_calendar.term_for()
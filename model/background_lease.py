@@ -0,0 +1,62 @@
+"""
+Background Job Lease
+Every gunicorn worker imports main.py, so every worker would start its
+own copy of each background thread. A job takes a named lease in a
+SQLite file in the shared DATA_FOLDER before each cycle; only the holder
+runs, and it renews the lease every cycle. If the holding worker dies,
+another takes over once the lease lapses.
+"""
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+from __init__ import app
+
+
+app.config.setdefault('BACKGROUND_LEASE_PATH', os.path.join(app.config['DATA_FOLDER'], 'background_leases.db'))
+
+
+class BackgroundLease:
+    """Named single-runner leases shared by the workers on this host."""
+
+    def __init__(self, path):
+        self.path = path
+        self.holder = f'{socket.gethostname()}:{os.getpid()}'
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS background_leases ('
+                ' name TEXT PRIMARY KEY,'
+                ' holder TEXT NOT NULL,'
+                ' expires_at REAL NOT NULL)'
+            )
+            self._local.conn = conn
+        return conn
+
+    def acquire(self, name, ttl):
+        """
+        Take or renew the lease on name for ttl seconds.
+
+        Returns:
+            True when this process holds the lease and should run the job.
+        """
+        now = time.time()
+        conn = self._connect()
+        conn.execute('INSERT OR IGNORE INTO background_leases (name, holder, expires_at) VALUES (?, ?, 0)',
+                     (name, self.holder))
+        return conn.execute(
+            'UPDATE background_leases SET holder = ?, expires_at = ? WHERE name = ? AND (holder = ? OR expires_at < ?)',
+            (self.holder, now + ttl, name, self.holder, now)
+        ).rowcount == 1
+
+
+# Shared per-process lease client
+background_lease = BackgroundLease(app.config['BACKGROUND_LEASE_PATH'])
@@ -0,0 +1,171 @@
+from datetime import datetime, date, timedelta
+from itertools import chain
+
+import numpy as np
+from sqlalchemy import Integer, cast, func, insert, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from __init__ import db
+from model.game_session import GameSession
+
+
+BUCKETS = ('day', 'week')
+
+# Weeks start on Monday; 1970-01-01 was a Thursday
+_EPOCH = date(1970, 1, 1)
+_WEEK_OFFSET = 3
+
+
+class PlayerFirstSeen(db.Model):
+    """First game session start per player; defines the player's cohort."""
+    __tablename__ = 'player_first_seen'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    first_seen = db.Column(db.DateTime, nullable=False, index=True)
+
+    def __init__(self, user_id: int, first_seen: datetime):
+        self.user_id = user_id
+        self.first_seen = first_seen
+
+
+def record_first_seen(session: GameSession):
+    """Add the session's player to the index if this is their first session; the caller commits."""
+    if session.user_id is None:
+        return
+    values = {'user_id': session.user_id, 'first_seen': session.start_time or datetime.utcnow()}
+    if db.engine.dialect.name == 'sqlite':
+        stmt = sqlite_insert(PlayerFirstSeen).values(**values).on_conflict_do_nothing()
+    else:
+        stmt = insert(PlayerFirstSeen).values(**values).prefix_with('IGNORE')
+    db.session.execute(stmt)
+
+
+def rebuild_first_seen() -> int:
+    """Recompute player_first_seen from game_sessions; the caller commits."""
+    PlayerFirstSeen.query.delete()
+    rows = (
+        db.session.query(GameSession.user_id, func.min(GameSession.start_time))
+        .filter(GameSession.user_id.isnot(None))
+        .group_by(GameSession.user_id)
+        .all()
+    )
+    db.session.add_all([PlayerFirstSeen(user_id, first_seen) for user_id, first_seen in rows])
+    return len(rows)
+
+
+def _bucket_ids(days: np.ndarray, bucket: str) -> np.ndarray:
+    """Map day numbers (days since 1970-01-01) to day or Monday-week numbers."""
+    return days if bucket == 'day' else (days + _WEEK_OFFSET) // 7
+
+
+def _bucket_start(bucket_id: int, bucket: str) -> str:
+    days = bucket_id if bucket == 'day' else bucket_id * 7 - _WEEK_OFFSET
+    return (_EPOCH + timedelta(days=int(days))).isoformat()
+
+
+def _day_number(column):
+    """SQL expression for a DateTime column as days since 1970-01-01, so rows arrive as plain ints."""
+    if db.engine.dialect.name == 'sqlite':
+        return cast(func.julianday(column) - 2440587.5, Integer)
+    return func.to_days(column) - 719528
+
+
+def _int_rows(stmt, width: int) -> np.ndarray:
+    rows = db.session.execute(stmt).all()
+    return np.fromiter(chain.from_iterable(rows), dtype=np.int64, count=len(rows) * width).reshape(len(rows), width)
+
+
+def cohort_report(bucket: str = 'week', start: date | None = None, end: date | None = None, periods: int = 12) -> dict:
+    """
+    Retention and completion matrices for players grouped by first-seen bucket.
+
+    Cohort c holds players first seen in bucket c; cell [c, k] covers their
+    sessions k buckets later. Everything after the two queries is vectorized:
+    cells are flattened to one integer key and counted with np.bincount.
+    """
+    end = end or datetime.utcnow().date()
+    start = start or end - timedelta(days=365)
+    window_start = datetime.combine(start, datetime.min.time())
+    window_end = datetime.combine(end + timedelta(days=1), datetime.min.time())
+
+    players = _int_rows(
+        select(PlayerFirstSeen.user_id, _day_number(PlayerFirstSeen.first_seen))
+        .where(PlayerFirstSeen.first_seen >= window_start, PlayerFirstSeen.first_seen < window_end), 2
+    )
+    sessions = _int_rows(
+        select(func.coalesce(GameSession.user_id, -1), _day_number(GameSession.start_time), cast(GameSession.is_completed, Integer))
+        .where(GameSession.start_time >= window_start, GameSession.start_time < window_end), 3
+    )
+
+    first_bucket = int(_bucket_ids(np.int64((start - _EPOCH).days), bucket))
+    n_cohorts = int(_bucket_ids(np.int64((end - _EPOCH).days), bucket)) - first_bucket + 1
+
+    # Completion trend over every session in the window, players or not
+    s_users = sessions[:, 0]
+    s_bucket = _bucket_ids(sessions[:, 1], bucket) - first_bucket
+    s_completed = sessions[:, 2]
+    trend_sessions = np.bincount(s_bucket, minlength=n_cohorts)
+    trend_completed = np.bincount(s_bucket, weights=s_completed, minlength=n_cohorts).astype(np.int64)
+
+    size = np.zeros(n_cohorts, dtype=np.int64)
+    retained = np.zeros((n_cohorts, periods), dtype=np.int64)
+    played = np.zeros((n_cohorts, periods), dtype=np.int64)
+    completed = np.zeros((n_cohorts, periods), dtype=np.int64)
+    if len(players):
+        user_ids = players[:, 0]
+        cohorts = _bucket_ids(players[:, 1], bucket) - first_bucket
+        size = np.bincount(cohorts, minlength=n_cohorts)
+
+        # Sessions of cohort players only, joined to their cohort by sorted lookup
+        order = np.argsort(user_ids)
+        sorted_ids = user_ids[order]
+        pos = np.searchsorted(sorted_ids, s_users)
+        pos[pos == len(sorted_ids)] = 0
+        known = sorted_ids[pos] == s_users
+        if known.any():
+            player = order[pos[known]]
+            cohort = cohorts[player]
+            period = s_bucket[known] - cohort
+            keep = (period >= 0) & (period < periods)
+            cell = cohort[keep] * periods + period[keep]
+            played = np.bincount(cell, minlength=n_cohorts * periods).reshape(n_cohorts, periods)
+            completed = np.bincount(cell, weights=s_completed[known][keep], minlength=n_cohorts * periods) \
+                .astype(np.int64).reshape(n_cohorts, periods)
+            # Distinct players per cell
+            distinct = np.unique(player[keep].astype(np.int64) * (n_cohorts * periods) + cell)
+            retained = np.bincount(distinct % (n_cohorts * periods), minlength=n_cohorts * periods) \
+                .reshape(n_cohorts, periods)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        retention = np.where(size[:, None] > 0, retained / size[:, None], 0.0)
+        completion = np.where(played > 0, completed / np.maximum(played, 1), np.nan)
+
+    # Cells that lie in the future are reported as null
+    elapsed = n_cohorts - np.arange(n_cohorts)
+
+    return {
+        "bucket": bucket,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "periods": periods,
+        "cohorts": [
+            {
+                "start": _bucket_start(first_bucket + c, bucket),
+                "size": int(size[c]),
+                "retained": [int(retained[c, k]) if k < elapsed[c] else None for k in range(periods)],
+                "retention": [round(float(retention[c, k]), 4) if k < elapsed[c] else None for k in range(periods)],
+                "completion_rate": [None if k >= elapsed[c] or np.isnan(completion[c, k]) else round(float(completion[c, k]), 4)
+                                    for k in range(periods)],
+            }
+            for c in range(n_cohorts) if size[c]
+        ],
+        "trend": [
+            {
+                "start": _bucket_start(first_bucket + b, bucket),
+                "sessions": int(trend_sessions[b]),
+                "completed": int(trend_completed[b]),
+                "completion_rate": round(int(trend_completed[b]) / int(trend_sessions[b]), 4) if trend_sessions[b] else None,
+            }
+            for b in range(n_cohorts)
+        ],
+    }
@@ -0,0 +1,182 @@
+from datetime import datetime, date
+
+from sqlalchemy import func, case, insert, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from __init__ import db
+from model.game_session import GameSession
+from model.player_interaction import PlayerInteraction
+from model.gasgame_cohorts import record_first_seen, rebuild_first_seen
+from model.response_sketch import ResponseSketch, ResponseSketchDay, record_response_time
+
+
+class QuestionStat(db.Model):
+    """Running per-question totals, kept in step with player_interactions."""
+    __tablename__ = 'question_stats'
+
+    question_id = db.Column(db.Integer, db.ForeignKey('question_pool.id', ondelete='CASCADE'), primary_key=True)
+
+    attempt_count = db.Column(db.Integer, nullable=False, default=0)
+    correct_count = db.Column(db.Integer, nullable=False, default=0)
+    # Response times are summed over answers that reported one
+    response_count = db.Column(db.Integer, nullable=False, default=0)
+    response_time_sum_ms = db.Column(db.BigInteger, nullable=False, default=0)
+
+    def to_dict(self):
+        return {
+            "question_id": self.question_id,
+            "attempt_count": self.attempt_count,
+            "correct_count": self.correct_count,
+            "avg_response_time_ms": round(self.response_time_sum_ms / self.response_count, 2) if self.response_count else None,
+        }
+
+
+class SessionDayStat(db.Model):
+    """Running per-day session totals, keyed by the session's start day."""
+    __tablename__ = 'session_day_stats'
+
+    day = db.Column(db.Date, primary_key=True)
+
+    session_count = db.Column(db.Integer, nullable=False, default=0)
+    completed_count = db.Column(db.Integer, nullable=False, default=0)
+    duration_sum_s = db.Column(db.Float, nullable=False, default=0)
+    attempts_sum = db.Column(db.Integer, nullable=False, default=0)
+    retry_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def to_dict(self):
+        return {
+            "day": self.day.isoformat(),
+            "session_count": self.session_count,
+            "completed_count": self.completed_count,
+            "duration_sum_s": self.duration_sum_s,
+            "attempts_sum": self.attempts_sum,
+            "retry_count": self.retry_count,
+        }
+
+
+def _bump(model, key: dict, **deltas):
+    """
+    Add deltas to the rollup row for key, creating it first if needed.
+
+    Relative UPDATEs keep concurrent answers from losing increments; the
+    caller's commit makes the rollup change atomic with the event itself.
+    """
+    deltas = {name: value for name, value in deltas.items() if value}
+    if not deltas:
+        return
+    where = [getattr(model, name) == value for name, value in key.items()]
+    values = {name: getattr(model, name) + value for name, value in deltas.items()}
+    if db.session.execute(update(model).where(*where).values(**values)).rowcount:
+        return
+    if db.engine.dialect.name == 'sqlite':
+        stmt = sqlite_insert(model).values(**key).on_conflict_do_nothing()
+    else:
+        stmt = insert(model).values(**key).prefix_with('IGNORE')
+    db.session.execute(stmt)
+    db.session.execute(update(model).where(*where).values(**values))
+
+
+def record_session_start(session: GameSession):
+    _bump(SessionDayStat, {'day': (session.start_time or datetime.utcnow()).date()}, session_count=1)
+    record_first_seen(session)
+
+
+def record_interaction(interaction: PlayerInteraction):
+    if interaction.question_id is not None:
+        _bump(QuestionStat, {'question_id': interaction.question_id}, attempt_count=1)
+
+
+def record_answer(
+    session: GameSession,
+    interaction: PlayerInteraction,
+    was_correct: bool | None,
+    old_response_time_ms: int | None,
+    old_attempts: int,
+):
+    """
+    Apply one /api/quiz/answer to the rollups.
+
+    An interaction can be answered more than once, so the previous answer's
+    contribution is replaced rather than added to.
+    """
+    if interaction.question_id is not None:
+        _bump(
+            QuestionStat, {'question_id': interaction.question_id},
+            correct_count=int(bool(interaction.is_correct)) - int(bool(was_correct)),
+            response_count=int(interaction.response_time_ms is not None) - int(old_response_time_ms is not None),
+            response_time_sum_ms=(interaction.response_time_ms or 0) - (old_response_time_ms or 0),
+        )
+
+    if old_response_time_ms != interaction.response_time_ms:
+        answered_on = (interaction.timestamp or datetime.utcnow()).date()
+        for kind, key in (('question', interaction.question_id), ('player', session.user_id)):
+            record_response_time(kind, key, answered_on, old_response_time_ms, -1)
+            record_response_time(kind, key, answered_on, interaction.response_time_ms)
+
+    day = {'day': (session.start_time or datetime.utcnow()).date()}
+    if session.is_completed:
+        duration = (session.end_time - session.start_time).total_seconds() if session.start_time and session.end_time else 0
+        _bump(SessionDayStat, day, completed_count=1, duration_sum_s=duration)
+    else:
+        _bump(
+            SessionDayStat, day,
+            attempts_sum=session.attempts_count - old_attempts,
+            retry_count=int(old_attempts == 0 and session.attempts_count > 0),
+        )
+
+
+def rebuild_gasgame_stats():
+    """Recompute the rollups, response-time sketches and first-seen index from game_sessions and player_interactions."""
+    QuestionStat.query.delete()
+    SessionDayStat.query.delete()
+    ResponseSketchDay.query.delete()
+
+    question_rows = (
+        db.session.query(
+            PlayerInteraction.question_id,
+            func.count(PlayerInteraction.id),
+            func.sum(case((PlayerInteraction.is_correct.is_(True), 1), else_=0)),
+            func.count(PlayerInteraction.response_time_ms),
+            func.coalesce(func.sum(PlayerInteraction.response_time_ms), 0),
+        )
+        .filter(PlayerInteraction.question_id.isnot(None))
+        .group_by(PlayerInteraction.question_id)
+        .all()
+    )
+    db.session.add_all([
+        QuestionStat(question_id=qid, attempt_count=attempts, correct_count=int(correct or 0),
+                     response_count=responses, response_time_sum_ms=int(total_ms))
+        for qid, attempts, correct, responses, total_ms in question_rows
+    ])
+
+    days = {}
+    rows = db.session.query(
+        GameSession.start_time, GameSession.end_time, GameSession.is_completed, GameSession.attempts_count
+    ).yield_per(1000)
+    for start_time, end_time, is_completed, attempts in rows:
+        day = start_time.date() if start_time else date.today()
+        stat = days.get(day)
+        if stat is None:
+            stat = days[day] = SessionDayStat(day=day, session_count=0, completed_count=0,
+                                              duration_sum_s=0, attempts_sum=0, retry_count=0)
+        stat.session_count += 1
+        stat.attempts_sum += attempts or 0
+        stat.retry_count += int((attempts or 0) > 0)
+        if is_completed and start_time and end_time:
+            stat.completed_count += 1
+            stat.duration_sum_s += (end_time - start_time).total_seconds()
+    db.session.add_all(days.values())
+
+    sketches = {}
+    rows = db.session.query(
+        PlayerInteraction.question_id, GameSession.user_id, PlayerInteraction.timestamp, PlayerInteraction.response_time_ms
+    ).join(GameSession, GameSession.session_id == PlayerInteraction.session_id) \
+        .filter(PlayerInteraction.response_time_ms.isnot(None)).yield_per(1000)
+    for question_id, user_id, timestamp, response_time_ms in rows:
+        for kind, key in (('question', question_id), ('player', user_id)):
+            if key is not None:
+                sketches.setdefault((kind, key, timestamp.date()), ResponseSketch()).add(response_time_ms)
+    db.session.add_all([ResponseSketchDay(kind, key, day, sketch.to_bytes()) for (kind, key, day), sketch in sketches.items()])
+    players = rebuild_first_seen()
+    db.session.commit()
+    return {"questions": len(question_rows), "days": len(days), "sketches": len(sketches), "players": players}
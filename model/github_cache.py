@@ -0,0 +1,150 @@
+"""
+GitHub Analytics Cache
+Persistent TTL cache for GitHub API responses, keyed by
+(uid, query kind, date range). Backed by a SQLite file in the shared
+DATA_FOLDER so every gunicorn worker on the host sees the same entries,
+independent of the main application database.
+
+Entries younger than GITHUB_CACHE_TTL are served as-is. Entries younger
+than GITHUB_CACHE_STALE_TTL are served immediately while one worker
+refreshes them in the background (stale-while-revalidate). The least
+recently used entries are evicted beyond GITHUB_CACHE_MAX_ENTRIES.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from __init__ import app
+from model.academic_calendar import academic_calendar
+
+
+app.config.setdefault('GITHUB_CACHE_TTL', int(os.environ.get('GITHUB_CACHE_TTL') or 900))
+app.config.setdefault('GITHUB_CACHE_STALE_TTL', int(os.environ.get('GITHUB_CACHE_STALE_TTL') or 86400))
+app.config.setdefault('GITHUB_CACHE_MAX_ENTRIES', int(os.environ.get('GITHUB_CACHE_MAX_ENTRIES') or 5000))
+app.config.setdefault('GITHUB_CACHE_PATH', os.path.join(app.config['DATA_FOLDER'], 'github_cache.db'))
+
+# Seconds a worker holds the claim to refresh a stale entry
+REFRESH_CLAIM_SECONDS = 120
+
+
+class GitHubCache:
+    """
+    GitHubCache
+
+    Cached values are the (data, status) tuples returned by GitHubUser
+    methods; only status 200 responses are stored.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        if not self._initialized:
+            with self._init_lock:
+                conn.execute(
+                    'CREATE TABLE IF NOT EXISTS github_cache ('
+                    ' key TEXT PRIMARY KEY, value TEXT NOT NULL, fetched_at REAL NOT NULL,'
+                    ' accessed_at REAL NOT NULL, refreshing_until REAL)'
+                )
+                conn.execute('CREATE INDEX IF NOT EXISTS ix_github_cache_accessed ON github_cache (accessed_at)')
+                self._initialized = True
+        return conn
+
+    @staticmethod
+    def make_key(uid, kind, start_date, end_date):
+        # Term-aligned ranges share one entry per term, e.g. 'octocat|commits|2025-T1:2025-06-01..2025-11-14'
+        return f'{uid}|{kind}|{academic_calendar.partition_key(start_date, end_date)}'
+
+    def get_or_fetch(self, key, fetch):
+        """
+        Return the cached (data, status) for key, calling fetch() on a miss.
+
+        Args:
+            key: cache key, see make_key
+            fetch: zero-argument callable returning (data, status)
+        """
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute('SELECT value, fetched_at FROM github_cache WHERE key = ?', (key,)).fetchone()
+        if row is not None:
+            age = now - row[1]
+            if age <= app.config['GITHUB_CACHE_STALE_TTL']:
+                conn.execute('UPDATE github_cache SET accessed_at = ? WHERE key = ?', (now, key))
+                if age > app.config['GITHUB_CACHE_TTL'] and self._claim_refresh(conn, key, now):
+                    threading.Thread(target=self._refresh, args=(key, fetch), daemon=True).start()
+                return json.loads(row[0]), 200
+        return self._fetch_and_store(key, fetch)
+
+    def _claim_refresh(self, conn, key, now):
+        """Only one worker refreshes a given stale entry at a time."""
+        cursor = conn.execute(
+            'UPDATE github_cache SET refreshing_until = ? WHERE key = ? AND (refreshing_until IS NULL OR refreshing_until < ?)',
+            (now + REFRESH_CLAIM_SECONDS, key, now)
+        )
+        return cursor.rowcount == 1
+
+    def _refresh(self, key, fetch):
+        try:
+            with app.app_context():
+                self._fetch_and_store(key, fetch)
+        except Exception as e:
+            print(f"GitHub cache refresh failed for {key}: {e}")
+
+    def _fetch_and_store(self, key, fetch):
+        data, status = fetch()
+        if status == 200:
+            self.put(key, data)
+        return data, status
+
+    def put(self, key, data):
+        conn = self._connect()
+        now = time.time()
+        conn.execute(
+            'INSERT INTO github_cache (key, value, fetched_at, accessed_at, refreshing_until) VALUES (?, ?, ?, ?, NULL) '
+            'ON CONFLICT(key) DO UPDATE SET value = excluded.value, fetched_at = excluded.fetched_at, '
+            'accessed_at = excluded.accessed_at, refreshing_until = NULL',
+            (key, json.dumps(data), now, now)
+        )
+        self._evict(conn)
+
+    def _evict(self, conn):
+        """Drop least recently used entries beyond GITHUB_CACHE_MAX_ENTRIES."""
+        limit = app.config['GITHUB_CACHE_MAX_ENTRIES']
+        count = conn.execute('SELECT COUNT(*) FROM github_cache').fetchone()[0]
+        if count > limit:
+            conn.execute(
+                'DELETE FROM github_cache WHERE key IN (SELECT key FROM github_cache ORDER BY accessed_at LIMIT ?)',
+                (count - limit,)
+            )
+
+    def invalidate(self, uid=None):
+        """Drop every entry, or every entry for one uid."""
+        conn = self._connect()
+        if uid is None:
+            conn.execute('DELETE FROM github_cache')
+        else:
+            conn.execute('DELETE FROM github_cache WHERE key LIKE ?', (f'{uid}|%',))
+
+    def stats(self):
+        conn = self._connect()
+        now = time.time()
+        total, fresh = conn.execute(
+            'SELECT COUNT(*), SUM(CASE WHEN fetched_at >= ? THEN 1 ELSE 0 END) FROM github_cache',
+            (now - app.config['GITHUB_CACHE_TTL'],)
+        ).fetchone()
+        return {"entries": total, "fresh": fresh or 0, "stale": total - (fresh or 0)}
+
+
+# Shared cache, one SQLite file per host
+github_cache = GitHubCache(app.config['GITHUB_CACHE_PATH'])
@@ -0,0 +1,177 @@
+"""
+GitHub Rate Limited Client
+Every GitHub API call goes through one token bucket per rate-limit
+resource ('core' for REST, 'graphql' for GraphQL points). Bucket state
+lives in a SQLite file in the shared DATA_FOLDER, so all gunicorn workers
+draw from the same budget, and is corrected from the X-RateLimit-*
+headers GitHub sends back.
+
+When the budget is spent the client answers immediately with a 429
+payload carrying `retry_after` seconds; it never sleeps a worker thread.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+import requests
+
+from __init__ import app
+from model.http_client import http_client
+
+
+app.config.setdefault('GITHUB_RATE_LIMIT_PER_HOUR', int(os.environ.get('GITHUB_RATE_LIMIT_PER_HOUR') or 5000))
+app.config.setdefault('GITHUB_RATE_LIMIT_BURST', int(os.environ.get('GITHUB_RATE_LIMIT_BURST') or 500))
+app.config.setdefault('GITHUB_RATE_LIMIT_PATH', os.path.join(app.config['DATA_FOLDER'], 'github_ratelimit.db'))
+
+# Seconds a GitHub call may take before it is abandoned
+GITHUB_TIMEOUT = 30
+
+
+class GitHubRateLimiter:
+    """
+    GitHubRateLimiter
+
+    A token bucket per resource refilled at GITHUB_RATE_LIMIT_PER_HOUR / 3600
+    tokens a second up to GITHUB_RATE_LIMIT_BURST. Each row also remembers
+    the last remaining/reset pair GitHub reported, which overrides the
+    bucket while GitHub says the budget is exhausted.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS github_buckets ('
+                ' resource TEXT PRIMARY KEY,'
+                ' tokens REAL NOT NULL,'
+                ' updated_at REAL NOT NULL,'
+                ' remaining INTEGER,'
+                ' reset_at REAL NOT NULL DEFAULT 0)'
+            )
+            self._local.conn = conn
+        return conn
+
+    def acquire(self, resource, cost=1):
+        """
+        Take `cost` tokens from the resource's bucket.
+
+        Returns:
+            0 when the call may proceed, otherwise the seconds to wait.
+        """
+        capacity = app.config['GITHUB_RATE_LIMIT_BURST']
+        rate = app.config['GITHUB_RATE_LIMIT_PER_HOUR'] / 3600.0
+        now = time.time()
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT tokens, updated_at, remaining, reset_at FROM github_buckets WHERE resource = ?', (resource,)
+            ).fetchone()
+            tokens, updated_at, remaining, reset_at = row or (capacity, now, None, 0)
+
+            if remaining is not None and remaining < cost and reset_at > now:
+                conn.execute('COMMIT')
+                return int(reset_at - now) + 1
+
+            tokens = min(capacity, tokens + (now - updated_at) * rate)
+            if tokens < cost:
+                conn.execute('COMMIT')
+                return int((cost - tokens) / rate) + 1
+
+            conn.execute(
+                'INSERT INTO github_buckets (resource, tokens, updated_at, remaining, reset_at) VALUES (?, ?, ?, ?, ?) '
+                'ON CONFLICT(resource) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at, '
+                'remaining = excluded.remaining',
+                (resource, tokens - cost, now, None if remaining is None else remaining - cost, reset_at)
+            )
+            conn.execute('COMMIT')
+            return 0
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def observe(self, resource, response):
+        """Record the budget GitHub reported on a response."""
+        headers = response.headers
+        remaining = headers.get('X-RateLimit-Remaining')
+        reset_at = headers.get('X-RateLimit-Reset')
+        retry_after = headers.get('Retry-After')
+        if retry_after is not None and response.status_code in (403, 429):
+            # Secondary rate limit: GitHub asks for a pause without a reset time
+            remaining, reset_at = 0, time.time() + int(retry_after)
+        if remaining is None or reset_at is None:
+            return
+        remaining, reset_at = int(remaining), float(reset_at)
+        conn = self._connect()
+        conn.execute(
+            'INSERT INTO github_buckets (resource, tokens, updated_at, remaining, reset_at) VALUES (?, ?, ?, ?, ?) '
+            'ON CONFLICT(resource) DO UPDATE SET tokens = MIN(tokens, excluded.tokens), '
+            'remaining = excluded.remaining, reset_at = excluded.reset_at',
+            (resource, min(remaining, app.config['GITHUB_RATE_LIMIT_BURST']), time.time(), remaining, reset_at)
+        )
+
+    def stats(self):
+        rows = self._connect().execute(
+            'SELECT resource, tokens, remaining, reset_at FROM github_buckets ORDER BY resource'
+        ).fetchall()
+        return {
+            resource: {"tokens": round(tokens, 2), "remaining": remaining, "reset_at": reset_at}
+            for resource, tokens, remaining, reset_at in rows
+        }
+
+
+class GitHubClient:
+    """
+    GitHubClient
+
+    request() returns (response, None) when GitHub was called, or
+    (None, (error dict, status)) when the call was refused or failed, so
+    callers keep the repo's (data, status) convention.
+    """
+
+    def __init__(self, limiter):
+        self.limiter = limiter
+
+    def request(self, method, url, resource='core', cost=1, **kwargs):
+        wait = self.limiter.acquire(resource, cost)
+        if wait:
+            return None, ({'message': 'GitHub rate limit reached, retry later', 'retry_after': wait}, 429)
+        kwargs.setdefault('timeout', GITHUB_TIMEOUT)
+        try:
+            response = http_client.request(method, url, **kwargs)
+        except requests.RequestException as e:
+            return None, ({'message': str(e)}, 502)
+        self.limiter.observe(resource, response)
+        if response.status_code in (403, 429) and (
+                response.headers.get('X-RateLimit-Remaining') == '0' or response.headers.get('Retry-After')):
+            retry_after = int(response.headers.get('Retry-After') or
+                              max(0, float(response.headers.get('X-RateLimit-Reset', time.time())) - time.time()) + 1)
+            return None, ({'message': 'GitHub rate limit reached, retry later', 'retry_after': retry_after}, 429)
+        return response, None
+
+    def graphql(self, query, variables, token, cost=1):
+        """POST a GraphQL query; returns (data, status)."""
+        response, error = self.request(
+            'POST', 'https://api.github.com/graphql', resource='graphql', cost=cost,
+            json={'query': query, 'variables': variables},
+            headers={'Authorization': f'bearer {token}'}
+        )
+        if error:
+            return error
+        if response.status_code != 200:
+            return {'message': 'GitHub API failed to fetch data'}, response.status_code
+        return response.json(), 200
+
+
+# Rate limits are handled above; the pool must never back off or retry a 403/429
+http_client.configure('api.github.com', retries=1, backoff=0, status_forcelist=())
+
+github_client = GitHubClient(GitHubRateLimiter(app.config['GITHUB_RATE_LIMIT_PATH']))
@@ -0,0 +1,156 @@
+"""
+GitHub Paginated Fetcher
+Follows GraphQL `pageInfo.endCursor` so heavy contributors are no longer
+truncated at the first 50 repositories / 100 commits / 100 search hits.
+Per-repository commit histories are fetched concurrently, at most
+GITHUB_FETCH_CONCURRENCY at a time, and results are yielded as a stream
+so aggregators never hold the full response in memory.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from __init__ import app
+
+
+app.config.setdefault('GITHUB_FETCH_CONCURRENCY', int(os.environ.get('GITHUB_FETCH_CONCURRENCY') or 4))
+app.config.setdefault('GITHUB_FETCH_MAX_PAGES', int(os.environ.get('GITHUB_FETCH_MAX_PAGES') or 10))
+
+# Nodes per GraphQL page; GitHub allows at most 100
+PAGE_SIZE = 100
+
+REPOS_QUERY = """
+query($login: String!, $first: Int!, $cursor: String) {
+  user(login: $login) {
+    id
+    repositoriesContributedTo(first: $first, after: $cursor, contributionTypes: [COMMIT], includeUserRepositories: true) {
+      pageInfo { hasNextPage endCursor }
+      nodes { name owner { login } defaultBranchRef { name } }
+    }
+  }
+}
+"""
+
+HISTORY_QUERY = """
+query($owner: String!, $name: String!, $authorId: ID!, $since: GitTimestamp!, $until: GitTimestamp!, $first: Int!, $cursor: String) {
+  repository(owner: $owner, name: $name) {
+    defaultBranchRef {
+      target {
+        ... on Commit {
+          history(first: $first, after: $cursor, since: $since, until: $until, author: {id: $authorId}) {
+            pageInfo { hasNextPage endCursor }
+            nodes {
+              committedDate
+              messageHeadline
+              additions
+              deletions
+              url
+              author { user { login } }
+            }
+          }
+        }
+      }
+    }
+  }
+}
+"""
+
+SEARCH_QUERY = """
+query($query: String!, $first: Int!, $cursor: String) {
+  search(query: $query, type: ISSUE, first: $first, after: $cursor) {
+    pageInfo { hasNextPage endCursor }
+    edges { node { %s } }
+  }
+}
+"""
+
+
+class GitHubFetchError(Exception):
+    """A GraphQL page failed; carries the (data, status) of the failed call."""
+
+    def __init__(self, data, status):
+        super().__init__(data.get('message') if isinstance(data, dict) else str(data))
+        self.data = data
+        self.status = status
+
+
+class GitHubPaginator:
+    """
+    GitHubPaginator
+
+    Args:
+        request: callable(query, variables) -> (data, status), normally
+            GitHubUser.make_github_graphql_request
+        concurrency: max repositories fetched at once
+        max_pages: max pages followed per connection
+    """
+
+    def __init__(self, request, concurrency=None, max_pages=None):
+        self._request = request
+        self.concurrency = concurrency or app.config['GITHUB_FETCH_CONCURRENCY']
+        self.max_pages = max_pages or app.config['GITHUB_FETCH_MAX_PAGES']
+
+    def _query(self, query, variables):
+        data, status = self._request(query, variables)
+        if status != 200 or not data or data.get('errors') and not data.get('data'):
+            raise GitHubFetchError(data or {'message': 'Empty response from GitHub'}, status if status != 200 else 502)
+        return data['data']
+
+    def _pages(self, query, variables, connection):
+        """Yield each page's connection object, following endCursor."""
+        cursor = None
+        for _ in range(self.max_pages):
+            data = self._query(query, {**variables, 'first': PAGE_SIZE, 'cursor': cursor})
+            page = connection(data)
+            if page is None:
+                return
+            yield page
+            info = page.get('pageInfo') or {}
+            if not info.get('hasNextPage'):
+                return
+            cursor = info.get('endCursor')
+
+    def iter_contributed_repos(self, login):
+        """Yield (author_id, owner, name) for every repo the user committed to."""
+        for page in self._pages(REPOS_QUERY, {'login': login}, lambda d: d.get('user') and {
+                **d['user']['repositoriesContributedTo'], 'author_id': d['user']['id']}):
+            for repo in page.get('nodes') or []:
+                if repo.get('defaultBranchRef'):
+                    yield page['author_id'], repo['owner']['login'], repo['name']
+
+    def repo_commits(self, owner, name, author_id, since, until):
+        """All of one author's commits on a repo's default branch, in a list."""
+        commits = []
+        connection = lambda d: ((((d.get('repository') or {}).get('defaultBranchRef') or {}).get('target')) or {}).get('history')
+        for page in self._pages(HISTORY_QUERY, {'owner': owner, 'name': name, 'authorId': author_id, 'since': since, 'until': until}, connection):
+            commits.extend(page.get('nodes') or [])
+        return commits
+
+    def iter_commits(self, login, since, until):
+        """
+        Yield (repository, commit) pairs across every contributed repo.
+
+        Repositories are discovered as a stream and their histories are
+        fetched on a thread pool with at most `concurrency` in flight.
+        """
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            pending = {}
+            for author_id, owner, name in self.iter_contributed_repos(login):
+                if len(pending) >= self.concurrency:
+                    yield from self._drain(pending, FIRST_COMPLETED)
+                future = pool.submit(self.repo_commits, owner, name, author_id, since, until)
+                pending[future] = f'{owner}/{name}'
+            while pending:
+                yield from self._drain(pending, FIRST_COMPLETED)
+
+    @staticmethod
+    def _drain(pending, return_when):
+        done, _ = wait(pending, return_when=return_when)
+        for future in done:
+            repository = pending.pop(future)
+            for commit in future.result():
+                yield repository, commit
+
+    def iter_search(self, search_query, fields):
+        """Yield search edges ({'node': {...}}) for an issue/PR search."""
+        for page in self._pages(SEARCH_QUERY % fields, {'query': search_query}, lambda d: d.get('search')):
+            yield from page.get('edges') or []
@@ -0,0 +1,473 @@
+"""
+GitHub Contribution Warehouse
+Local copy of every user's commits, pull requests, issues and their
+comments, indexed by (uid, date). An ingestion job pulls each user's new
+activity since their per-kind watermark; analytics endpoints then answer
+with SQL aggregates instead of live GitHub queries. Per-term totals are
+kept alongside, keyed by each term's name and dates, so
+term-aligned batch reports read one row per student.
+"""
+import os
+import threading
+import time
+from datetime import datetime, date, timedelta
+
+from sqlalchemy import func, insert, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import SQLAlchemyError
+
+from __init__ import app, db
+from model.github import GitHubUser
+from model.academic_calendar import academic_calendar
+from model.background_lease import background_lease
+
+
+# First day ingested for a user with no watermark yet
+app.config.setdefault('GITHUB_INGEST_START', os.environ.get('GITHUB_INGEST_START') or
+                      (date.today() - timedelta(days=365)).isoformat())
+# PRs/issues created this many days before the watermark are re-read so
+# their comment lists stay current
+app.config.setdefault('GITHUB_INGEST_REFRESH_DAYS', int(os.environ.get('GITHUB_INGEST_REFRESH_DAYS') or 30))
+# Seconds between background ingestion runs (0 disables the ingest thread)
+app.config.setdefault('GITHUB_INGEST_INTERVAL', int(os.environ.get('GITHUB_INGEST_INTERVAL') or 0))
+# Seconds an ingest stays fresh; older warehouse data is not served for
+# ranges reaching past the last pull, which fall back to live queries
+app.config.setdefault('GITHUB_WAREHOUSE_MAX_AGE', int(os.environ.get('GITHUB_WAREHOUSE_MAX_AGE') or 3600))
+
+KINDS = ('commits', 'prs', 'issues')
+
+
+def _parse_time(value):
+    return datetime.strptime(value, '%Y-%m-%dT%H:%M:%SZ') if value else None
+
+
+class GitHubCommit(db.Model):
+    __tablename__ = 'github_commits'
+    __table_args__ = (db.Index('ix_github_commits_uid_date', '_uid', '_committed_at'),)
+    id = db.Column(db.Integer, primary_key=True)
+    _uid = db.Column(db.String(255), nullable=False)
+    _repository = db.Column(db.String(255), nullable=False)
+    _committed_at = db.Column(db.DateTime, nullable=False)
+    _message = db.Column(db.Text, nullable=True)
+    _additions = db.Column(db.Integer, nullable=False, default=0)
+    _deletions = db.Column(db.Integer, nullable=False, default=0)
+    _url = db.Column(db.String(512), unique=True, nullable=False)
+
+    def read(self):
+        return {
+            "repository": self._repository,
+            "date": self._committed_at.strftime('%Y-%m-%dT%H:%M:%SZ'),
+            "message": self._message,
+            "additions": self._additions,
+            "deletions": self._deletions,
+            "url": self._url
+        }
+
+
+class GitHubPullRequest(db.Model):
+    __tablename__ = 'github_pull_requests'
+    __table_args__ = (db.Index('ix_github_pull_requests_uid_date', '_uid', '_created_at'),)
+    id = db.Column(db.Integer, primary_key=True)
+    _uid = db.Column(db.String(255), nullable=False)
+    _repository = db.Column(db.String(255), nullable=False)
+    _title = db.Column(db.Text, nullable=True)
+    _created_at = db.Column(db.DateTime, nullable=False)
+    _url = db.Column(db.String(512), unique=True, nullable=False)
+
+    def read(self, comments):
+        return {'node': {
+            "title": self._title,
+            "url": self._url,
+            "createdAt": self._created_at.strftime('%Y-%m-%dT%H:%M:%SZ'),
+            "repository": {"nameWithOwner": self._repository},
+            "author": {"login": self._uid},
+            "comments": {"nodes": comments}
+        }}
+
+
+class GitHubIssue(db.Model):
+    __tablename__ = 'github_issues'
+    __table_args__ = (db.Index('ix_github_issues_uid_date', '_uid', '_created_at'),)
+    id = db.Column(db.Integer, primary_key=True)
+    _uid = db.Column(db.String(255), nullable=False)
+    _repository = db.Column(db.String(255), nullable=False)
+    _title = db.Column(db.Text, nullable=True)
+    _created_at = db.Column(db.DateTime, nullable=False)
+    _url = db.Column(db.String(512), unique=True, nullable=False)
+    _comment_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def read(self, comments):
+        return {'node': {
+            "title": self._title,
+            "url": self._url,
+            "createdAt": self._created_at.strftime('%Y-%m-%dT%H:%M:%SZ'),
+            "repository": {"nameWithOwner": self._repository},
+            "author": {"login": self._uid},
+            "comments": {"totalCount": self._comment_count, "nodes": comments}
+        }}
+
+
+class GitHubComment(db.Model):
+    """A comment on a warehoused PR or issue, keyed by the parent's url."""
+    __tablename__ = 'github_comments'
+    id = db.Column(db.Integer, primary_key=True)
+    _parent_url = db.Column(db.String(512), nullable=False, index=True)
+    _position = db.Column(db.Integer, nullable=False)
+    _author = db.Column(db.String(255), nullable=True)
+    _body = db.Column(db.Text, nullable=True)
+
+    def read(self):
+        return {"body": self._body, "author": {"login": self._author} if self._author else None}
+
+
+class GitHubWatermark(db.Model):
+    """
+    GitHubWatermark
+
+    Per (uid, kind) ingestion progress. `_covered_from` is the first day
+    held locally and `_synced_through` the time of the last successful pull.
+    """
+    __tablename__ = 'github_watermarks'
+    _uid = db.Column(db.String(255), primary_key=True)
+    _kind = db.Column(db.String(16), primary_key=True)
+    _covered_from = db.Column(db.Date, nullable=False)
+    _synced_through = db.Column(db.DateTime, nullable=False)
+
+    def read(self):
+        return {
+            "uid": self._uid,
+            "kind": self._kind,
+            "covered_from": self._covered_from.isoformat(),
+            "synced_through": self._synced_through.isoformat()
+        }
+
+
+class GitHubTermTotal(db.Model):
+    """Per (uid, term) totals, recomputed after each ingest of that uid."""
+    __tablename__ = 'github_term_totals'
+    _uid = db.Column(db.String(255), primary_key=True)
+    _term = db.Column(db.String(64), primary_key=True)
+    _commits = db.Column(db.Integer, nullable=False, default=0)
+    _lines_added = db.Column(db.Integer, nullable=False, default=0)
+    _lines_deleted = db.Column(db.Integer, nullable=False, default=0)
+    _prs = db.Column(db.Integer, nullable=False, default=0)
+    _issues = db.Column(db.Integer, nullable=False, default=0)
+    _received_comments = db.Column(db.Integer, nullable=False, default=0)
+
+    def read(self):
+        return {
+            "uid": self._uid,
+            "commits": self._commits,
+            "lines_added": self._lines_added,
+            "lines_deleted": self._lines_deleted,
+            "prs": self._prs,
+            "issues": self._issues,
+            "received_comments": self._received_comments
+        }
+
+
+# Ingestion
+
+def _existing(model, urls):
+    if not urls:
+        return {}
+    return {row._url: row for row in model.query.filter(model._url.in_(urls)).all()}
+
+
+def _store_comments(parent_url, nodes):
+    GitHubComment.query.filter_by(_parent_url=parent_url).delete()
+    for position, comment in enumerate(nodes or []):
+        db.session.add(GitHubComment(
+            _parent_url=parent_url,
+            _position=position,
+            _author=((comment or {}).get('author') or {}).get('login'),
+            _body=(comment or {}).get('body')
+        ))
+
+
+def _ingest_commits(uid, data):
+    commits = data['details_of_commits']
+    existing = _existing(GitHubCommit, [c['url'] for c in commits])
+    added = 0
+    for commit in commits:
+        if commit['url'] in existing:
+            continue
+        existing[commit['url']] = True
+        db.session.add(GitHubCommit(
+            _uid=uid,
+            _repository=commit['repository'],
+            _committed_at=_parse_time(commit['date']),
+            _message=commit['message'],
+            _additions=commit['additions'],
+            _deletions=commit['deletions'],
+            _url=commit['url']
+        ))
+        added += 1
+    return added
+
+
+def _ingest_search(uid, model, edges):
+    nodes = [edge['node'] for edge in edges if edge.get('node') and edge['node'].get('url')]
+    existing = _existing(model, [node['url'] for node in nodes])
+    added = 0
+    for node in nodes:
+        row = existing.get(node['url'])
+        if row is None:
+            row = model(
+                _uid=uid,
+                _repository=(node.get('repository') or {}).get('nameWithOwner', ''),
+                _title=node.get('title'),
+                _created_at=_parse_time(node.get('createdAt')),
+                _url=node['url']
+            )
+            db.session.add(row)
+            existing[node['url']] = row
+            added += 1
+        comments = node.get('comments') or {}
+        if model is GitHubIssue:
+            row._comment_count = comments.get('totalCount', 0)
+        _store_comments(node['url'], comments.get('nodes'))
+    return added
+
+
+def ingest_user(uid, now=None):
+    """
+    Pull one user's activity since their watermarks; returns rows added per kind.
+
+    Each kind commits separately, so a GitHub failure for PRs does not
+    discard commits already pulled. Failed kinds keep their old watermark.
+    """
+    now = now or datetime.utcnow()
+    github = GitHubUser()
+    fetchers = {
+        'commits': (github._fetch_commit_stats, lambda data: _ingest_commits(uid, data)),
+        'prs': (github._fetch_pr_stats, lambda data: _ingest_search(uid, GitHubPullRequest, data['pull_requests'])),
+        'issues': (github._fetch_issue_stats, lambda data: _ingest_search(uid, GitHubIssue, data['issues'])),
+    }
+    result = {}
+    for kind in KINDS:
+        watermark = db.session.get(GitHubWatermark, (uid, kind))
+        if watermark is None:
+            start = date.fromisoformat(app.config['GITHUB_INGEST_START'])
+        else:
+            overlap = 1 if kind == 'commits' else app.config['GITHUB_INGEST_REFRESH_DAYS']
+            start = max(watermark._synced_through.date() - timedelta(days=overlap), watermark._covered_from)
+        # The commit history `until` bound is exclusive, so ask through tomorrow
+        end = now.date() + timedelta(days=1) if kind == 'commits' else now.date()
+
+        fetch, store = fetchers[kind]
+        data, status = fetch(uid, start.isoformat(), end.isoformat())
+        if status != 200:
+            result[kind] = {'error': status}
+            continue
+        try:
+            added = store(data)
+            if watermark is None:
+                watermark = GitHubWatermark(_uid=uid, _kind=kind, _covered_from=start, _synced_through=now)
+                db.session.add(watermark)
+            else:
+                watermark._synced_through = now
+            db.session.commit()
+            result[kind] = added
+        except SQLAlchemyError as e:
+            # Another worker ingested the same rows first; next run catches up
+            db.session.rollback()
+            result[kind] = {'error': str(e.__class__.__name__)}
+    if any(not isinstance(value, dict) for value in result.values()):
+        try:
+            refresh_term_totals(uid, now.date())
+        except SQLAlchemyError as e:
+            # Totals are recomputed on the next ingest of this uid
+            db.session.rollback()
+            result['term_totals'] = {'error': str(e.__class__.__name__)}
+    return result
+
+
+def refresh_term_totals(uid, today=None):
+    """Recompute uid's totals for every term that the warehouse fully covers and has started."""
+    today = today or date.today()
+    watermarks = GitHubWatermark.query.filter_by(_uid=uid).all()
+    if len(watermarks) < len(KINDS):
+        return 0
+    covered_from = max(watermark._covered_from for watermark in watermarks)
+    terms = [term for term in academic_calendar.terms_overlapping(covered_from, today)
+             if term.start >= covered_from and term.start <= today]
+    for term in terms:
+        start_date_str, end_date_str = term.range()
+        start, end = _range(start_date_str, end_date_str, inclusive_end=False)
+        commits, additions, deletions = db.session.query(
+            func.count(GitHubCommit.id),
+            func.coalesce(func.sum(GitHubCommit._additions), 0),
+            func.coalesce(func.sum(GitHubCommit._deletions), 0)
+        ).filter(GitHubCommit._uid == uid, GitHubCommit._committed_at >= start, GitHubCommit._committed_at < end).one()
+        start, end = _range(start_date_str, end_date_str, inclusive_end=True)
+        prs = db.session.query(func.count(GitHubPullRequest.id)).filter(
+            GitHubPullRequest._uid == uid, GitHubPullRequest._created_at >= start, GitHubPullRequest._created_at < end
+        ).scalar()
+        issues, comments = db.session.query(
+            func.count(GitHubIssue.id), func.coalesce(func.sum(GitHubIssue._comment_count), 0)
+        ).filter(GitHubIssue._uid == uid, GitHubIssue._created_at >= start, GitHubIssue._created_at < end).one()
+        # Insert-or-ignore then update, so concurrent ingesters of uid never collide on the key
+        key = {'_uid': uid, '_term': term.partition}
+        if db.engine.dialect.name == 'sqlite':
+            stmt = sqlite_insert(GitHubTermTotal).values(**key).on_conflict_do_nothing()
+        else:
+            stmt = insert(GitHubTermTotal).values(**key).prefix_with('IGNORE')
+        db.session.execute(stmt)
+        db.session.execute(update(GitHubTermTotal).filter_by(**key).values(
+            _commits=commits, _lines_added=additions, _lines_deleted=deletions,
+            _prs=prs, _issues=issues, _received_comments=comments
+        ))
+    db.session.commit()
+    return len(terms)
+
+
+def ingest_all(uids=None):
+    """Ingest every user in `users` (or just `uids`); returns a summary dict."""
+    from model.user import User
+    started = time.monotonic()
+    if uids is None:
+        uids = [uid for (uid,) in db.session.query(User._uid).order_by(User._uid).all()]
+    added = {kind: 0 for kind in KINDS}
+    failed = {}
+    for uid in uids:
+        for kind, value in ingest_user(uid).items():
+            if isinstance(value, dict):
+                failed.setdefault(uid, {})[kind] = value['error']
+            else:
+                added[kind] += value
+    return {
+        "users": len(uids),
+        "added": added,
+        "failed": failed,
+        "seconds": round(time.monotonic() - started, 2)
+    }
+
+
+def start_github_ingester(interval):
+    """Run ingest_all every `interval` seconds in a daemon thread, in one worker at a time."""
+    def run():
+        while True:
+            time.sleep(interval)
+            with app.app_context():
+                try:
+                    # One worker per host runs each cycle; the lease outlives a slow cycle
+                    if not background_lease.acquire('github-ingest', interval * 3):
+                        continue
+                    result = ingest_all()
+                    print(f"GitHub ingest added {result['added']} for {result['users']} user(s)")
+                except Exception as e:
+                    print(f"GitHub ingest failed: {e}")
+                finally:
+                    db.session.remove()
+
+    thread = threading.Thread(target=run, name='github-ingester', daemon=True)
+    thread.start()
+    return thread
+
+
+# Reads
+
+def _fresh_through(end_date_str):
+    """Oldest _synced_through that still answers a range ending on end_date."""
+    end = min(datetime.fromisoformat(end_date_str) + timedelta(days=1), datetime.utcnow())
+    return end - timedelta(seconds=app.config['GITHUB_WAREHOUSE_MAX_AGE'])
+
+
+def _covered(uid, kind, start_date_str, end_date_str):
+    """True when the warehouse holds `kind` for uid from start_date and was pulled recently enough for end_date."""
+    watermark = db.session.get(GitHubWatermark, (uid, kind))
+    return (watermark is not None
+            and watermark._covered_from <= date.fromisoformat(start_date_str)
+            and watermark._synced_through >= _fresh_through(end_date_str))
+
+
+def _range(start_date_str, end_date_str, inclusive_end):
+    start = datetime.fromisoformat(start_date_str)
+    end = datetime.fromisoformat(end_date_str)
+    return start, end + timedelta(days=1) if inclusive_end else end
+
+
+def _comments_by_parent(urls):
+    comments = {}
+    if urls:
+        rows = GitHubComment.query.filter(GitHubComment._parent_url.in_(urls)) \
+            .order_by(GitHubComment._parent_url, GitHubComment._position).all()
+        for comment in rows:
+            comments.setdefault(comment._parent_url, []).append(comment.read())
+    return comments
+
+
+def get_commit_stats(uid, start_date_str, end_date_str):
+    """Same shape as GitHubUser.get_commit_stats, or None if not ingested."""
+    if not _covered(uid, 'commits', start_date_str, end_date_str):
+        return None
+    # Mirrors the live query: `until` is midnight at the start of end_date
+    start, end = _range(start_date_str, end_date_str, inclusive_end=False)
+    in_range = (GitHubCommit._uid == uid, GitHubCommit._committed_at >= start, GitHubCommit._committed_at < end)
+    count, additions, deletions = db.session.query(
+        func.count(GitHubCommit.id),
+        func.coalesce(func.sum(GitHubCommit._additions), 0),
+        func.coalesce(func.sum(GitHubCommit._deletions), 0)
+    ).filter(*in_range).one()
+    commits = GitHubCommit.query.filter(*in_range).order_by(GitHubCommit._committed_at.desc()).all()
+    return {
+        'total_commit_contributions': count,
+        'total_lines_added': additions,
+        'total_lines_deleted': deletions,
+        'details_of_commits': [commit.read() for commit in commits]
+    }, 200
+
+
+def _search_rows(model, uid, start_date_str, end_date_str):
+    # Search uses created:start..end, which includes the whole end day
+    start, end = _range(start_date_str, end_date_str, inclusive_end=True)
+    rows = model.query.filter(model._uid == uid, model._created_at >= start, model._created_at < end) \
+        .order_by(model._created_at.desc()).all()
+    comments = _comments_by_parent([row._url for row in rows])
+    return [row.read(comments.get(row._url, [])) for row in rows]
+
+
+def get_pr_stats(uid, start_date_str, end_date_str):
+    if not _covered(uid, 'prs', start_date_str, end_date_str):
+        return None
+    return {'pull_requests': _search_rows(GitHubPullRequest, uid, start_date_str, end_date_str)}, 200
+
+
+def get_issue_stats(uid, start_date_str, end_date_str):
+    if not _covered(uid, 'issues', start_date_str, end_date_str):
+        return None
+    return {'issues': _search_rows(GitHubIssue, uid, start_date_str, end_date_str)}, 200
+
+
+def get_term_totals(uids, start_date_str, end_date_str):
+    """
+    {uid: totals} for uids with a fresh stored total when start..end is
+    exactly one term, else {}. A total is fresh while every kind of that
+    uid was synced recently enough for the term's end (see _covered).
+    """
+    term = academic_calendar.term_for_range(start_date_str, end_date_str)
+    if term is None or not uids:
+        return {}
+    fresh = [uid for (uid,) in db.session.query(GitHubWatermark._uid)
+             .filter(GitHubWatermark._uid.in_(uids))
+             .group_by(GitHubWatermark._uid)
+             .having(func.count(GitHubWatermark._kind) == len(KINDS),
+                     func.min(GitHubWatermark._synced_through) >= _fresh_through(end_date_str))]
+    if not fresh:
+        return {}
+    rows = GitHubTermTotal.query.filter(GitHubTermTotal._term == term.partition, GitHubTermTotal._uid.in_(fresh)).all()
+    return {row._uid: row.read() for row in rows}
+
+
+def get_total_received_issue_comments(uid, start_date_str, end_date_str):
+    if not _covered(uid, 'issues', start_date_str, end_date_str):
+        return None
+    totals = get_term_totals([uid], start_date_str, end_date_str)
+    if uid in totals:
+        return {"total_received_comments": totals[uid]['received_comments']}, 200
+    start, end = _range(start_date_str, end_date_str, inclusive_end=True)
+    total = db.session.query(func.coalesce(func.sum(GitHubIssue._comment_count), 0)).filter(
+        GitHubIssue._uid == uid, GitHubIssue._created_at >= start, GitHubIssue._created_at < end
+    ).scalar()
+    return {"total_received_comments": total}, 200
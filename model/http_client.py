@@ -0,0 +1,152 @@
+"""
+Outbound HTTP Client
+One keep-alive requests.Session per remote host, shared by every
+integration in the worker (GitHub, Kasm, Gemini, Groq, stock quotes).
+Calls get default timeouts and a urllib3 retry policy, and each host
+keeps latency and error metrics for /api/health/http.
+
+The interface mirrors `requests` (get/post/request return a Response and
+raise requests exceptions), so callers only swap the module they call.
+"""
+import os
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from __init__ import app
+
+
+app.config.setdefault('HTTP_CONNECT_TIMEOUT', float(os.environ.get('HTTP_CONNECT_TIMEOUT') or 5))
+app.config.setdefault('HTTP_READ_TIMEOUT', float(os.environ.get('HTTP_READ_TIMEOUT') or 30))
+app.config.setdefault('HTTP_RETRIES', int(os.environ.get('HTTP_RETRIES') or 2))
+app.config.setdefault('HTTP_BACKOFF', float(os.environ.get('HTTP_BACKOFF') or 0.3))
+app.config.setdefault('HTTP_POOL_SIZE', int(os.environ.get('HTTP_POOL_SIZE') or 10))
+
+# Latency samples kept per host for percentiles
+LATENCY_SAMPLES = 512
+
+
+class HostMetrics:
+    """Request counts, status classes and recent latencies for one host."""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.statuses = {}
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.last_error = None
+        self.lock = threading.Lock()
+
+    def record(self, seconds, status=None, error=None):
+        with self.lock:
+            self.requests += 1
+            self.latencies.append(seconds)
+            if status is not None:
+                key = f'{status // 100}xx'
+                self.statuses[key] = self.statuses.get(key, 0) + 1
+            if error is not None or (status or 0) >= 500:
+                self.errors += 1
+                self.last_error = error or f'HTTP {status}'
+
+    def read(self):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            requests_made, errors = self.requests, self.errors
+            statuses, last_error = dict(self.statuses), self.last_error
+
+        def percentile(p):
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 1) if latencies else None
+
+        return {
+            "requests": requests_made,
+            "errors": errors,
+            "error_rate": round(errors / requests_made, 4) if requests_made else 0,
+            "statuses": statuses,
+            "p50_ms": percentile(0.50),
+            "p95_ms": percentile(0.95),
+            "max_ms": round(latencies[-1] * 1000, 1) if latencies else None,
+            "last_error": last_error,
+        }
+
+
+class HttpClient:
+    """
+    HttpClient
+
+    Sessions are created lazily per scheme://host. A host's retry policy
+    can be overridden with configure() before its first call, e.g. GitHub
+    handles its own rate limits and must never back off inside a worker.
+    """
+
+    def __init__(self):
+        self._sessions = {}
+        self._policies = {}
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def configure(self, host, retries=None, backoff=None, status_forcelist=None):
+        """Override the retry policy for `host` (netloc, e.g. 'api.github.com')."""
+        self._policies[host] = {'retries': retries, 'backoff': backoff, 'status_forcelist': status_forcelist}
+
+    def _retry(self, host):
+        policy = self._policies.get(host, {})
+        retries = policy.get('retries')
+        backoff = policy.get('backoff')
+        status_forcelist = policy.get('status_forcelist')
+        return Retry(
+            total=app.config['HTTP_RETRIES'] if retries is None else retries,
+            backoff_factor=app.config['HTTP_BACKOFF'] if backoff is None else backoff,
+            status_forcelist=(502, 503, 504) if status_forcelist is None else status_forcelist,
+            # Only idempotent methods are retried after the request was sent;
+            # connection failures are retried for every method
+            allowed_methods=frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE']),
+            respect_retry_after_header=False,
+            raise_on_status=False,
+        )
+
+    def _session(self, scheme, host):
+        key = f'{scheme}://{host}'
+        session = self._sessions.get(key)
+        if session is None:
+            with self._lock:
+                session = self._sessions.get(key)
+                if session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=app.config['HTTP_POOL_SIZE'],
+                                          max_retries=self._retry(host))
+                    session.mount(key, adapter)
+                    self._sessions[key] = session
+                    self._metrics.setdefault(host, HostMetrics())
+        return session
+
+    def request(self, method, url, **kwargs):
+        parts = urlsplit(url)
+        session = self._session(parts.scheme, parts.netloc)
+        kwargs.setdefault('timeout', (app.config['HTTP_CONNECT_TIMEOUT'], app.config['HTTP_READ_TIMEOUT']))
+        metrics = self._metrics[parts.netloc]
+        started = time.monotonic()
+        try:
+            response = session.request(method, url, **kwargs)
+        except requests.RequestException as e:
+            metrics.record(time.monotonic() - started, error=e.__class__.__name__)
+            raise
+        metrics.record(time.monotonic() - started, status=response.status_code)
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def stats(self):
+        return {host: metrics.read() for host, metrics in sorted(self._metrics.items())}
+
+
+# Shared client for this worker process
+http_client = HttpClient()
@@ -1,15 +1,25 @@
 """
 Micro Blog Model
-Defines the database schema for micro blog posts with JSON flexibility
+Defines the database schema for micro blog posts with JSON flexibility.
+Reactions and replies live in their own tables, with per-post counters
+on microblogs, so a click is one small insert rather than a rewrite of
+the post's JSON.
 """
 from sqlite3 import IntegrityError
-from sqlalchemy import Text, JSON
+from sqlalchemy import Text, JSON, inspect, insert, text, update, delete, func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm.attributes import flag_modified
 from __init__ import db
+from model.pagination import keyset_page
+from model.microblog_stream import publish
 from datetime import datetime
 import json
 
 
+# Keys that older posts kept inside _data; they are now table backed
+ENGAGEMENT_KEYS = ('reactions', 'replies')
+
+
 
 
 class MicroBlog(db.Model):
@@ -20,6 +30,12 @@ class MicroBlog(db.Model):
    Supports replies, reactions, and custom frontend attributes through JSON storage.
    """
    __tablename__ = 'microblogs'
+   # Newest-first feed pages per topic, per author and overall
+   __table_args__ = (
+       db.Index('ix_microblogs_topic_timestamp', '_topic_id', '_timestamp'),
+       db.Index('ix_microblogs_user_timestamp', '_user_id', '_timestamp'),
+       db.Index('ix_microblogs_timestamp', '_timestamp'),
+   )
 
 
    # Primary Key
@@ -39,6 +55,10 @@ class MicroBlog(db.Model):
    _timestamp = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
    _updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
   
+   # Counters maintained by add_reply/add_reaction/remove_reaction
+   _reply_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+   _reaction_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+  
    # Relationships
    user = db.relationship('User', foreign_keys=[_user_id], backref=db.backref('microblogs', lazy=True))
    topic = db.relationship('Topic', foreign_keys=[_topic_id], backref=db.backref('microblogs', lazy=True))
@@ -60,8 +80,11 @@ class MicroBlog(db.Model):
        self._user_id = user_id
        self._content = content
        self._topic_id = topic_id
-       self._data = data or {}
+       # Reactions and replies are only ever written through their tables
+       self._data = {k: v for k, v in (data or {}).items() if k not in ENGAGEMENT_KEYS}
        self._timestamp = datetime.utcnow()
+       self._reply_count = 0
+       self._reaction_count = 0
 
 
    def create(self):
@@ -69,42 +92,37 @@ class MicroBlog(db.Model):
        try:
            db.session.add(self)
            db.session.commit()
-           return self
        except IntegrityError:
            db.session.rollback()
            return None
        except Exception as e:
            db.session.rollback()
            raise e
+       self._publish('post', self.read)
+       return self
 
 
-   def read(self):
-       """Read micro blog data as a dictionary, including topic key and path if available"""
-       # Get topic info if available
-       topic_key = None
-       topic_path = None
-       if self.topic:
-           topic_key = getattr(self.topic, '_page_key', None)
-           topic_path = getattr(self.topic, '_page_path', None)
-       base_data = {
-           'id': self.id,
-           'userId': self._user_id,
-           'userName': self.user.name if self.user else 'Unknown',
-           'userUid': self.user.uid if self.user else None,
-           'content': self._content,
-           'topicId': self._topic_id,
-           'topicKey': topic_key,
-           'topicPath': topic_path,
-           'timestamp': self._timestamp.isoformat() if self._timestamp else None,
-           'updatedAt': self._updated_at.isoformat() if self._updated_at else None,
-           'characterCount': len(self._content),
-       }
-       # Merge with JSON data, giving priority to base_data for core fields
-       if self._data:
-           merged_data = {**self._data, **base_data}
-       else:
-           merged_data = base_data
-       return merged_data
+   def _publish(self, kind, payload):
+       """Push an event to live viewers of this post's topic page (see model.microblog_stream)"""
+       publish(lambda: self.topic._page_key if self.topic is not None else None, kind, payload)
+
+
+   def read(self, engagement=None):
+       """
+       Read micro blog data as a dictionary, including topic key and path if available.
+      
+       engagement: optional (reactions, replies) already loaded for this post,
+       e.g. by load_engagement for a whole feed page
+       """
+       if engagement is None and not self._has_legacy_engagement():
+           engagement = load_engagement([self.id]).get(self.id)
+       return _serialize(
+           self.id, self._user_id, self._content, self._topic_id, self._data, self._timestamp, self._updated_at,
+           self._reply_count, self._reaction_count,
+           self.user.name if self.user else None, self.user.uid if self.user else None,
+           self.topic._page_key if self.topic else None, self.topic._page_path if self.topic else None,
+           engagement
+       )
 
 
    def update(self, content=None, data=None):
@@ -116,9 +134,11 @@ class MicroBlog(db.Model):
                self._content = content
               
            if data is not None:
+               data = {k: v for k, v in data.items() if k not in ENGAGEMENT_KEYS}
                # Merge new data with existing data
                if self._data:
                    self._data.update(data)
+                   flag_modified(self, '_data')
                else:
                    self._data = data
                   
@@ -130,131 +150,176 @@ class MicroBlog(db.Model):
            raise e
 
 
+   def _has_legacy_engagement(self):
+       return bool(self._data) and any(key in self._data for key in ENGAGEMENT_KEYS)
+
+
+   def _move_legacy_engagement(self):
+       """
+       Copy reactions/replies still stored in _data into their tables and drop
+       them from the JSON; the caller commits. Returns (reactions, replies) moved.
+
+       The post row is locked and re-read first, so concurrent first writes
+       move it once. Reactions by users that no longer exist are dropped and
+       their replies kept without a user, as the tables reference users.id.
+       """
+       if not self._has_legacy_engagement():
+           return 0, 0
+       db.session.refresh(self, with_for_update=True)
+       if not self._has_legacy_engagement():
+           return 0, 0
+       data = dict(self._data)
+       reactions = data.pop('reactions', None)
+       replies = data.pop('replies', None)
+
+       reaction_rows = set()
+       if isinstance(reactions, dict):
+           for reaction_type, user_ids in reactions.items():
+               for user_id in user_ids if isinstance(user_ids, list) else []:
+                   if isinstance(user_id, int):
+                       reaction_rows.add((user_id, str(reaction_type)[:32]))
+       reply_rows = [r for r in replies if isinstance(r, dict) and r.get('content')] if isinstance(replies, list) else []
+
+       from model.user import User
+       user_ids = {user_id for user_id, _ in reaction_rows}
+       user_ids.update(r.get('userId') for r in reply_rows if isinstance(r.get('userId'), int))
+       known = {user_id for (user_id,) in db.session.query(User.id).filter(User.id.in_(user_ids))} if user_ids else set()
+
+       reaction_rows = {row for row in reaction_rows if row[0] in known}
+       for user_id, reaction_type in reaction_rows:
+           db.session.add(MicroBlogReaction(self.id, user_id, reaction_type))
+       for reply in reply_rows:
+           try:
+               timestamp = datetime.fromisoformat(reply.get('timestamp') or '')
+           except (TypeError, ValueError):
+               timestamp = self._timestamp
+           user_id = reply.get('userId') if reply.get('userId') in known else None
+           db.session.add(MicroBlogReply(self.id, user_id, str(reply['content'])[:280], timestamp))
+
+       self._data = data
+       self._reaction_count = len(reaction_rows)
+       self._reply_count = len(reply_rows)
+       flag_modified(self, '_data')
+       db.session.flush()
+       return len(reaction_rows), len(reply_rows)
+
+
    def get_replies(self):
-       """Return replies array; empty list if none or malformed."""
-       if not self._data or 'replies' not in self._data or not isinstance(self._data['replies'], list):
-           return []
-       return self._data['replies']
+       """Return replies oldest first, each with userName for display."""
+       if self._has_legacy_engagement():
+           replies = self._data.get('replies')
+           return replies if isinstance(replies, list) else []
+       return load_engagement([self.id]).get(self.id, ({}, []))[1]
 
 
    def add_reply(self, user_id, reply_content):
-       """Add a reply to the JSON data structure, including userName for display."""
+       """Add a reply row and bump the post's reply counter, returning the reply for display."""
        if len(reply_content) > 280:
            raise ValueError("Reply content must be 280 characters or less")
       
-       if not self._data:
-           self._data = {}
-      
-       if 'replies' not in self._data or not isinstance(self._data['replies'], list):
-           self._data['replies'] = []
-      
-       # Attempt to include userName for frontend display
-       user_name = None
-       try:
-           from model.user import User
-           u = User.query.get(user_id)
-           user_name = u.name if u else None
-       except Exception:
-           user_name = None
-      
-       reply = {
-           'id': len(self._data['replies']) + 1,  # Simple incrementing ID
-           'userId': user_id,
-           'userName': user_name,
-           'content': reply_content,
-           'timestamp': datetime.utcnow().isoformat()
-       }
-      
-       self._data['replies'].append(reply)
-       self._updated_at = datetime.utcnow()
-      
-       flag_modified(self, '_data')
-      
        try:
+           self._move_legacy_engagement()
+           reply = MicroBlogReply(self.id, user_id, reply_content)
+           db.session.add(reply)
+           db.session.execute(
+               update(MicroBlog).where(MicroBlog.id == self.id)
+               .values(_reply_count=MicroBlog._reply_count + 1, _updated_at=datetime.utcnow())
+           )
            db.session.commit()
-           return reply
        except Exception as e:
            db.session.rollback()
            raise e
+      
+       from model.user import User
+       user = User.query.get(user_id)
+       reply = reply.read(user.name if user else None)
+       self._publish('reply', {'microblogId': self.id, 'reply': reply, 'replyCount': self._reply_count})
+       return reply
 
 
    def add_reaction(self, user_id, reaction_type):
-       """Add a reaction (like, heart, etc.) to the JSON data"""
-       if not self._data:
-           self._data = {}
-          
-       if 'reactions' not in self._data:
-           self._data['reactions'] = {}
-          
-       if reaction_type not in self._data['reactions']:
-           self._data['reactions'][reaction_type] = []
-          
-       # Remove user's previous reaction of this type if exists
-       self._data['reactions'][reaction_type] = [
-           uid for uid in self._data['reactions'][reaction_type] if uid != user_id
-       ]
-      
-       # Add new reaction
-       self._data['reactions'][reaction_type].append(user_id)
-       self._updated_at = datetime.utcnow()
-      
-       # CRITICAL: Mark the _data column as modified for SQLAlchemy
-       flag_modified(self, '_data')
-      
+       """Record a reaction (like, heart, etc.); reacting twice with the same type is a no-op"""
+       values = {'_microblog_id': self.id, '_user_id': user_id, '_reaction_type': reaction_type, '_created_at': datetime.utcnow()}
+       if db.engine.dialect.name == 'sqlite':
+           stmt = sqlite_insert(MicroBlogReaction).values(**values).on_conflict_do_nothing()
+       else:
+           stmt = insert(MicroBlogReaction).values(**values).prefix_with('IGNORE')
        try:
+           self._move_legacy_engagement()
+           added = db.session.execute(stmt).rowcount
+           if added:
+               db.session.execute(
+                   update(MicroBlog).where(MicroBlog.id == self.id)
+                   .values(_reaction_count=MicroBlog._reaction_count + 1, _updated_at=datetime.utcnow())
+               )
            db.session.commit()
-           db.session.refresh(self)
-           return True
        except Exception as e:
            db.session.rollback()
            raise e
+       if added:
+           self._publish_reaction(user_id, reaction_type, added)
+       return True
 
 
    def remove_reaction(self, user_id, reaction_type):
-       """Remove a reaction from the JSON data"""
-       if not self._data or 'reactions' not in self._data:
-           return False
-          
-       if reaction_type in self._data['reactions']:
-           self._data['reactions'][reaction_type] = [
-               uid for uid in self._data['reactions'][reaction_type] if uid != user_id
-           ]
-           self._updated_at = datetime.utcnow()
-          
-           flag_modified(self, '_data')
-          
-           try:
-               db.session.commit()
-               db.session.refresh(self)
-               return True
-           except Exception as e:
-               db.session.rollback()
-               raise e
-      
-       return False
+       """Remove a reaction; False if the user had not reacted with that type"""
+       try:
+           self._move_legacy_engagement()
+           removed = db.session.execute(
+               delete(MicroBlogReaction).where(
+                   MicroBlogReaction._microblog_id == self.id,
+                   MicroBlogReaction._user_id == user_id,
+                   MicroBlogReaction._reaction_type == reaction_type
+               )
+           ).rowcount
+           if removed:
+               db.session.execute(
+                   update(MicroBlog).where(MicroBlog.id == self.id)
+                   .values(_reaction_count=MicroBlog._reaction_count - removed, _updated_at=datetime.utcnow())
+               )
+           db.session.commit()
+       except Exception as e:
+           db.session.rollback()
+           raise e
+       if removed:
+           self._publish_reaction(user_id, reaction_type, -removed)
+       return bool(removed)
+
+
+   def _publish_reaction(self, user_id, reaction_type, delta):
+       self._publish('reaction', {
+           'microblogId': self.id,
+           'userId': user_id,
+           'reactionType': reaction_type,
+           'delta': delta,
+           'reactionCount': self._reaction_count
+       })
   
    def get_reactions(self):
-       """Return reactions dictionary; empty dict if none or malformed."""
-       if not self._data or 'reactions' not in self._data or not isinstance(self._data['reactions'], dict):
-           return {}
-       return self._data['reactions']
+       """Return {reaction type: [user ids]}; empty dict if none."""
+       if self._has_legacy_engagement():
+           reactions = self._data.get('reactions')
+           return reactions if isinstance(reactions, dict) else {}
+       return load_engagement([self.id]).get(self.id, ({}, []))[0]
 
 
    def get_reaction_counts(self):
        """Return a dictionary with reaction counts"""
-       reactions = self.get_reactions()
-       reaction_counts = {}
-       for reaction_type, user_ids in reactions.items():
-           reaction_counts[reaction_type] = len(user_ids)
-       return reaction_counts
+       if self._has_legacy_engagement():
+           return {reaction_type: len(user_ids) for reaction_type, user_ids in self.get_reactions().items()}
+       rows = db.session.query(MicroBlogReaction._reaction_type, func.count()) \
+           .filter(MicroBlogReaction._microblog_id == self.id) \
+           .group_by(MicroBlogReaction._reaction_type).all()
+       return dict(rows)
 
 
    def user_has_reacted(self, user_id, reaction_type):
        """Check if a user has already reacted with a specific reaction type"""
-       reactions = self.get_reactions()
-       if reaction_type not in reactions:
-           return False
-       return user_id in reactions[reaction_type]
+       if self._has_legacy_engagement():
+           return user_id in self.get_reactions().get(reaction_type, [])
+       return db.session.query(MicroBlogReaction.id).filter_by(
+           _microblog_id=self.id, _user_id=user_id, _reaction_type=reaction_type
+       ).first() is not None
 
 
    def toggle_reaction(self, user_id, reaction_type):
@@ -266,8 +331,10 @@ class MicroBlog(db.Model):
 
 
    def delete(self):
-       """Delete the micro blog post"""
+       """Delete the micro blog post with its reactions and replies"""
        try:
+           MicroBlogReaction.query.filter_by(_microblog_id=self.id).delete()
+           MicroBlogReply.query.filter_by(_microblog_id=self.id).delete()
            db.session.delete(self)
            db.session.commit()
            return True
@@ -283,31 +350,213 @@ class MicroBlog(db.Model):
 
 
    @staticmethod
-   def get_all(limit=50):
-       """Get all micro blog posts (most recent first)"""
-       microblogs = MicroBlog.query.order_by(MicroBlog._timestamp.desc()).limit(limit).all()
-       return [microblog.read() for microblog in microblogs]
+   def get_all(limit=50, cursor=None):
+       """Get a page of all micro blog posts (most recent first); returns (posts, next_cursor)"""
+       return get_feed(limit=limit, cursor=cursor)
 
 
    @staticmethod
-   def get_by_topic(topic_id, limit=50):
-       """Get all micro blog posts for a specific topic"""
-       microblogs = MicroBlog.query.filter_by(_topic_id=topic_id).order_by(MicroBlog._timestamp.desc()).limit(limit).all()
-       return [microblog.read() for microblog in microblogs]
+   def get_by_topic(topic_id, limit=50, cursor=None):
+       """Get a page of micro blog posts for a specific topic; returns (posts, next_cursor)"""
+       return get_feed(MicroBlog._topic_id == topic_id, limit=limit, cursor=cursor)
 
 
    @staticmethod
-   def get_by_user(user_id, limit=50):
-       """Get all micro blog posts by a specific user"""
-       microblogs = MicroBlog.query.filter_by(_user_id=user_id).order_by(MicroBlog._timestamp.desc()).limit(limit).all()
-       return [microblog.read() for microblog in microblogs]
+   def get_by_user(user_id, limit=50, cursor=None):
+       """Get a page of micro blog posts by a specific user; returns (posts, next_cursor)"""
+       return get_feed(MicroBlog._user_id == user_id, limit=limit, cursor=cursor)
 
 
    @staticmethod
    def search_content(search_term, limit=50):
-       """Search micro blog posts by content"""
-       microblogs = MicroBlog.query.filter(MicroBlog._content.contains(search_term)).order_by(MicroBlog._timestamp.desc()).limit(limit).all()
-       return [microblog.read() for microblog in microblogs]
+       """Full-text search of micro blog posts by content, best match first"""
+       # Import here to avoid circular import
+       from model.microblog_search import search_microblogs
+       return search_microblogs(search_term, limit)
+
+
+
+
+class MicroBlogReaction(db.Model):
+   """One user's reaction of one type to a post"""
+   __tablename__ = 'microblog_reactions'
+   __table_args__ = (
+       db.UniqueConstraint('_microblog_id', '_user_id', '_reaction_type', name='uq_microblog_reaction'),
+   )
+  
+   id = db.Column(db.Integer, primary_key=True)
+   _microblog_id = db.Column(db.Integer, db.ForeignKey('microblogs.id', ondelete='CASCADE'), nullable=False)
+   _user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+   _reaction_type = db.Column(db.String(32), nullable=False)
+   _created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+  
+   def __init__(self, microblog_id, user_id, reaction_type):
+       self._microblog_id = microblog_id
+       self._user_id = user_id
+       self._reaction_type = reaction_type
+       self._created_at = datetime.utcnow()
+
+
+
+
+class MicroBlogReply(db.Model):
+   """A reply to a post"""
+   __tablename__ = 'microblog_replies'
+   __table_args__ = (db.Index('ix_microblog_replies_post', '_microblog_id', 'id'),)
+  
+   id = db.Column(db.Integer, primary_key=True)
+   _microblog_id = db.Column(db.Integer, db.ForeignKey('microblogs.id', ondelete='CASCADE'), nullable=False)
+   _user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+   _content = db.Column(db.String(280), nullable=False)
+   _timestamp = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+  
+   def __init__(self, microblog_id, user_id, content, timestamp=None):
+       self._microblog_id = microblog_id
+       self._user_id = user_id
+       self._content = content
+       self._timestamp = timestamp or datetime.utcnow()
+  
+   def read(self, user_name=None):
+       return {
+           'id': self.id,
+           'userId': self._user_id,
+           'userName': user_name,
+           'content': self._content,
+           'timestamp': self._timestamp.isoformat() if self._timestamp else None
+       }
+
+
+
+
+def _serialize(id, user_id, content, topic_id, data, timestamp, updated_at, reply_count, reaction_count,
+               user_name, user_uid, topic_key, topic_path, engagement=None):
+   """The read() dictionary for one post, built from plain column values."""
+   base_data = {
+       'id': id,
+       'userId': user_id,
+       'userName': user_name or 'Unknown',
+       'userUid': user_uid,
+       'content': content,
+       'topicId': topic_id,
+       'topicKey': topic_key,
+       'topicPath': topic_path,
+       'timestamp': timestamp.isoformat() if timestamp else None,
+       'updatedAt': updated_at.isoformat() if updated_at else None,
+       'characterCount': len(content),
+       'replyCount': reply_count or 0,
+       'reactionCount': reaction_count or 0,
+   }
+   if data and any(key in data for key in ENGAGEMENT_KEYS):
+       # Not yet moved to the tables (see backfill_engagement)
+       reactions, replies = data.get('reactions') or {}, data.get('replies') or []
+   else:
+       reactions, replies = engagement or ({}, [])
+   base_data['reactions'] = reactions
+   base_data['replies'] = replies
+   # Merge with JSON data, giving priority to base_data for core fields
+   if data:
+       return {**data, **base_data}
+   return base_data
+
+
+def get_feed(*criteria, limit=50, cursor=None):
+   """
+   One page of serialized posts matching criteria, most recent first.
+   Returns (posts, next_cursor); see model.pagination for the cursor.
+  
+   Posts, authors and topics come back from one joined projection and
+   reactions/replies from two more queries, so a page costs three
+   statements whatever its size and no ORM objects are built.
+   """
+   rows, next_cursor = keyset_page(feed_query().filter(*criteria), MicroBlog._timestamp, MicroBlog.id, cursor, limit,
+                                   key=lambda row: (row._timestamp, row.id))
+   return serialize_feed(rows), next_cursor
+
+
+def feed_query():
+   """The feed projection: post columns plus author name/uid and topic key/path, in _serialize's order."""
+   from model.user import User
+   return db.session.query(
+       MicroBlog.id, MicroBlog._user_id, MicroBlog._content, MicroBlog._topic_id, MicroBlog._data,
+       MicroBlog._timestamp, MicroBlog._updated_at, MicroBlog._reply_count, MicroBlog._reaction_count,
+       User._name, User._uid, Topic._page_key, Topic._page_path
+   ).outerjoin(User, User.id == MicroBlog._user_id) \
+       .outerjoin(Topic, Topic.id == MicroBlog._topic_id)
+
+
+def serialize_feed(rows):
+   """Serialize feed_query rows, loading their reactions and replies in two queries."""
+   engagement = load_engagement([row[0] for row in rows])
+   return [_serialize(*row, engagement[row[0]]) for row in rows]
+
+
+def load_engagement(microblog_ids):
+   """
+   Reactions and replies for many posts in two queries.
+  
+   Returns {microblog_id: (reactions, replies)} where reactions is
+   {reaction type: [user ids]} and replies are oldest first.
+   """
+   from model.user import User
+   engagement = {microblog_id: ({}, []) for microblog_id in microblog_ids}
+   if not engagement:
+       return engagement
+   reactions = db.session.query(
+       MicroBlogReaction._microblog_id, MicroBlogReaction._reaction_type, MicroBlogReaction._user_id
+   ).filter(MicroBlogReaction._microblog_id.in_(engagement)).order_by(MicroBlogReaction.id)
+   for microblog_id, reaction_type, user_id in reactions:
+       engagement[microblog_id][0].setdefault(reaction_type, []).append(user_id)
+   replies = db.session.query(
+       MicroBlogReply._microblog_id, MicroBlogReply.id, MicroBlogReply._user_id, User._name,
+       MicroBlogReply._content, MicroBlogReply._timestamp
+   ).outerjoin(User, User.id == MicroBlogReply._user_id) \
+       .filter(MicroBlogReply._microblog_id.in_(engagement)).order_by(MicroBlogReply.id)
+   for microblog_id, reply_id, user_id, user_name, content, timestamp in replies:
+       engagement[microblog_id][1].append({
+           'id': reply_id,
+           'userId': user_id,
+           'userName': user_name,
+           'content': content,
+           'timestamp': timestamp.isoformat() if timestamp else None
+       })
+   return engagement
+
+
+def backfill_engagement(batch_size=500):
+   """Move reactions/replies still stored in microblogs._data into their tables."""
+   moved = {'posts': 0, 'reactions': 0, 'replies': 0}
+   last_id = 0
+   while True:
+       posts = MicroBlog.query.filter(MicroBlog.id > last_id).order_by(MicroBlog.id).limit(batch_size).all()
+       if not posts:
+           break
+       for post in posts:
+           if not post._has_legacy_engagement():
+               continue
+           reactions, replies = post._move_legacy_engagement()
+           moved['posts'] += 1
+           moved['reactions'] += reactions
+           moved['replies'] += replies
+       db.session.commit()
+       last_id = posts[-1].id
+   return moved
+
+
+def upgrade_microblog_schema():
+   """Create the engagement tables and add the counter columns to an existing microblogs table."""
+   db.create_all()
+   try:
+       columns = {column['name'] for column in inspect(db.engine).get_columns('microblogs')}
+       for name in ('_reply_count', '_reaction_count'):
+           if name not in columns:
+               db.session.execute(text(f'ALTER TABLE microblogs ADD COLUMN {name} INTEGER NOT NULL DEFAULT 0'))
+       db.session.commit()
+       # create_all only indexes new tables
+       for index in MicroBlog.__table__.indexes:
+           index.create(bind=db.engine, checkfirst=True)
+   except Exception as e:
+       db.session.rollback()
+       print(f"Microblog schema upgrade skipped: {e}")
 
 
 
@@ -420,8 +669,8 @@ class Topic(db.Model):
            db.session.rollback()
            raise e
   
-   def read(self):
-       """Read topic data as dictionary"""
+   def read(self, post_count=None):
+       """Read topic data as dictionary; post_count may be supplied by a grouped count"""
        return {
            'id': self.id,
            'pageKey': self._page_key,
@@ -436,7 +685,7 @@ class Topic(db.Model):
            'maxPostsPerUser': self._max_posts_per_user,
            'isActive': self._is_active,
            'settings': self._settings,
-           'postCount': len(self.microblogs),
+           'postCount': MicroBlog.query.filter_by(_topic_id=self.id).count() if post_count is None else post_count,
            'createdAt': self._created_at.isoformat() if self._created_at else None,
            'updatedAt': self._updated_at.isoformat() if self._updated_at else None
        }
@@ -453,16 +702,13 @@ class Topic(db.Model):
        current_count = self.get_user_post_count(user_id)
        return current_count < self._max_posts_per_user
   
-   def get_recent_posts(self, limit=10, user_id=None):
-       """Get recent posts for this topic"""
-       query = MicroBlog.query.filter_by(_topic_id=self.id)
-      
+   def get_recent_posts(self, limit=10, user_id=None, cursor=None):
+       """Get a page of recent posts for this topic; returns (posts, next_cursor)"""
        # If not allowing anonymous and no user_id, return empty
        if not self._allow_anonymous and not user_id:
-           return []
+           return [], None
       
-       posts = query.order_by(MicroBlog._timestamp.desc()).limit(limit).all()
-       return [post.read() for post in posts]
+       return get_feed(MicroBlog._topic_id == self.id, limit=limit, cursor=cursor)
   
    @staticmethod
    def get_by_page_path(page_path):
@@ -497,28 +743,34 @@ class Topic(db.Model):
            print(f"Error in get_or_create_for_page: {str(e)}")
            return None
   
+   @staticmethod
+   def _read_all(topics):
+       """read() for many topics with one grouped post count"""
+       counts = dict(
+           db.session.query(MicroBlog._topic_id, func.count(MicroBlog.id))
+           .filter(MicroBlog._topic_id.in_([topic.id for topic in topics]))
+           .group_by(MicroBlog._topic_id).all()
+       ) if topics else {}
+       return [topic.read(post_count=counts.get(topic.id, 0)) for topic in topics]
+  
    @staticmethod
    def get_all_active():
        """Get all active topics"""
        topics = Topic.query.filter_by(_is_active=True).order_by(Topic._page_title).all()
-       return [topic.read() for topic in topics]
+       return Topic._read_all(topics)
   
    @staticmethod
    def get_all():
        """Get all topics (including inactive)"""
        topics = Topic.query.order_by(Topic._page_title).all()
-       return [topic.read() for topic in topics]
+       return Topic._read_all(topics)
   
    @staticmethod
    def search_by_title(search_term):
-       """Search topics by title or description"""
-       topics = Topic.query.filter(
-           db.or_(
-               Topic._page_title.contains(search_term),
-               Topic._page_description.contains(search_term)
-           )
-       ).filter_by(_is_active=True).all()
-       return [topic.read() for topic in topics]
+       """Full-text search of active topics by title, description or display name"""
+       # Import here to avoid circular import
+       from model.microblog_search import search_topics
+       return search_topics(search_term)
 
 
 
@@ -630,9 +882,7 @@ def init_microblogs():
                "data": {
                    "lessonProgress": "completed",
                    "rating": 5,
-                   "hashtags": ["flask", "python", "webdev"],
-                   "reactions": {"👍": [], "🎉": []},
-                   "replies": []
+                   "hashtags": ["flask", "python", "webdev"]
                }
            },
            {
@@ -641,9 +891,7 @@ def init_microblogs():
                "data": {
                    "helpRequested": True,
                    "difficulty": "medium",
-                   "hashtags": ["javascript", "arrays", "help"],
-                   "reactions": {"🤔": [], "💡": []},
-                   "replies": []
+                   "hashtags": ["javascript", "arrays", "help"]
                }
            },
            {
@@ -653,9 +901,7 @@ def init_microblogs():
                    "projectType": "react",
                    "features": ["dark-mode", "responsive"],
                    "seeking": "feedback",
-                   "hashtags": ["portfolio", "react", "showcase"],
-                   "reactions": {"❤️": [], "🔥": []},
-                   "replies": []
+                   "hashtags": ["portfolio", "react", "showcase"]
                }
            },
            {
@@ -666,9 +912,7 @@ def init_microblogs():
                    "tasks": ["database-models", "api-planning", "quiz-prep"],
                    "blockers": [],
                    "mood": "productive",
-                   "hashtags": ["standup", "progress"],
-                   "reactions": {"💪": []},
-                   "replies": []
+                   "hashtags": ["standup", "progress"]
                }
            },
            {
@@ -679,9 +923,7 @@ def init_microblogs():
                    "resourceUrl": "https://developer.mozilla.org",
                    "subject": "javascript",
                    "recommendation": True,
-                   "hashtags": ["resources", "javascript", "documentation"],
-                   "reactions": {"📚": [], "👍": []},
-                   "replies": []
+                   "hashtags": ["resources", "javascript", "documentation"]
                }
            }
        ]
@@ -0,0 +1,188 @@
+"""
+MicroBlog Search
+Full-text search over microblog content and topic titles. On SQLite the
+text is indexed by FTS5 external-content tables that triggers keep in
+step with microblogs and topics on every insert, update and delete; on
+MySQL FULLTEXT indexes on the same columns do the job. Results are
+ranked (bm25 / MATCH relevance), every search word matches as a prefix,
+and each hit carries an HTML-escaped highlight with <mark> around the
+matched words. Without either index, search falls back to LIKE.
+"""
+import html
+import re
+
+from sqlalchemy import inspect, text
+
+from __init__ import db
+from model.microblog import MicroBlog, Topic, feed_query, serialize_feed
+from model.pagination import clamp_limit
+
+
+# Words beyond this many are ignored
+MAX_TERMS = 8
+
+_WORD = re.compile(r'\w+')
+# Markers FTS5 wraps around matches before the text is HTML-escaped
+_OPEN, _CLOSE = '\x02', '\x03'
+
+# Indexed tables: name -> (FTS5 table, content table, columns)
+_INDEXES = {
+    'microblogs': ('microblog_fts', 'microblogs', ('_content',)),
+    'topics': ('topic_fts', 'topics', ('_page_title', '_page_description', '_display_name')),
+}
+# Rows a search may return, applied inside the ranked query so that
+# excluded rows never take up the LIMIT
+_VISIBLE = {
+    'topics': 'topics._is_active = 1',
+}
+# bm25 weights for the topic columns: titles count most
+_TOPIC_WEIGHTS = (10.0, 1.0, 5.0)
+
+# 'fts5', 'fulltext' or 'like'; settled by ensure_search_index
+_backend = None
+
+
+def _ensure_fts5(fts, table, columns):
+    """Create the FTS5 table and its sync triggers; rebuild the index when the triggers were missing."""
+    had_triggers = db.session.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = :name"), {'name': f'{fts}_ai'}
+    ).first()
+    names = ', '.join(columns)
+    new = ', '.join(f'new.{column}' for column in columns)
+    old = ', '.join(f'old.{column}' for column in columns)
+    db.session.execute(text(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({names}, content='{table}', content_rowid='id', "
+        f"tokenize='unicode61 remove_diacritics 2')"
+    ))
+    db.session.execute(text(
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {new}); END"
+    ))
+    db.session.execute(text(
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.id, {old}); END"
+    ))
+    db.session.execute(text(
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {names} ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.id, {old}); "
+        f"INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {new}); END"
+    ))
+    if not had_triggers:
+        # Rows written while there was no trigger (or before the index existed)
+        db.session.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+
+
+def _ensure_fulltext(table, columns):
+    index = f'ft_{table}'
+    if index not in {ix['name'] for ix in inspect(db.engine).get_indexes(table)}:
+        db.session.execute(text(f"ALTER TABLE {table} ADD FULLTEXT INDEX {index} ({', '.join(columns)})"))
+
+
+def ensure_search_index():
+    """Create or repair the search indexes for this database; returns the backend in use."""
+    global _backend
+    dialect = db.engine.dialect.name
+    try:
+        for fts, table, columns in _INDEXES.values():
+            if dialect == 'sqlite':
+                _ensure_fts5(fts, table, columns)
+            elif dialect in ('mysql', 'mariadb'):
+                _ensure_fulltext(table, columns)
+        db.session.commit()
+        _backend = {'sqlite': 'fts5', 'mysql': 'fulltext', 'mariadb': 'fulltext'}.get(dialect, 'like')
+    except Exception as e:
+        db.session.rollback()
+        print(f"Search index unavailable, falling back to LIKE: {e}")
+        _backend = 'like'
+    return _backend
+
+
+def _terms(search_term):
+    return _WORD.findall(search_term or '')[:MAX_TERMS]
+
+
+def _fts5_highlight(value):
+    if value is None:
+        return None
+    return html.escape(value).replace(_OPEN, '<mark>').replace(_CLOSE, '</mark>')
+
+
+def _highlight(value, terms):
+    """Python highlighting for the FULLTEXT and LIKE backends, matching words that start with a term."""
+    if not value:
+        return value
+    pattern = re.compile(r'\b(?:' + '|'.join(re.escape(term) for term in terms) + r')\w*', re.IGNORECASE)
+    parts, last = [], 0
+    for match in pattern.finditer(value):
+        parts.append(html.escape(value[last:match.start()]))
+        parts.append(f'<mark>{html.escape(match.group(0))}</mark>')
+        last = match.end()
+    parts.append(html.escape(value[last:]))
+    return ''.join(parts)
+
+
+def _hits(name, terms, limit):
+    """
+    [(id, score, [highlight per column])] best first.
+
+    score is higher-is-better for fts5 and fulltext, None for the LIKE fallback.
+    """
+    fts, table, columns = _INDEXES[name]
+    visible = f' AND {_VISIBLE[name]}' if name in _VISIBLE else ''
+    backend = _backend or ensure_search_index()
+    if backend == 'fts5':
+        weights = ', ' + ', '.join(map(str, _TOPIC_WEIGHTS)) if name == 'topics' else ''
+        highlights = ', '.join(f'highlight({fts}, {i}, :open, :close)' for i in range(len(columns)))
+        join = f'JOIN {table} ON {table}.id = {fts}.rowid ' if visible else ''
+        rows = db.session.execute(text(
+            f"SELECT {fts}.rowid, bm25({fts}{weights}) AS score, {highlights} FROM {fts} {join}"
+            f"WHERE {fts} MATCH :query{visible} ORDER BY score LIMIT :limit"
+        ), {'query': ' '.join(f'"{term}"*' for term in terms), 'open': _OPEN, 'close': _CLOSE, 'limit': limit}).all()
+        return [(row[0], round(-row[1], 4), [_fts5_highlight(value) for value in row[2:]]) for row in rows]
+
+    names = ', '.join(columns)
+    if backend == 'fulltext':
+        rows = db.session.execute(text(
+            f"SELECT id, MATCH({names}) AGAINST (:query IN BOOLEAN MODE) AS score, {names} FROM {table} "
+            f"WHERE MATCH({names}) AGAINST (:query IN BOOLEAN MODE){visible} ORDER BY score DESC LIMIT :limit"
+        ), {'query': ' '.join(f'+{term}*' for term in terms), 'limit': limit}).all()
+        return [(row[0], round(float(row[1]), 4), [_highlight(value, terms) for value in row[2:]]) for row in rows]
+
+    # Every term must appear in some indexed column
+    params = {f't{i}': f'%{term}%' for i, term in enumerate(terms)}
+    where = ' AND '.join('(' + ' OR '.join(f'{column} LIKE :t{i}' for column in columns) + ')' for i in range(len(terms)))
+    rows = db.session.execute(text(
+        f"SELECT id, {names} FROM {table} WHERE {where}{visible} ORDER BY id DESC LIMIT :limit"
+    ), {**params, 'limit': limit}).all()
+    return [(row[0], None, [_highlight(value, terms) for value in row[1:]]) for row in rows]
+
+
+def search_microblogs(search_term, limit=50):
+    """Serialized posts matching every word of search_term (as prefixes), best match first."""
+    terms = _terms(search_term)
+    if not terms:
+        return []
+    hits = _hits('microblogs', terms, clamp_limit(limit))
+    posts = {post['id']: post for post in serialize_feed(feed_query().filter(MicroBlog.id.in_([hit[0] for hit in hits])).all())}
+    results = []
+    for microblog_id, score, (content,) in hits:
+        if microblog_id in posts:
+            results.append({**posts[microblog_id], 'score': score, 'highlight': {'content': content}})
+    return results
+
+
+def search_topics(search_term, limit=50):
+    """Active topics whose title, description or display name match every word, best match first."""
+    terms = _terms(search_term)
+    if not terms:
+        return []
+    hits = _hits('topics', terms, clamp_limit(limit))
+    topics = Topic.query.filter(Topic.id.in_([hit[0] for hit in hits])).all()
+    read = {topic['id']: topic for topic in Topic._read_all(topics)}
+    results = []
+    for topic_id, score, (title, description, display_name) in hits:
+        if topic_id in read:
+            results.append({**read[topic_id], 'score': score, 'highlight': {
+                'pageTitle': title, 'pageDescription': description, 'displayName': display_name
+            }})
+    return results
@@ -0,0 +1,254 @@
+"""
+MicroBlog Live Stream
+Pushes new posts, replies and reaction-count changes to clients viewing
+a topic page (Topic._page_key) as server-sent events, so embedded
+discussions no longer poll for updates.
+
+Events are appended to a small SQLite log in the shared DATA_FOLDER, so
+every gunicorn worker on the host sees every event. Each worker runs one
+tail thread that reads new log rows and fans them out to its own
+in-process subscribers; a publish in the same worker wakes the tail at
+once and other workers pick it up within MICROBLOG_STREAM_POLL seconds.
+Event ids are log ids, so a reconnecting EventSource resumes from its
+Last-Event-ID without missing anything still in the log.
+
+Each open stream holds a gthread worker thread, so streams per worker are
+capped. Past the cap the endpoint answers 503 with Retry-After, which
+ends the EventSource; the page keeps its existing polling instead.
+"""
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from __init__ import app
+
+
+app.config.setdefault('MICROBLOG_STREAM_PATH', os.path.join(app.config['DATA_FOLDER'], 'microblog_events.db'))
+# Seconds between log reads for events published by other workers
+app.config.setdefault('MICROBLOG_STREAM_POLL', float(os.environ.get('MICROBLOG_STREAM_POLL') or 0.25))
+# Seconds events stay in the log for reconnecting clients
+app.config.setdefault('MICROBLOG_STREAM_RETENTION', int(os.environ.get('MICROBLOG_STREAM_RETENTION') or 600))
+# Open streams per worker; each one holds a worker thread
+app.config.setdefault('MICROBLOG_STREAM_MAX_CLIENTS', int(os.environ.get('MICROBLOG_STREAM_MAX_CLIENTS') or 4))
+# Seconds a stream stays open before the client is told to reconnect
+app.config.setdefault('MICROBLOG_STREAM_SECONDS', int(os.environ.get('MICROBLOG_STREAM_SECONDS') or 300))
+
+# Comment lines sent on idle streams so proxies keep them open
+HEARTBEAT_SECONDS = 15
+# Milliseconds an EventSource waits before reconnecting
+RECONNECT_MS = 3000
+# Retry-After seconds sent with the 503 when a worker is full
+BUSY_RETRY_AFTER = 60
+# Events buffered per subscriber; a client that falls further behind is
+# disconnected and catches up from the log when it reconnects
+QUEUE_SIZE = 100
+REPLAY_LIMIT = 500
+
+
+class MicroblogEventLog:
+    """Append-only event log shared by the workers on this host."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS microblog_events ('
+                ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+                ' page_key TEXT NOT NULL,'
+                ' kind TEXT NOT NULL,'
+                ' payload TEXT NOT NULL,'
+                ' created_at REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_microblog_events_page ON microblog_events (page_key, id)')
+            self._local.conn = conn
+        return conn
+
+    def append(self, page_key, kind, payload):
+        return self._connect().execute(
+            'INSERT INTO microblog_events (page_key, kind, payload, created_at) VALUES (?, ?, ?, ?)',
+            (page_key, kind, json.dumps(payload, default=str), time.time())
+        ).lastrowid
+
+    def read_after(self, last_id, page_key=None, limit=REPLAY_LIMIT):
+        """[(id, page_key, kind, payload json)] after last_id, oldest first."""
+        if page_key is None:
+            sql, args = 'SELECT id, page_key, kind, payload FROM microblog_events WHERE id > ?', (last_id,)
+        else:
+            sql, args = ('SELECT id, page_key, kind, payload FROM microblog_events WHERE page_key = ? AND id > ?',
+                         (page_key, last_id))
+        return self._connect().execute(sql + ' ORDER BY id LIMIT ?', args + (limit,)).fetchall()
+
+    def last_id(self):
+        return self._connect().execute('SELECT COALESCE(MAX(id), 0) FROM microblog_events').fetchone()[0]
+
+    def prune(self, max_age):
+        return self._connect().execute(
+            'DELETE FROM microblog_events WHERE created_at < ?', (time.time() - max_age,)
+        ).rowcount
+
+
+class _Subscription:
+    def __init__(self, page_key):
+        self.page_key = page_key
+        self.queue = queue.Queue(QUEUE_SIZE)
+        self.overflowed = False
+
+
+class MicroblogBroker:
+    """
+    MicroblogBroker
+
+    In-process fan-out on top of the shared log. The tail thread runs only
+    while this worker has subscribers; `_last_id` is the last log id it
+    has delivered, or None while it is idle.
+    """
+
+    def __init__(self, log):
+        self.log = log
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._last_id = None
+        self._thread = None
+        self._published = 0
+
+    def publish(self, page_key, kind, payload):
+        event_id = self.log.append(page_key, kind, payload)
+        self._wake.set()
+        self._published += 1
+        if self._published % 200 == 0:
+            self.log.prune(app.config['MICROBLOG_STREAM_RETENTION'])
+        return event_id
+
+    def subscribe(self, page_key):
+        """A new subscription, or None when this worker already serves MICROBLOG_STREAM_MAX_CLIENTS streams."""
+        with self._lock:
+            if sum(len(subs) for subs in self._subscribers.values()) >= app.config['MICROBLOG_STREAM_MAX_CLIENTS']:
+                return None
+            if self._last_id is None:
+                self._last_id = self.log.last_id()
+            subscription = _Subscription(page_key)
+            self._subscribers.setdefault(page_key, set()).add(subscription)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='microblog-stream', daemon=True)
+                self._thread.start()
+        self._wake.set()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subs = self._subscribers.get(subscription.page_key)
+            if subs is not None:
+                subs.discard(subscription)
+                if not subs:
+                    del self._subscribers[subscription.page_key]
+
+    def _run(self):
+        while True:
+            self._wake.wait(app.config['MICROBLOG_STREAM_POLL'])
+            self._wake.clear()
+            with self._lock:
+                if not self._subscribers:
+                    # Idle until the next subscribe restarts us from the log's end
+                    self._last_id = None
+                    self._thread = None
+                    return
+                last_id = self._last_id
+            try:
+                rows = self.log.read_after(last_id)
+            except sqlite3.Error as e:
+                print(f"Microblog stream read failed: {e}")
+                continue
+            if not rows:
+                continue
+            with self._lock:
+                for event_id, page_key, kind, payload in rows:
+                    for subscription in list(self._subscribers.get(page_key, ())):
+                        try:
+                            subscription.queue.put_nowait((event_id, kind, payload))
+                        except queue.Full:
+                            subscription.overflowed = True
+                self._last_id = rows[-1][0]
+            if len(rows) == REPLAY_LIMIT:
+                self._wake.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pages": len(self._subscribers),
+                "clients": sum(len(subs) for subs in self._subscribers.values()),
+                "last_id": self._last_id,
+            }
+
+
+def _event(event_id, kind, payload):
+    return f'id: {event_id}\nevent: {kind}\ndata: {payload}\n\n'
+
+
+def stream_events(subscription, last_event_id=None):
+    """
+    Server-sent event text for one client, from microblog_broker.subscribe.
+
+    Replays logged events after last_event_id, then yields live ones until
+    MICROBLOG_STREAM_SECONDS pass; the client's EventSource reconnects on
+    its own. The subscription is released when the stream ends.
+    """
+    page_key = subscription.page_key
+    try:
+        yield f'retry: {RECONNECT_MS}\n\n'
+        # Subscribed first, so everything after `delivered` reaches us either way
+        if last_event_id is not None:
+            delivered = last_event_id
+            for event_id, _, kind, payload in microblog_broker.log.read_after(last_event_id, page_key):
+                yield _event(event_id, kind, payload)
+                delivered = event_id
+        else:
+            delivered = microblog_broker.log.last_id()
+
+        deadline = time.monotonic() + app.config['MICROBLOG_STREAM_SECONDS']
+        while not subscription.overflowed:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                event_id, kind, payload = subscription.queue.get(timeout=min(HEARTBEAT_SECONDS, remaining))
+            except queue.Empty:
+                if deadline > time.monotonic():
+                    yield ': ping\n\n'
+                continue
+            if event_id > delivered:
+                yield _event(event_id, kind, payload)
+                delivered = event_id
+    finally:
+        microblog_broker.unsubscribe(subscription)
+
+
+def publish(page_key, kind, payload):
+    """
+    Publish to viewers of page_key; a failure is logged, never raised, so writes are unaffected.
+
+    page_key and payload may be zero-argument callables, so building them
+    after the write's commit is covered by the same guard.
+    """
+    try:
+        page_key = page_key() if callable(page_key) else page_key
+        if not page_key:
+            return None
+        return microblog_broker.publish(page_key, kind, payload() if callable(payload) else payload)
+    except Exception as e:
+        print(f"Microblog stream publish failed: {e}")
+        return None
+
+
+# Shared per-worker broker over the host-wide event log
+microblog_broker = MicroblogBroker(MicroblogEventLog(app.config['MICROBLOG_STREAM_PATH']))
@@ -0,0 +1,57 @@
+"""
+Keyset Pagination
+Cursor pages over (timestamp, id) for the newest-first feeds. A cursor
+names the last row a client has seen, so each page is an index range
+scan from that point instead of an OFFSET that re-reads every earlier
+row. Cursors are opaque to clients: url-safe base64 of "timestamp|id".
+"""
+import base64
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+
+# Page size used when a request does not ask for one, and the most it may ask for
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def clamp_limit(limit):
+    return max(1, min(limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE))
+
+
+def encode_cursor(timestamp, id):
+    raw = f'{timestamp.isoformat()}|{id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(timestamp, id) from a cursor; raises ValueError if it was not made by encode_cursor."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        timestamp, id = raw.split('|')
+        return datetime.fromisoformat(timestamp), int(id)
+    except (ValueError, UnicodeDecodeError, TypeError) as e:
+        raise ValueError('Invalid cursor') from e
+
+
+def keyset_page(query, timestamp_column, id_column, cursor=None, limit=DEFAULT_PAGE_SIZE, key=None):
+    """
+    One newest-first page of query after cursor.
+
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    key(row) gives the row's (timestamp, id), by default row._timestamp and row.id.
+    """
+    limit = clamp_limit(limit)
+    if cursor:
+        timestamp, id = decode_cursor(cursor)
+        query = query.filter(or_(
+            timestamp_column < timestamp,
+            and_(timestamp_column == timestamp, id_column < id)
+        ))
+    rows = query.order_by(timestamp_column.desc(), id_column.desc()).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    key = key or (lambda row: (row._timestamp, row.id))
+    return rows, encode_cursor(*key(rows[-1]))
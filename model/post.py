@@ -4,7 +4,9 @@ Defines the database schema for posts and replies
 """
 from sqlite3 import IntegrityError
 from sqlalchemy import Text
+from sqlalchemy.orm import joinedload
 from __init__ import db
+from model.pagination import keyset_page
 from datetime import datetime
 import json
 
@@ -17,6 +19,12 @@ class Post(db.Model):
     Supports threaded comments through parent-child relationships.
     """
     __tablename__ = 'posts'
+    # Newest-first pages of top-level posts, overall, per page and per author
+    __table_args__ = (
+        db.Index('ix_posts_parent_timestamp', '_parent_id', '_timestamp'),
+        db.Index('ix_posts_page_timestamp', '_page_url', '_timestamp'),
+        db.Index('ix_posts_user_timestamp', '_user_id', '_timestamp'),
+    )
 
     # Primary Key
     id = db.Column(db.Integer, primary_key=True)
@@ -80,10 +88,10 @@ class Post(db.Model):
             db.session.rollback()
             raise e
 
-    def read(self):
-        """Read post data as a dictionary"""
+    def read(self, replies=None):
+        """Read post data as a dictionary; replies may be preloaded by Post._page"""
         # Get all replies (child posts)
-        all_replies = self.replies.all()
+        all_replies = self.replies.all() if replies is None else replies
         
         return {
             'id': self.id,
@@ -144,22 +152,40 @@ class Post(db.Model):
         return Post.query.get(post_id)
 
     @staticmethod
-    def get_all():
-        """Get all top-level posts (not replies)"""
-        posts = Post.query.filter_by(_parent_id=None).order_by(Post._timestamp.desc()).all()
-        return [post.read() for post in posts]
+    def _page(query, cursor, limit):
+        """Read one keyset page of top-level posts, loading authors and replies in two more queries"""
+        posts, next_cursor = keyset_page(query.options(joinedload(Post.user)), Post._timestamp, Post.id, cursor, limit)
+        replies = {post.id: [] for post in posts}
+        if posts:
+            children = Post.query.options(joinedload(Post.user)) \
+                .filter(Post._parent_id.in_(list(replies))).order_by(Post.id).all()
+            for reply in children:
+                replies[reply._parent_id].append(reply)
+        return [post.read(replies[post.id]) for post in posts], next_cursor
+
+    @staticmethod
+    def get_all(cursor=None, limit=50):
+        """Get a page of top-level posts (not replies); returns (posts, next_cursor)"""
+        return Post._page(Post.query.filter_by(_parent_id=None), cursor, limit)
 
     @staticmethod
-    def get_by_page(page_url):
-        """Get all posts for a specific page"""
-        posts = Post.query.filter_by(_page_url=page_url, _parent_id=None).order_by(Post._timestamp.desc()).all()
-        return [post.read() for post in posts]
+    def get_by_page(page_url, cursor=None, limit=50):
+        """Get a page of posts for a specific page; returns (posts, next_cursor)"""
+        return Post._page(Post.query.filter_by(_page_url=page_url, _parent_id=None), cursor, limit)
 
     @staticmethod
-    def get_by_user(user_id):
-        """Get all posts by a specific user"""
-        posts = Post.query.filter_by(_user_id=user_id, _parent_id=None).order_by(Post._timestamp.desc()).all()
-        return [post.read() for post in posts]
+    def get_by_user(user_id, cursor=None, limit=50):
+        """Get a page of posts by a specific user; returns (posts, next_cursor)"""
+        return Post._page(Post.query.filter_by(_user_id=user_id, _parent_id=None), cursor, limit)
+
+
+def ensure_post_indexes():
+    """Add the feed indexes to an existing posts table (create_all only indexes new tables)"""
+    try:
+        for index in Post.__table__.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+    except Exception as e:
+        print(f"Post index creation skipped: {e}")
 
 
 def init_posts():
@@ -0,0 +1,155 @@
+import math
+from array import array
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from __init__ import db
+
+
+# Quantiles are accurate to within 2% of the true value
+RELATIVE_ACCURACY = 0.02
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+_LOG_GAMMA = math.log(GAMMA)
+
+# Longer responses are clamped; together with the log buckets this caps a
+# sketch at ~380 bins (~3KB serialized) however many answers it holds
+MAX_RESPONSE_MS = 60 * 60 * 1000
+MAX_INDEX = math.ceil(math.log(MAX_RESPONSE_MS) / _LOG_GAMMA)
+
+# Upper bounds (ms) of the coarse histogram returned to dashboards
+HISTOGRAM_EDGES_MS = [250, 500, 1000, 2000, 5000, 10000, 30000, 60000]
+
+
+class ResponseSketch:
+    """
+    Log-bucketed response-time sketch (DDSketch style).
+
+    Bucket i counts values in (GAMMA^(i-1), GAMMA^i], so any quantile is
+    reported within RELATIVE_ACCURACY of the truth. Sketches merge by adding
+    bucket counts, and a value can be removed again when an answer is
+    replaced.
+    """
+
+    def __init__(self, bins: dict | None = None):
+        self.bins = bins or {}
+
+    @staticmethod
+    def index(value_ms: int) -> int:
+        value = min(max(value_ms, 1), MAX_RESPONSE_MS)
+        return min(MAX_INDEX, max(0, math.ceil(math.log(value) / _LOG_GAMMA)))
+
+    @staticmethod
+    def value(index: int) -> float:
+        """Representative value of a bucket, minimising relative error."""
+        return 2 * GAMMA ** index / (GAMMA + 1) if index else 1.0
+
+    @property
+    def count(self) -> int:
+        return sum(self.bins.values())
+
+    def add(self, value_ms: int, count: int = 1):
+        i = self.index(value_ms)
+        total = self.bins.get(i, 0) + count
+        if total > 0:
+            self.bins[i] = total
+        else:
+            self.bins.pop(i, None)
+
+    def merge(self, other: 'ResponseSketch'):
+        for i, n in other.bins.items():
+            self.bins[i] = self.bins.get(i, 0) + n
+        return self
+
+    def quantile(self, q: float) -> float | None:
+        total = self.count
+        if not total:
+            return None
+        rank = q * (total - 1)
+        seen = 0
+        for i in sorted(self.bins):
+            seen += self.bins[i]
+            if seen > rank:
+                return round(self.value(i), 1)
+        return round(self.value(max(self.bins)), 1)
+
+    def histogram(self, edges: list = HISTOGRAM_EDGES_MS) -> list:
+        counts = [0] * (len(edges) + 1)
+        for i, n in self.bins.items():
+            value = self.value(i)
+            counts[next((k for k, edge in enumerate(edges) if value <= edge), len(edges))] += n
+        labels = [f"<={edge}" for edge in edges] + [f">{edges[-1]}"]
+        return [{"bucket_ms": label, "count": n} for label, n in zip(labels, counts)]
+
+    def summary(self, histogram: bool = False) -> dict:
+        result = {
+            "count": self.count,
+            "p50_ms": self.quantile(0.50),
+            "p90_ms": self.quantile(0.90),
+            "p99_ms": self.quantile(0.99),
+        }
+        if histogram:
+            result["histogram"] = self.histogram()
+        return result
+
+    def to_bytes(self) -> bytes:
+        packed = array('i')
+        for i in sorted(self.bins):
+            packed.extend((i, self.bins[i]))
+        return packed.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes | None) -> 'ResponseSketch':
+        packed = array('i')
+        if data:
+            packed.frombytes(data)
+        return cls({packed[k]: packed[k + 1] for k in range(0, len(packed), 2)})
+
+
+class ResponseSketchDay(db.Model):
+    """One day's response-time sketch for a question or a player."""
+    __tablename__ = 'response_sketch_days'
+
+    kind = db.Column(db.String(16), primary_key=True)  # 'question' or 'player'
+    key = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    bins = db.Column(db.LargeBinary, nullable=False, default=b'')
+
+    def __init__(self, kind: str, key: int, day, bins: bytes = b''):
+        self.kind = kind
+        self.key = key
+        self.day = day
+        self.bins = bins
+
+
+def record_response_time(kind: str, key: int | None, day, value_ms: int | None, count: int = 1):
+    """Add (or with count=-1, remove) one response time; the caller commits."""
+    if key is None or value_ms is None:
+        return
+    # Create the row if needed before locking it: FOR UPDATE cannot lock a
+    # missing row, so two first answers would both insert it
+    values = {'kind': kind, 'key': key, 'day': day, 'bins': b''}
+    if db.engine.dialect.name == 'sqlite':
+        stmt = sqlite_insert(ResponseSketchDay).values(**values).on_conflict_do_nothing()
+    else:
+        stmt = insert(ResponseSketchDay).values(**values).prefix_with('IGNORE')
+    db.session.execute(stmt)
+    row = ResponseSketchDay.query.filter_by(kind=kind, key=key, day=day).with_for_update().one()
+    sketch = ResponseSketch.from_bytes(row.bins)
+    sketch.add(value_ms, count)
+    row.bins = sketch.to_bytes()
+
+
+def merged_sketches(kind: str, keys: list, days: int | None = None) -> dict:
+    """Merge each key's day sketches over the last `days` days (all time if None)."""
+    sketches = {key: ResponseSketch() for key in keys}
+    if not keys:
+        return sketches
+    query = db.session.query(ResponseSketchDay.key, ResponseSketchDay.bins) \
+        .filter(ResponseSketchDay.kind == kind, ResponseSketchDay.key.in_(keys))
+    if days:
+        query = query.filter(ResponseSketchDay.day > datetime.utcnow().date() - timedelta(days=days))
+    for key, bins in query:
+        sketches[key].merge(ResponseSketch.from_bytes(bins))
+    return sketches
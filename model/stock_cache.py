@@ -0,0 +1,66 @@
+"""
+Stock Symbol Index
+Process-local cache of symbol -> (id, price, quantity) for table_stocks hot
+reads. Writers invalidate by symbol (or wholesale) and bump a version so a
+load that raced with a write is never stored. Entries also expire after a
+TTL to pick up writes made by other gunicorn workers.
+"""
+import threading
+import time
+
+
+class SymbolIndex:
+    """
+    SymbolIndex
+
+    Args:
+        loader: callable(symbol) returning (id, price, quantity) or None
+        ttl: seconds an entry may be served before it is reloaded
+    """
+
+    def __init__(self, loader, ttl=5):
+        self._loader = loader
+        self.ttl = ttl
+        self._entries = {}
+        self._version = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, symbol):
+        """Return (id, price, quantity) for symbol, or None if it does not exist."""
+        entry = self._entries.get(symbol)
+        if entry is not None and time.monotonic() - entry[0] <= self.ttl:
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        version = self._version
+        row = self._loader(symbol)
+        row = tuple(row) if row is not None else None
+        with self._lock:
+            if version == self._version:  # no write happened while loading
+                self._entries[symbol] = (time.monotonic(), row)
+        return row
+
+    def invalidate(self, symbol=None):
+        """Drop one symbol, or every entry when symbol is None."""
+        with self._lock:
+            self._version += 1
+            self.invalidations += 1
+            if symbol is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(symbol, None)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "version": self._version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "ttl": self.ttl,
+        }
@@ -0,0 +1,309 @@
+"""
+Stock Game Matching Engine
+Keeps an in-memory order book per TableStock symbol so trades can be
+validated and filled without a chain of lookups, then persists each fill
+as a single locked database transaction.
+"""
+import threading
+import time
+from datetime import datetime
+
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import text, update
+
+from __init__ import app, db
+from model.stocks import TableStock, StockUser, StockTransaction, UserTransactionStock, StockPosition, StockLot, LOT_METHODS, symbol_index
+from model.stock_leaderboard import leaderboard
+
+
+# Seconds a book may serve a price before it is re-read from table_stocks.
+# Other gunicorn workers may refresh prices, so books must not live forever.
+app.config.setdefault('STOCK_BOOK_TTL', 5)
+
+
+class StockBook:
+    """
+    StockBook
+
+    In-memory view of a single TableStock row. The stock game trades against
+    the house, so the best bid and best ask both start at the current
+    `_sheesh` price and `available` mirrors the `_quantity` column.
+    """
+
+    def __init__(self, stock_id, symbol, price, quantity):
+        self.stock_id = stock_id
+        self.symbol = symbol
+        self.bid = price
+        self.ask = price
+        self.available = quantity
+        self.loaded_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def is_stale(self, ttl):
+        return time.monotonic() - self.loaded_at > ttl
+
+    def refresh(self, price, quantity):
+        with self.lock:
+            self.bid = price
+            self.ask = price
+            self.available = quantity
+            self.loaded_at = time.monotonic()
+
+    def set_price(self, price):
+        with self.lock:
+            self.bid = price
+            self.ask = price
+
+    def match(self, side, quantity):
+        """
+        Match an order against the house.
+
+        Buys take quantity off the book at the ask and return None when the
+        book is short; sells are always taken at the bid.
+        """
+        with self.lock:
+            if side == 'sell':
+                return self.bid
+            if self.available < quantity:
+                return None
+            self.available -= quantity
+            return self.ask
+
+    def settle(self, side, quantity):
+        """Apply a persisted sell; shares sold go back to the house."""
+        if side == 'sell':
+            with self.lock:
+                self.available += quantity
+
+    def unwind(self, side, quantity):
+        """Put back quantity reserved by a buy that failed to persist."""
+        if side == 'buy':
+            with self.lock:
+                self.available += quantity
+
+    def read(self):
+        return {
+            "stock_id": self.stock_id,
+            "symbol": self.symbol,
+            "bid": self.bid,
+            "ask": self.ask,
+            "available": self.available,
+        }
+
+
+class Fill:
+    """A matched order waiting to be written to the ledger."""
+
+    def __init__(self, uid, book, side, quantity, price, filled_at, lot_method='fifo'):
+        self.uid = uid
+        self.book = book
+        self.side = side
+        self.quantity = quantity
+        self.price = price
+        self.filled_at = filled_at
+        self.lot_method = lot_method
+        self.gains = []
+
+    @property
+    def value(self):
+        return self.quantity * self.price
+
+    def read(self):
+        return {
+            "uid": self.uid,
+            "symbol": self.book.symbol,
+            "side": self.side,
+            "quantity": self.quantity,
+            "price": self.price,
+            "value": self.value,
+            "filled_at": self.filled_at.isoformat(),
+            "realized_gains": [gain.read() for gain in self.gains],
+        }
+
+
+class MatchingEngine:
+    """
+    MatchingEngine
+
+    Holds one StockBook per symbol. Orders are matched against the book in
+    memory, and each resulting fill is persisted with one commit covering the
+    balance, ledger rows and inventory.
+    """
+
+    def __init__(self):
+        self._books = {}
+        self._lock = threading.Lock()
+
+    def load(self):
+        """(Re)load every TableStock row into memory with a single query."""
+        rows = db.session.query(TableStock.id, TableStock._symbol, TableStock._sheesh, TableStock._quantity).all()
+        books = {row[1]: StockBook(row[0], row[1], row[2], row[3]) for row in rows}
+        with self._lock:
+            self._books = books
+        return len(books)
+
+    def get_book(self, symbol):
+        """Return the book for symbol, loading or refreshing it if needed."""
+        if not self._books:
+            self.load()
+        book = self._books.get(symbol)
+        if book is None or book.is_stale(app.config['STOCK_BOOK_TTL']):
+            row = symbol_index.get(symbol)
+            if row is None:
+                return None
+            if book is None:
+                book = StockBook(row[0], symbol, row[1], row[2])
+                with self._lock:
+                    self._books[symbol] = book
+            else:
+                book.refresh(row[1], row[2])
+        return book
+
+    def update_price(self, symbol, price):
+        """Called after a price refresh so books quote the new price."""
+        book = self._books.get(symbol)
+        if book is not None:
+            book.set_price(price)
+
+    def submit(self, uid, symbol, quantity, side='buy', filled_at=None, lot_method='fifo'):
+        """
+        Validate and match an order in memory.
+
+        Returns:
+            (Fill, None) on a match, or (None, (error dict, status)) otherwise.
+        """
+        if not uid or not symbol:
+            return None, ({'error': 'uid and symbol are required'}, 400)
+        if not isinstance(quantity, int) or isinstance(quantity, bool) or quantity <= 0:
+            return None, ({'error': 'quantity must be a positive integer'}, 400)
+        if side not in ('buy', 'sell'):
+            return None, ({'error': f'Unsupported order side: {side}'}, 400)
+        if lot_method not in LOT_METHODS:
+            return None, ({'error': f"lot method must be one of {', '.join(LOT_METHODS)}"}, 400)
+
+        book = self.get_book(symbol)
+        if book is None:
+            return None, ({'error': 'No such stock exists'}, 404)
+
+        price = book.match(side, quantity)
+        if price is None:
+            return None, ({'error': f'Only {book.available} shares of {symbol} available'}, 400)
+
+        return Fill(uid, book, side, quantity, price, filled_at or datetime.now(), lot_method), None
+
+    def persist(self, fill):
+        """
+        Write a fill as one locked transaction.
+
+        The stock_users, table_stocks and stock_positions rows are locked
+        (SELECT ... FOR UPDATE on MySQL, BEGIN IMMEDIATE on SQLite), the
+        balance, holdings and inventory are checked against the locked rows,
+        and the debit/credit, ledger rows, tax lots, position and inventory
+        change are committed together. Either everything is written or
+        nothing is.
+        """
+        try:
+            _begin_write()
+            stock_user = StockUser.query.filter_by(_uid=fill.uid).with_for_update().first()
+            if stock_user is None:
+                return self._reject(fill, {'error': "Can't find user in StockUser table. Possible fix: Run /initilize first to log user in StockUser table"}, 404)
+            stock = TableStock.query.filter_by(id=fill.book.stock_id).with_for_update().first()
+            if stock is None:
+                return self._reject(fill, {'error': 'No such stock exists'}, 404)
+
+            position = StockPosition.get(stock_user.id, stock.id, for_update=True)
+
+            if fill.side == 'buy':
+                if stock_user._stockmoney < fill.value:
+                    return self._reject(fill, {'error': 'Insufficient funds'}, 400)
+                if stock._quantity < fill.quantity:
+                    return self._reject(fill, {'error': f'Only {stock._quantity} shares of {stock._symbol} available'}, 400)
+                stock_user._stockmoney = stock_user._stockmoney - fill.value
+                quantity_change = -fill.quantity
+            else:
+                if position is None or position.net_quantity < fill.quantity:
+                    return self._reject(fill, {'error': 'No stock to sell'}, 400)
+                stock_user._stockmoney = stock_user._stockmoney + fill.value
+                quantity_change = fill.quantity
+
+            transaction = StockTransaction(
+                user_id=stock_user.id,
+                transaction_type=fill.side,
+                quantity=fill.quantity,
+                transaction_date=fill.filled_at.date()
+            )
+            db.session.add(transaction)
+            db.session.flush()  # assigns transaction.id for the ledger row
+
+            db.session.add(UserTransactionStock(
+                user_id=stock_user.id,
+                transaction_id=transaction.id,
+                stock_id=stock.id,
+                quantity=fill.quantity,
+                price_per_stock=fill.price,
+                transaction_amount=fill.value,
+                transaction_time=fill.filled_at
+            ))
+            if fill.side == 'buy':
+                db.session.add(StockLot(stock_user.id, stock.id, transaction.id, fill.filled_at, fill.price, fill.quantity))
+            else:
+                fill.gains = StockLot.consume(stock_user.id, stock.id, transaction.id, fill.quantity, fill.price, fill.filled_at, fill.lot_method)
+                if fill.gains is None:
+                    return self._reject(fill, {'error': 'Open tax lots do not cover this sale. Possible fix: run flask custom backfill_lots'}, 409)
+            if position is None:
+                position = StockPosition(stock_user.id, stock.id)
+                db.session.add(position)
+            position.apply_fill(fill.side, fill.quantity, fill.price)
+            db.session.execute(
+                update(TableStock)
+                .where(TableStock.id == stock.id)
+                .values(_quantity=TableStock._quantity + quantity_change)
+            )
+            account = (stock_user.id, stock_user._uid, stock_user._stockmoney, stock.id, position.net_quantity)
+            db.session.commit()
+            symbol_index.invalidate(stock._symbol)
+            fill.book.settle(fill.side, fill.quantity)
+            leaderboard.apply_fill(*account)
+            return fill.read(), 200
+        except Exception as e:
+            return self._reject(fill, {'error': f'Trade failed: {str(e)}'}, 500)
+
+    def _reject(self, fill, error, status):
+        db.session.rollback()
+        fill.book.unwind(fill.side, fill.quantity)
+        return error, status
+
+    def execute(self, uid, symbol, quantity, side='buy', filled_at=None, lot_method='fifo'):
+        """Match and persist an order; returns (payload, status)."""
+        fill, error = self.submit(uid, symbol, quantity, side, filled_at, lot_method)
+        if error:
+            return error
+        return self.persist(fill)
+
+    def read(self):
+        return {symbol: book.read() for symbol, book in self._books.items()}
+
+    def stats(self):
+        return {"books": len(self._books), "symbol_index": symbol_index.stats()}
+
+
+def _begin_write():
+    """
+    Start the trade's write transaction before any row is read.
+
+    SQLite has no row locks, so take the database write lock up front with
+    BEGIN IMMEDIATE; concurrent trades then queue instead of failing late on
+    a lock upgrade. Other backends rely on SELECT ... FOR UPDATE.
+    """
+    if db.engine.dialect.name == 'sqlite':
+        db.session.commit()  # close any implicit read transaction first
+        db.session.execute(text('BEGIN IMMEDIATE'))
+
+
+# Shared engine for this worker process
+matching_engine = MatchingEngine()
+
+
+def backdated_fill_time():
+    """Fill time used by /initialbuy, which seeds holdings from a year ago."""
+    return datetime.now() - relativedelta(years=1)
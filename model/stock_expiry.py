@@ -0,0 +1,167 @@
+"""
+Stock Account Expiry Sweeper
+Finds expired stock_users with one indexed range query on _expires_at and
+archives then resets them in batches: the final account is snapshotted to
+stock_account_archives, holdings go back to the house, the account's
+ledger, lots and positions are cleared and a fresh window starts.
+"""
+import threading
+import time
+from datetime import date, datetime
+
+from sqlalchemy import update
+
+from __init__ import app, db
+from model.stocks import (
+    StockUser, TableStock, StockTransaction, UserTransactionStock, StockPosition,
+    StockLot, StockRealizedGain, STARTING_BALANCE, symbol_index,
+)
+from model.stock_engine import matching_engine, _begin_write
+from model.stock_leaderboard import leaderboard
+from model.background_lease import background_lease
+
+
+class StockAccountArchive(db.Model):
+    """
+    StockAccountArchive
+
+    Snapshot of a stock game account taken when it expired and was reset.
+    """
+    __tablename__ = 'stock_account_archives'
+    id = db.Column(db.Integer, primary_key=True)
+    _uid = db.Column(db.String(255), nullable=False, index=True)
+    _stockmoney = db.Column(db.Float, nullable=False)
+    _accountdate = db.Column(db.Date, nullable=True)
+    _expired_at = db.Column(db.DateTime, nullable=False)
+    _archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    _positions = db.Column(db.JSON, nullable=False)
+
+    def __init__(self, uid, stockmoney, accountdate, expired_at, positions):
+        self._uid = uid
+        self._stockmoney = stockmoney
+        self._accountdate = accountdate
+        self._expired_at = expired_at
+        self._positions = positions
+
+    def read(self):
+        return {
+            "id": self.id,
+            "uid": self._uid,
+            "stockmoney": self._stockmoney,
+            "accountdate": self._accountdate.isoformat() if self._accountdate else None,
+            "expired_at": self._expired_at.isoformat(),
+            "archived_at": self._archived_at.isoformat() if self._archived_at else None,
+            "positions": self._positions,
+        }
+
+
+def backfill_expiry(batch_size=500):
+    """Fill _expires_at for accounts created before the column existed."""
+    filled = 0
+    while True:
+        rows = db.session.query(StockUser.id, StockUser._accountdate) \
+            .filter(StockUser._expires_at.is_(None)).limit(batch_size).all()
+        if not rows:
+            return filled
+        db.session.execute(update(StockUser), [
+            {'id': user_id, '_expires_at': StockUser.expiry_for(accountdate or date.today())}
+            for user_id, accountdate in rows
+        ])
+        db.session.commit()
+        filled += len(rows)
+
+
+def _reset_batch(now, batch_size):
+    """Archive and reset one batch of expired accounts; returns the count."""
+    _begin_write()
+    users = StockUser.query.filter(StockUser._expires_at <= now) \
+        .order_by(StockUser._expires_at).limit(batch_size).with_for_update().all()
+    if not users:
+        db.session.rollback()
+        return 0
+    user_ids = [user.id for user in users]
+
+    positions = StockPosition.query.filter(StockPosition._user_id.in_(user_ids)).all()
+    held = {}
+    returned = {}
+    for position in positions:
+        if position.net_quantity > 0:
+            held.setdefault(position._user_id, []).append({
+                "stock_id": position._stock_id,
+                "net_quantity": position.net_quantity,
+                "cost_basis": position.cost_basis,
+                "realized_pnl": position.realized_pnl,
+            })
+            returned[position._stock_id] = returned.get(position._stock_id, 0) + position.net_quantity
+
+    for user in users:
+        db.session.add(StockAccountArchive(user._uid, user._stockmoney, user._accountdate, user._expires_at, held.get(user.id, [])))
+
+    # shares held by expired accounts go back to the house
+    for stock_id, quantity in returned.items():
+        db.session.execute(update(TableStock).where(TableStock.id == stock_id).values(_quantity=TableStock._quantity + quantity))
+
+    transaction_ids = db.session.query(StockTransaction.id).filter(StockTransaction._user_id.in_(user_ids))
+    StockRealizedGain.query.filter(StockRealizedGain._user_id.in_(user_ids)).delete(synchronize_session=False)
+    StockLot.query.filter(StockLot._user_id.in_(user_ids)).delete(synchronize_session=False)
+    StockPosition.query.filter(StockPosition._user_id.in_(user_ids)).delete(synchronize_session=False)
+    UserTransactionStock.query.filter(UserTransactionStock._transaction_id.in_(transaction_ids)).delete(synchronize_session=False)
+    StockTransaction.query.filter(StockTransaction._user_id.in_(user_ids)).delete(synchronize_session=False)
+
+    today = date.today()
+    for user in users:
+        user._stockmoney = STARTING_BALANCE
+        user._accountdate = today
+        user._expires_at = StockUser.expiry_for(today)
+    db.session.commit()
+    return len(users)
+
+
+def sweep_expired_accounts(batch_size=100, now=None):
+    """
+    Archive and reset every expired account, batch_size accounts per commit.
+
+    Returns:
+        summary dictionary with the number of accounts reset
+    """
+    now = now or datetime.now()
+    backfilled = backfill_expiry()
+    reset = 0
+    try:
+        while True:
+            count = _reset_batch(now, batch_size)
+            reset += count
+            if count < batch_size:
+                break
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        if reset:
+            symbol_index.invalidate()
+            matching_engine.load()
+            leaderboard.invalidate()
+    return {"reset": reset, "backfilled": backfilled}
+
+
+def start_expiry_sweeper(interval, batch_size=100):
+    """Run sweep_expired_accounts every `interval` seconds in a daemon thread, in one worker at a time."""
+    def run():
+        while True:
+            time.sleep(interval)
+            with app.app_context():
+                try:
+                    # One worker per host runs each cycle; the lease outlives a slow cycle
+                    if not background_lease.acquire('stock-expiry-sweep', interval * 3):
+                        continue
+                    result = sweep_expired_accounts(batch_size)
+                    if result["reset"]:
+                        print(f"Stock expiry sweep reset {result['reset']} account(s)")
+                except Exception as e:
+                    print(f"Stock expiry sweep failed: {e}")
+                finally:
+                    db.session.remove()
+
+    thread = threading.Thread(target=run, name='stock-expiry-sweeper', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,203 @@
+"""
+Stock Price History
+Append-only price history for table_stocks. Each refresh inserts one raw
+tick row per stock and folds the tick into 1m/1h/1d OHLC bars with
+relative UPDATEs, so concurrent refreshes never rewrite each other's
+data and charts read bars instead of scanning ticks. compact_ticks later
+packs finished days of tick rows into one row per stock per UTC day.
+"""
+from array import array
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, case, insert, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from __init__ import db
+
+
+# Supported bar intervals in seconds
+INTERVALS = {'1m': 60, '1h': 3600, '1d': 86400}
+
+# Default look-back for /stock/history when no `from` is given
+DEFAULT_WINDOWS = {'1m': timedelta(days=1), '1h': timedelta(days=7), '1d': timedelta(days=365)}
+
+
+class StockPriceTick(db.Model):
+    """One raw price tick, kept as its own row until compact_ticks packs its day."""
+    __tablename__ = 'stock_price_ticks'
+    __table_args__ = (db.Index('ix_stock_price_ticks_stock_at', '_stock_id', '_at'),)
+    id = db.Column(db.Integer, primary_key=True)
+    _stock_id = db.Column(db.Integer, db.ForeignKey('table_stocks.id', ondelete='CASCADE'), nullable=False)
+    _at = db.Column(db.DateTime, nullable=False)
+    _price = db.Column(db.Float, nullable=False)
+
+
+class StockPriceDay(db.Model):
+    """
+    StockPriceDay
+
+    One compacted day of raw ticks for a stock. `_times` holds seconds since
+    UTC midnight as packed uint32 and `_prices` the matching packed float64
+    prices, so a day of per-minute ticks is ~17KB instead of 1440 rows.
+    """
+    __tablename__ = 'stock_price_days'
+    _stock_id = db.Column(db.Integer, db.ForeignKey('table_stocks.id', ondelete='CASCADE'), primary_key=True)
+    _day = db.Column(db.Date, primary_key=True)
+    _count = db.Column(db.Integer, nullable=False, default=0)
+    _times = db.Column(db.LargeBinary, nullable=False, default=b'')
+    _prices = db.Column(db.LargeBinary, nullable=False, default=b'')
+
+    def __init__(self, stock_id, day):
+        self._stock_id = stock_id
+        self._day = day
+        self._count = 0
+        self._times = b''
+        self._prices = b''
+
+    def extend(self, ticks):
+        """Append [(datetime, price), ...]; only compact_ticks writes day rows."""
+        start = datetime.combine(self._day, datetime.min.time())
+        times = array('I', self._times or b'')
+        prices = array('d', self._prices or b'')
+        for at, price in ticks:
+            times.append(int((at - start).total_seconds()))
+            prices.append(float(price))
+        self._times = times.tobytes()
+        self._prices = prices.tobytes()
+        self._count = len(prices)
+
+    def ticks(self):
+        """Decode the partition into [(datetime, price), ...]"""
+        start = datetime.combine(self._day, datetime.min.time())
+        return [(start + timedelta(seconds=t), p) for t, p in zip(array('I', self._times), array('d', self._prices))]
+
+
+class StockPriceBar(db.Model):
+    """
+    StockPriceBar
+
+    OHLC rollup for one stock, interval and bucket start (UTC).
+    """
+    __tablename__ = 'stock_price_bars'
+    _stock_id = db.Column(db.Integer, db.ForeignKey('table_stocks.id', ondelete='CASCADE'), primary_key=True)
+    _interval = db.Column(db.String(4), primary_key=True)
+    _bucket_start = db.Column(db.DateTime, primary_key=True)
+    _open = db.Column(db.Float, nullable=False)
+    _high = db.Column(db.Float, nullable=False)
+    _low = db.Column(db.Float, nullable=False)
+    _close = db.Column(db.Float, nullable=False)
+    _tick_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __init__(self, stock_id, interval, bucket_start, price):
+        self._stock_id = stock_id
+        self._interval = interval
+        self._bucket_start = bucket_start
+        self._open = self._high = self._low = self._close = price
+        self._tick_count = 0
+
+    def read(self):
+        return {
+            "time": self._bucket_start.isoformat(),
+            "open": self._open,
+            "high": self._high,
+            "low": self._low,
+            "close": self._close,
+            "ticks": self._tick_count,
+        }
+
+
+def bucket_start(at, interval):
+    seconds = INTERVALS[interval]
+    epoch = datetime(1970, 1, 1)
+    return epoch + timedelta(seconds=int((at - epoch).total_seconds()) // seconds * seconds)
+
+
+def _insert_ignore(model, rows):
+    if db.engine.dialect.name == 'sqlite':
+        stmt = sqlite_insert(model).on_conflict_do_nothing()
+    else:
+        stmt = insert(model).prefix_with('IGNORE')
+    db.session.execute(stmt, rows)
+
+
+def record_prices(prices, at=None):
+    """
+    Append one tick per stock and fold it into every bar interval.
+
+    Ticks are plain inserts. Missing bars are created with insert-or-ignore
+    and every bar is then updated relative to its stored values, so racing
+    refreshes neither collide on a key nor lose ticks. The caller commits.
+
+    Args:
+        prices: {stock_id: price}
+        at: tick time (UTC), defaults to now
+    """
+    if not prices:
+        return 0
+    at = at or datetime.utcnow()
+    db.session.execute(insert(StockPriceTick), [
+        {'_stock_id': stock_id, '_at': at, '_price': price} for stock_id, price in prices.items()
+    ])
+
+    bars = StockPriceBar.__table__
+    price = bindparam('b_price')
+    fold = update(bars).where(
+        bars.c._stock_id == bindparam('b_stock_id'),
+        bars.c._interval == bindparam('b_interval'),
+        bars.c._bucket_start == bindparam('b_bucket_start'),
+    ).values(
+        _high=case((bars.c._high > price, bars.c._high), else_=price),
+        _low=case((bars.c._low < price, bars.c._low), else_=price),
+        _close=price,
+        _tick_count=bars.c._tick_count + 1,
+    )
+    for interval in INTERVALS:
+        start = bucket_start(at, interval)
+        _insert_ignore(StockPriceBar, [
+            {'_stock_id': stock_id, '_interval': interval, '_bucket_start': start, '_open': price,
+             '_high': price, '_low': price, '_close': price, '_tick_count': 0}
+            for stock_id, price in prices.items()
+        ])
+        db.session.execute(fold, [
+            {'b_stock_id': stock_id, 'b_interval': interval, 'b_bucket_start': start, 'b_price': price}
+            for stock_id, price in prices.items()
+        ])
+    return len(prices)
+
+
+def compact_ticks(before=None, batch_size=50000):
+    """
+    Pack tick rows from days before `before` (default today, UTC) into
+    StockPriceDay rows and delete them. Returns the number of ticks packed.
+    """
+    before = datetime.combine((before or datetime.utcnow()).date(), datetime.min.time())
+    packed = 0
+    while True:
+        ticks = StockPriceTick.query.filter(StockPriceTick._at < before) \
+            .order_by(StockPriceTick._stock_id, StockPriceTick._at, StockPriceTick.id).limit(batch_size).all()
+        if not ticks:
+            return packed
+        groups = {}
+        for tick in ticks:
+            groups.setdefault((tick._stock_id, tick._at.date()), []).append((tick._at, tick._price))
+        _insert_ignore(StockPriceDay, [
+            {'_stock_id': stock_id, '_day': day, '_count': 0, '_times': b'', '_prices': b''}
+            for stock_id, day in groups
+        ])
+        for (stock_id, day), rows in groups.items():
+            row = StockPriceDay.query.filter_by(_stock_id=stock_id, _day=day).with_for_update().one()
+            row.extend(rows)
+        StockPriceTick.query.filter(StockPriceTick.id.in_([tick.id for tick in ticks])).delete(synchronize_session=False)
+        db.session.commit()
+        packed += len(ticks)
+
+
+def get_bars(stock_id, interval, start, end):
+    """Read rolled-up bars for [start, end] in time order."""
+    bars = StockPriceBar.query.filter(
+        StockPriceBar._stock_id == stock_id,
+        StockPriceBar._interval == interval,
+        StockPriceBar._bucket_start >= bucket_start(start, interval),
+        StockPriceBar._bucket_start <= end,
+    ).order_by(StockPriceBar._bucket_start).all()
+    return [bar.read() for bar in bars]
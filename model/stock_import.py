@@ -0,0 +1,110 @@
+"""
+Stock Universe Import
+Streams a CSV (or Parquet) export of table_stocks in chunks and upserts it
+with executemany batches: one bulk INSERT for new symbols and one bulk
+UPDATE by primary key for existing ones per chunk. Re-running an import
+is idempotent. Existing symbols only take the file's company and price:
+_quantity is the house's remaining shares, lowered by every buy, so it is
+set from the file for new symbols only unless overwrite_quantity is given.
+"""
+import csv
+import os
+import time
+
+from sqlalchemy import insert, update
+
+from __init__ import db
+from model.stocks import TableStock, symbol_index
+
+
+# Accepted column names, with or without the leading underscore used by
+# stocks_table_exp.csv
+COLUMNS = ('symbol', 'company', 'quantity', 'sheesh')
+
+
+def _normalize(record):
+    row = {key.lstrip('_'): value for key, value in record.items() if key}
+    missing = [column for column in COLUMNS if row.get(column) in (None, '')]
+    if missing:
+        raise ValueError(f"Row for {row.get('symbol')!r} is missing {', '.join(missing)}")
+    return {
+        '_symbol': str(row['symbol']).strip(),
+        '_company': str(row['company']).strip(),
+        '_quantity': int(float(row['quantity'])),
+        '_sheesh': float(row['sheesh']),
+    }
+
+
+def _csv_chunks(path, chunk_size):
+    with open(path, newline='', encoding='utf-8') as f:
+        chunk = []
+        for record in csv.DictReader(f):
+            chunk.append(_normalize(record))
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+def _parquet_chunks(path, chunk_size):
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet import requires pyarrow: pip install pyarrow")
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+        yield [_normalize(record) for record in batch.to_pylist()]
+
+
+def import_stocks(path, chunk_size=1000, fmt=None, overwrite_quantity=False):
+    """
+    Upsert every row of path into table_stocks, keyed by symbol.
+
+    Args:
+        path: CSV or Parquet file
+        chunk_size: rows per executemany batch and commit
+        fmt: 'csv' or 'parquet'; inferred from the extension when omitted
+        overwrite_quantity: also reset _quantity of existing symbols from the
+            file, discarding shares users hold (e.g. after clearing accounts)
+
+    Returns:
+        summary dictionary with inserted/updated counts and rows per second
+    """
+    fmt = fmt or ('parquet' if os.path.splitext(path)[1].lower() in ('.parquet', '.pq') else 'csv')
+    chunks = _parquet_chunks(path, chunk_size) if fmt == 'parquet' else _csv_chunks(path, chunk_size)
+
+    started = time.perf_counter()
+    ids = dict(db.session.query(TableStock._symbol, TableStock.id).all())
+    inserted = updated = 0
+    for chunk in chunks:
+        rows = {row['_symbol']: row for row in chunk}  # last row wins within a chunk
+        new_rows = [row for symbol, row in rows.items() if symbol not in ids]
+        changed_rows = [{'id': ids[symbol], **row} for symbol, row in rows.items() if symbol in ids]
+        if not overwrite_quantity:
+            for row in changed_rows:
+                del row['_quantity']
+        try:
+            if new_rows:
+                db.session.execute(insert(TableStock), new_rows)
+            if changed_rows:
+                db.session.execute(update(TableStock), changed_rows)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        finally:
+            symbol_index.invalidate()
+        if new_rows:
+            ids.update(db.session.query(TableStock._symbol, TableStock.id)
+                       .filter(TableStock._symbol.in_([row['_symbol'] for row in new_rows])).all())
+        inserted += len(new_rows)
+        updated += len(changed_rows)
+
+    seconds = time.perf_counter() - started
+    total = inserted + updated
+    return {
+        'inserted': inserted,
+        'updated': updated,
+        'seconds': round(seconds, 3),
+        'rows_per_second': round(total / seconds) if seconds else total,
+    }
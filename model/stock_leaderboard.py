@@ -0,0 +1,138 @@
+"""
+Stock Game Leaderboard
+Ranks every StockUser by total account value (cash + holdings at current
+prices). Holdings are kept as a sparse users x symbols position matrix in
+coordinate form, so valuing every account is one vectorized
+matrix-vector product against the price vector.
+"""
+import threading
+import time
+
+import numpy as np
+
+from __init__ import app, db
+from model.stocks import StockUser, TableStock, StockPosition
+
+
+# Seconds before the matrix is rebuilt from the database, which picks up
+# trades and price refreshes made by other gunicorn workers.
+app.config.setdefault('STOCK_LEADERBOARD_TTL', 60)
+
+
+class Leaderboard:
+    """
+    Leaderboard
+
+    Cached valuation of all stock accounts. Trades and price refreshes in
+    this process update the arrays in place and mark the ranking dirty;
+    the ranking itself is recomputed lazily on the next read.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._built_at = None
+        self._dirty = True
+
+    def rebuild(self):
+        """Load accounts, prices and open positions with three queries."""
+        users = db.session.query(StockUser.id, StockUser._uid, StockUser._stockmoney).all()
+        stocks = db.session.query(TableStock.id, TableStock._sheesh).all()
+        positions = db.session.query(StockPosition._user_id, StockPosition._stock_id, StockPosition._net_quantity) \
+            .filter(StockPosition._net_quantity > 0).all()
+        with self._lock:
+            self._user_index = {row[0]: i for i, row in enumerate(users)}
+            self._uids = [row[1] for row in users]
+            self._cash = np.array([row[2] or 0 for row in users], dtype=np.float64)
+            self._stock_index = {row[0]: i for i, row in enumerate(stocks)}
+            self._prices = np.array([row[1] or 0 for row in stocks], dtype=np.float64)
+            self._pos_users = np.array([self._user_index[p[0]] for p in positions if p[0] in self._user_index and p[1] in self._stock_index], dtype=np.int64)
+            self._pos_stocks = np.array([self._stock_index[p[1]] for p in positions if p[0] in self._user_index and p[1] in self._stock_index], dtype=np.int64)
+            self._pos_qty = np.array([p[2] for p in positions if p[0] in self._user_index and p[1] in self._stock_index], dtype=np.float64)
+            self._pos_slot = {(u, s): i for i, (u, s) in enumerate(zip(self._pos_users.tolist(), self._pos_stocks.tolist()))}
+            self._built_at = time.monotonic()
+            self._dirty = True
+
+    def invalidate(self):
+        """Force a rebuild from the database on the next read."""
+        self._built_at = None
+
+    def _ensure_fresh(self):
+        if self._built_at is None or time.monotonic() - self._built_at > app.config['STOCK_LEADERBOARD_TTL']:
+            self.rebuild()
+
+    def apply_prices(self, prices):
+        """Fold {stock_id: price} into the price vector."""
+        if self._built_at is None:
+            return
+        with self._lock:
+            cols = [self._stock_index[sid] for sid in prices if sid in self._stock_index]
+            vals = [price for sid, price in prices.items() if sid in self._stock_index]
+            if cols:
+                self._prices[cols] = vals
+                self._dirty = True
+
+    def apply_fill(self, stock_user_id, uid, cash, stock_id, net_quantity):
+        """Fold the post-trade cash balance and position of one account."""
+        if self._built_at is None:
+            return
+        with self._lock:
+            if stock_id not in self._stock_index:
+                self._built_at = None  # unseen stock, rebuild on next read
+                return
+            row = self._user_index.get(stock_user_id)
+            if row is None:
+                row = len(self._uids)
+                self._user_index[stock_user_id] = row
+                self._uids.append(uid)
+                self._cash = np.append(self._cash, 0.0)
+            self._cash[row] = cash
+            col = self._stock_index[stock_id]
+            slot = self._pos_slot.get((row, col))
+            if slot is None:
+                self._pos_slot[(row, col)] = len(self._pos_qty)
+                self._pos_users = np.append(self._pos_users, row)
+                self._pos_stocks = np.append(self._pos_stocks, col)
+                self._pos_qty = np.append(self._pos_qty, float(net_quantity))
+            else:
+                self._pos_qty[slot] = net_quantity
+            self._dirty = True
+
+    def _ranking(self):
+        """Recompute values and ranks if anything changed since the last read."""
+        self._ensure_fresh()
+        with self._lock:
+            if self._dirty:
+                holdings = np.bincount(self._pos_users, weights=self._pos_qty * self._prices[self._pos_stocks], minlength=len(self._uids))
+                values = self._cash + holdings[:len(self._uids)]
+                order = np.argsort(-values, kind='stable')
+                ranks = np.empty(len(order), dtype=np.int64)
+                ranks[order] = np.arange(1, len(order) + 1)
+                self._values, self._order, self._ranks = values, order, ranks
+                self._row_by_uid = {uid: i for i, uid in enumerate(self._uids)}
+                self._dirty = False
+            return self._values, self._order, self._ranks, self._row_by_uid
+
+    def _entry(self, row, values, ranks):
+        return {
+            "rank": int(ranks[row]),
+            "uid": self._uids[row],
+            "cash": float(self._cash[row]),
+            "total_value": float(values[row]),
+        }
+
+    def top(self, limit=10):
+        values, order, ranks, _ = self._ranking()
+        return [self._entry(row, values, ranks) for row in order[:limit].tolist()]
+
+    def rank_of(self, uid):
+        values, _, ranks, rows = self._ranking()
+        row = rows.get(uid)
+        return self._entry(row, values, ranks) if row is not None else None
+
+    def size(self):
+        self._ensure_fresh()
+        return len(self._uids)
+
+
+# Shared leaderboard for this worker process
+leaderboard = Leaderboard()
@@ -0,0 +1,90 @@
+"""
+Stock Quote Refresh
+Pulls quotes for the whole table_stocks universe in batched multi-symbol
+requests over the shared pooled HTTP client and applies the new prices with
+a single bulk UPDATE, appending each price to the price history.
+"""
+import time
+
+import requests
+from sqlalchemy import update
+
+from __init__ import app, db
+from model.stocks import TableStock, symbol_index
+from model.stock_engine import matching_engine
+from model.stock_history import record_prices
+from model.stock_leaderboard import leaderboard
+from model.http_client import http_client
+
+
+def _batches(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def fetch_quotes(symbols):
+    """
+    Fetch latest prices for symbols using comma-separated batch requests.
+
+    Returns:
+        (prices, failed) where prices maps symbol -> price and failed lists
+        symbols whose batch request did not succeed.
+    """
+    url = app.config['STOCK_QUOTE_URL'].rstrip('/')
+    api_key = app.config['STOCK_QUOTE_API_KEY']
+    prices = {}
+    failed = []
+    for batch in _batches(list(symbols), app.config['STOCK_QUOTE_BATCH_SIZE']):
+        try:
+            response = http_client.get(f"{url}/{','.join(batch)}", params={'apikey': api_key}, timeout=15)
+            if response.status_code != 200:
+                print(f"Quote batch failed with status {response.status_code}: {batch[0]}..{batch[-1]}")
+                failed.extend(batch)
+                continue
+            for quote in response.json() or []:
+                symbol, price = quote.get('symbol'), quote.get('price')
+                if symbol and price is not None:
+                    prices[symbol] = price
+        except (requests.RequestException, ValueError) as e:
+            print(f"Quote batch error for {batch[0]}..{batch[-1]}: {e}")
+            failed.extend(batch)
+    return prices, failed
+
+
+def apply_prices(prices):
+    """Write new _sheesh values and history ticks with one bulk UPDATE and one commit."""
+    if not prices:
+        return 0
+    ids = dict(db.session.query(TableStock._symbol, TableStock.id).filter(TableStock._symbol.in_(list(prices))).all())
+    rows = [{'id': ids[symbol], '_sheesh': price} for symbol, price in prices.items() if symbol in ids]
+    if rows:
+        db.session.execute(update(TableStock), rows)
+        record_prices({row['id']: row['_sheesh'] for row in rows})
+        db.session.commit()
+        symbol_index.invalidate()
+        leaderboard.apply_prices({row['id']: row['_sheesh'] for row in rows})
+    for symbol, price in prices.items():
+        matching_engine.update_price(symbol, price)
+    return len(rows)
+
+
+def refresh_prices(symbols=None):
+    """
+    Refresh quotes for symbols, or for every TableStock row when omitted.
+
+    Returns:
+        summary dictionary with counts, unpriced symbols and elapsed seconds
+    """
+    started = time.perf_counter()
+    if symbols is None:
+        symbols = [row[0] for row in db.session.query(TableStock._symbol).all()]
+    prices, failed = fetch_quotes(symbols)
+    updated = apply_prices(prices)
+    return {
+        'requested': len(symbols),
+        'updated': updated,
+        'prices': prices,
+        'missing': sorted(set(symbols) - set(prices) - set(failed)),
+        'failed': failed,
+        'seconds': round(time.perf_counter() - started, 3),
+    }
@@ -6,10 +6,12 @@ import json
 from flask_login import UserMixin
 
 from __init__ import app, db
+from sqlalchemy import inspect, text
 from sqlalchemy.exc import IntegrityError
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timedelta
 from dateutil.relativedelta import relativedelta
+from model.stock_cache import SymbolIndex
 
 #from model.user import User
 
@@ -79,18 +81,21 @@ class TableStock(db.Model):
         if quantity is not None and isinstance(quantity, int) and quantity > 0:
             self.quantity = quantity
         db.session.commit()
+        symbol_index.invalidate(self.symbol)
         return self
-    # gets price of stock
+    # gets price of stock, served from the process-local symbol index
     def get_price(self,body):
         stock = body.get("symbol")
         try:
-            return TableStock.query.filter(TableStock._symbol == stock).value(TableStock._sheesh)
+            row = symbol_index.get(stock)
+            return row[1] if row else None
         except Exception as e:
             return {"error": "No such stock exists"},500
     # returns stock id: refered in many to many table: User_Transaction_Stocks
     def get_stockid(self,symbol):
         try:
-            return TableStock.query.filter(TableStock._symbol == symbol).value(TableStock.id)
+            row = symbol_index.get(symbol)
+            return row[0] if row else None
         except Exception as e:
             return {"error": "No such stock exists"},500
     def updatequantity(self,body,isbuy):
@@ -103,6 +108,7 @@ class TableStock(db.Model):
             x= TableStock.query.get(idnum)
             print("this is x" + str(x))
             x.update(quantity = newquantity)
+            symbol_index.invalidate(symbol)
             return print("updated quanity")
     def updatestockprice(self,body = None,isloop = None,latest_price = None,stock = None, topstock = None):
     #symbol = body.get('symbol')
@@ -115,6 +121,7 @@ class TableStock(db.Model):
             stock.sheesh = latest_price
             price = stock.sheesh
             db.session.commit()
+            symbol_index.invalidate(stock.symbol)
             return price
         
     def read(self):
@@ -125,12 +132,26 @@ class TableStock(db.Model):
             "quantity": self.quantity,
             "sheesh": self.sheesh,
         }
+# Starting cash and lifetime of a stock game account
+STARTING_BALANCE = 100000
+ACCOUNT_LIFETIME = timedelta(weeks=6)
+
+
+def _load_symbol(symbol):
+    return db.session.query(TableStock.id, TableStock._sheesh, TableStock._quantity).filter(TableStock._symbol == symbol).first()
+
+
+# Process-local symbol -> (id, price, quantity) cache for hot reads
+symbol_index = SymbolIndex(_load_symbol, ttl=app.config.get('STOCK_SYMBOL_CACHE_TTL', 5))
+
+
 class StockUser(db.Model):
     __tablename__ = 'stock_users'
     id = db.Column(db.Integer, primary_key=True)
     _uid = db.Column(db.String(255), db.ForeignKey('users._uid', ondelete='CASCADE'), nullable=False)
     _stockmoney = db.Column(db.Integer, nullable=False)
     _accountdate = db.Column(db.Date)
+    _expires_at = db.Column(db.DateTime, index=True)
 
     # creates a one to many relatio with transaction table
     transactions = db.relationship('StockTransaction', lazy='subquery', backref=db.backref('stock_users', lazy=True))
@@ -142,6 +163,12 @@ class StockUser(db.Model):
         self._uid = uid
         self._stockmoney = stockmoney
         self._accountdate = date.today()
+        self._expires_at = StockUser.expiry_for(self._accountdate)
+
+    @staticmethod
+    def expiry_for(accountdate):
+        """Accounts expire ACCOUNT_LIFETIME after the day they were opened"""
+        return datetime.combine(accountdate, datetime.min.time()) + ACCOUNT_LIFETIME
 
     @property
     def uid(self):
@@ -188,6 +215,7 @@ class StockUser(db.Model):
             "uid": self.uid,
             "stockmoney": self.stockmoney,
             "accountdate": self._accountdate,
+            "expires_at": self._expires_at,
         }
     # returns balance of user 
     def get_balance(self,body):
@@ -215,27 +243,18 @@ class StockUser(db.Model):
         return print("account balance updated")
     
     def check_expire(self, body):
+        # answers from the indexed _expires_at column
         uid = body.get("uid")
-        accountdate = StockUser.query.filter(StockUser._uid == uid).value(StockUser._accountdate)
-        
-        if accountdate is not None:
-            # Convert accountdate to datetime object
-            account_datetime = datetime.combine(accountdate, datetime.min.time())
-            
-            # Add 6 weeks to the accountdate
-            expire_date = account_datetime + timedelta(weeks=6)
-            
-            # Get the current date and time
-            current_datetime = datetime.now()
-            
-            # Check if the account has expired
-            if current_datetime > expire_date:
-                return True  # Account has expired
-            else:
-                return False  # Account is still valid
-        else:
-            # Handle the case where accountdate is None
-            return None  # or raise an exception or handle appropriately
+        row = StockUser.query.filter(StockUser._uid == uid).with_entities(StockUser._expires_at, StockUser._accountdate).first()
+        if row is None:
+            return None
+        expires_at = row[0]
+        if expires_at is None and row[1] is not None:
+            # account created before _expires_at existed
+            expires_at = StockUser.expiry_for(row[1])
+        if expires_at is None:
+            return None
+        return datetime.now() > expires_at
 class StockTransaction(db.Model):
     __tablename__ = 'stock_transactions'
 
@@ -517,60 +536,384 @@ class UserTransactionStock(db.Model):
             else:
                 print("error: transaction log has not been created yet")
     def check_tax(self,body):
+        # summarizes open lots and realized gains from the tax-lot tables
         symbol = body.get("symbol")
-        quantity = body.get("quantity")
         uid = body.get("uid")
-        stockid = TableStock.get_stockid(self,symbol)
         userid = StockUser.get_userid(self,uid)
-        one_year_ago = datetime.now() - timedelta(days=365)
-        try:
-            s = list(UserTransactionStock.query.filter_by(_stock_id = stockid, _user_id = userid).all())
-            buy_list = []
-            sell_list = []
-            one_year_list = []
-            less_one_year_list = []
-            
-            for i in s:
-                transactionid = i.transaction_id
-                transaction_type = StockTransaction.query.filter(StockTransaction.id == transactionid).value(StockTransaction._transaction_type)
-                if transaction_type == 'buy':
-                    buy_list.append(i)
-                else:
-                    sell_list.append(i)
-            for j in buy_list:
-                time = j._transaction_time
-                if time <= one_year_ago:
-                    one_year_list.append(j)
-                else:
-                    less_one_year_list.append(j)
-                print(str(one_year_list))
-                    
-                print(str(time))
-        except Exception as e:
-            return {e}
+        stockid = TableStock.get_stockid(self,symbol) if symbol else None
+        return StockLot.tax_summary(userid, stockid)
     def check_stock_quantity(self,body):
+        # reads the materialized StockPosition row instead of the whole ledger
         symbol = body.get("symbol")
         uid = body.get("uid")
         stockid = TableStock.get_stockid(self,symbol)
         userid = StockUser.get_userid(self,uid)
-        try:
-            s = list(UserTransactionStock.query.filter_by(_stock_id = stockid, _user_id = userid).all())
-            buy_list = []
-            sell_list = []
-            num_buy = 0
-            num_sell = 0
-            for i in s:
-                transactionid = i.transaction_id
-                transaction_type = StockTransaction.query.filter(StockTransaction.id == transactionid).value(StockTransaction._transaction_type)
-                if transaction_type == 'buy':
-                    buy_list.append(i)
-                    print(buy_list)
-                    num_buy += i.quantity
-                else:
-                    sell_list.append(i)
-                    num_sell += i.quantity
-            
-            return num_buy - num_sell
-        except Exception as e:
-            return {e}
-    
+        position = StockPosition.get(userid, stockid)
+        return position.net_quantity if position else 0
+
+
+class StockPosition(db.Model):
+    """
+    StockPosition
+
+    Materialized per-user, per-stock holding. Updated inside the trade
+    transaction on every fill so sell validation and portfolio views read
+    one row instead of summing the user_transaction_stocks ledger.
+    Cost basis is tracked at average cost.
+    """
+    __tablename__ = 'stock_positions'
+    _user_id = db.Column(db.Integer, db.ForeignKey('stock_users.id', ondelete='CASCADE'), primary_key=True, nullable=False)
+    _stock_id = db.Column(db.Integer, db.ForeignKey('table_stocks.id', ondelete='CASCADE'), primary_key=True, nullable=False)
+    _net_quantity = db.Column(db.Integer, nullable=False, default=0)
+    _cost_basis = db.Column(db.Float, nullable=False, default=0)
+    _realized_pnl = db.Column(db.Float, nullable=False, default=0)
+    _updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    stock = db.relationship("TableStock")
+
+    def __init__(self, user_id, stock_id, net_quantity=0, cost_basis=0, realized_pnl=0):
+        self._user_id = user_id
+        self._stock_id = stock_id
+        self._net_quantity = net_quantity
+        self._cost_basis = cost_basis
+        self._realized_pnl = realized_pnl
+
+    def __repr__(self):
+        return f'<StockPosition {self._user_id} {self._stock_id} {self._net_quantity}>'
+
+    @property
+    def net_quantity(self):
+        return self._net_quantity
+
+    @property
+    def cost_basis(self):
+        return self._cost_basis
+
+    @property
+    def realized_pnl(self):
+        return self._realized_pnl
+
+    def apply_fill(self, side, quantity, price):
+        """Fold one fill into the position; returns the realized gain of a sell."""
+        if side == 'buy':
+            self._net_quantity += quantity
+            self._cost_basis += quantity * price
+            return 0
+        cost_removed = self._cost_basis * quantity / self._net_quantity if self._net_quantity else 0
+        gain = quantity * price - cost_removed
+        self._net_quantity -= quantity
+        self._cost_basis = self._cost_basis - cost_removed if self._net_quantity else 0
+        self._realized_pnl += gain
+        return gain
+
+    def read(self):
+        price = self.stock.sheesh if self.stock else None
+        return {
+            "user_id": self._user_id,
+            "stock_id": self._stock_id,
+            "symbol": self.stock.symbol if self.stock else None,
+            "net_quantity": self._net_quantity,
+            "cost_basis": self._cost_basis,
+            "average_cost": self._cost_basis / self._net_quantity if self._net_quantity else 0,
+            "realized_pnl": self._realized_pnl,
+            "price": price,
+            "market_value": self._net_quantity * price if price is not None else None,
+        }
+
+    @staticmethod
+    def get(user_id, stock_id, for_update=False):
+        """Get one position row; optionally locked for the current trade."""
+        query = StockPosition.query.filter_by(_user_id=user_id, _stock_id=stock_id)
+        if for_update:
+            query = query.with_for_update()
+        return query.first()
+
+    @staticmethod
+    def get_by_user(user_id):
+        """All open positions for a stock user"""
+        return StockPosition.query.options(db.joinedload(StockPosition.stock)) \
+            .filter(StockPosition._user_id == user_id, StockPosition._net_quantity > 0).all()
+
+    @staticmethod
+    def replay_ledger():
+        """
+        Rebuild positions in memory by replaying user_transaction_stocks in
+        time order. Returns {(user_id, stock_id): StockPosition} (unsaved).
+        """
+        rows = db.session.query(
+            UserTransactionStock._user_id,
+            UserTransactionStock._stock_id,
+            StockTransaction._transaction_type,
+            UserTransactionStock._quantity,
+            UserTransactionStock._price_per_stock,
+        ).join(StockTransaction, StockTransaction.id == UserTransactionStock._transaction_id) \
+         .order_by(UserTransactionStock._transaction_time, UserTransactionStock._transaction_id).all()
+        positions = {}
+        for user_id, stock_id, transaction_type, quantity, price in rows:
+            key = (user_id, stock_id)
+            if key not in positions:
+                positions[key] = StockPosition(user_id, stock_id)
+            positions[key].apply_fill(transaction_type, quantity, price)
+        return positions
+
+    @staticmethod
+    def rebuild(verify_only=False):
+        """
+        Replay the ledger and compare it with the stored positions table.
+
+        Args:
+            verify_only: report mismatches without rewriting the table
+
+        Returns:
+            list of mismatch dictionaries (empty when the table is consistent)
+        """
+        expected = StockPosition.replay_ledger()
+        stored = {(p._user_id, p._stock_id): p for p in StockPosition.query.all()}
+        mismatches = []
+        for key in expected.keys() | stored.keys():
+            want, have = expected.get(key), stored.get(key)
+            want_qty = want._net_quantity if want else 0
+            have_qty = have._net_quantity if have else 0
+            want_cost = round(want._cost_basis, 4) if want else 0
+            have_cost = round(have._cost_basis, 4) if have else 0
+            if want_qty != have_qty or want_cost != have_cost:
+                mismatches.append({
+                    "user_id": key[0],
+                    "stock_id": key[1],
+                    "expected_quantity": want_qty,
+                    "stored_quantity": have_qty,
+                    "expected_cost_basis": want_cost,
+                    "stored_cost_basis": have_cost,
+                })
+        if not verify_only:
+            StockPosition.query.delete()
+            db.session.add_all(expected.values())
+            db.session.commit()
+        return mismatches
+
+
+# Order in which open lots are consumed by a sell
+LOT_METHODS = {
+    'fifo': lambda: (StockLot._acquired_at.asc(), StockLot.id.asc()),
+    'lifo': lambda: (StockLot._acquired_at.desc(), StockLot.id.desc()),
+    'hifo': lambda: (StockLot._price.desc(), StockLot.id.asc()),
+}
+LONG_TERM_DAYS = 365
+
+
+class StockLot(db.Model):
+    """
+    StockLot
+
+    One buy fill held as a tax lot. Sells consume open lots in FIFO, LIFO
+    or highest-cost order and record a StockRealizedGain per lot touched.
+    The composite indexes keep open lots sorted per (user, stock) so a sell
+    reads only the lots it consumes. StockPosition keeps the average-cost
+    view; lots are the tax view of the same holdings.
+    """
+    __tablename__ = 'stock_lots'
+    __table_args__ = (
+        db.Index('ix_stock_lots_user_stock_acquired', '_user_id', '_stock_id', '_acquired_at'),
+        db.Index('ix_stock_lots_user_stock_price', '_user_id', '_stock_id', '_price'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    _user_id = db.Column(db.Integer, db.ForeignKey('stock_users.id', ondelete='CASCADE'), nullable=False)
+    _stock_id = db.Column(db.Integer, db.ForeignKey('table_stocks.id', ondelete='CASCADE'), nullable=False)
+    _transaction_id = db.Column(db.Integer, db.ForeignKey('stock_transactions.id', ondelete='CASCADE'), nullable=True)
+    _acquired_at = db.Column(db.DateTime, nullable=False)
+    _price = db.Column(db.Float, nullable=False)
+    _quantity = db.Column(db.Integer, nullable=False)
+    _open_quantity = db.Column(db.Integer, nullable=False)
+
+    def __init__(self, user_id, stock_id, transaction_id, acquired_at, price, quantity):
+        self._user_id = user_id
+        self._stock_id = stock_id
+        self._transaction_id = transaction_id
+        self._acquired_at = acquired_at
+        self._price = price
+        self._quantity = quantity
+        self._open_quantity = quantity
+
+    def term(self, sold_at):
+        return 'long' if sold_at - self._acquired_at > timedelta(days=LONG_TERM_DAYS) else 'short'
+
+    def read(self, as_of=None):
+        return {
+            "id": self.id,
+            "stock_id": self._stock_id,
+            "acquired_at": self._acquired_at.isoformat(),
+            "price": self._price,
+            "quantity": self._quantity,
+            "open_quantity": self._open_quantity,
+            "term": self.term(as_of or datetime.now()),
+        }
+
+    @staticmethod
+    def _open_lots(user_id, stock_id, method, page_size=20):
+        """
+        Yield open lots in consumption order, a page at a time. Callers must
+        fully close each lot they are handed or stop iterating.
+        """
+        order = LOT_METHODS[method]()
+        while True:
+            db.session.flush()  # closed lots drop out of the open-lot filter
+            page = StockLot.query.filter(
+                StockLot._user_id == user_id,
+                StockLot._stock_id == stock_id,
+                StockLot._open_quantity > 0,
+            ).order_by(*order).limit(page_size).all()
+            if not page:
+                return
+            yield from page
+
+    @staticmethod
+    def consume(user_id, stock_id, transaction_id, quantity, price, sold_at, method='fifo'):
+        """
+        Close quantity shares against open lots and stage the realized gains.
+
+        The caller owns the transaction; nothing is committed here.
+
+        Returns:
+            list of StockRealizedGain rows, or None if open lots are short
+        """
+        gains = []
+        remaining = quantity
+        for lot in StockLot._open_lots(user_id, stock_id, method):
+            take = min(remaining, lot._open_quantity)
+            lot._open_quantity -= take
+            gains.append(StockRealizedGain(
+                user_id=user_id,
+                stock_id=stock_id,
+                transaction_id=transaction_id,
+                lot_id=lot.id,
+                quantity=take,
+                proceeds=take * price,
+                cost=take * lot._price,
+                term=lot.term(sold_at),
+                realized_at=sold_at,
+            ))
+            remaining -= take
+            if remaining == 0:
+                break
+        if remaining:
+            return None
+        db.session.add_all(gains)
+        return gains
+
+    @staticmethod
+    def tax_summary(user_id, stock_id=None):
+        """Open lots by term and realized short/long-term gains."""
+        lots = StockLot.query.filter(StockLot._user_id == user_id, StockLot._open_quantity > 0)
+        gains = db.session.query(StockRealizedGain._term, db.func.sum(StockRealizedGain._gain), db.func.sum(StockRealizedGain._quantity)) \
+            .filter(StockRealizedGain._user_id == user_id)
+        if stock_id is not None:
+            lots = lots.filter(StockLot._stock_id == stock_id)
+            gains = gains.filter(StockRealizedGain._stock_id == stock_id)
+        now = datetime.now()
+        open_lots = [lot.read(now) for lot in lots.order_by(StockLot._acquired_at).all()]
+        realized = {term: {"gain": 0, "quantity": 0} for term in ('short', 'long')}
+        for term, gain, quantity in gains.group_by(StockRealizedGain._term).all():
+            realized[term] = {"gain": gain or 0, "quantity": quantity or 0}
+        return {
+            "open_lots": open_lots,
+            "open_short_term": sum(l["open_quantity"] for l in open_lots if l["term"] == 'short'),
+            "open_long_term": sum(l["open_quantity"] for l in open_lots if l["term"] == 'long'),
+            "realized_short_term": realized['short'],
+            "realized_long_term": realized['long'],
+        }
+
+    @staticmethod
+    def backfill(method='fifo'):
+        """
+        Create lots for ledger history recorded before lots existed by
+        replaying, in time order, every ledger fill whose transaction has no
+        lot or realized gain yet. Fills already reflected in lots are left
+        alone, so pairs traded both before and after lots existed are
+        completed too. Returns the number of lots created.
+        """
+        done = {t[0] for t in db.session.query(StockLot._transaction_id).filter(StockLot._transaction_id.isnot(None))}
+        done.update(t[0] for t in db.session.query(StockRealizedGain._transaction_id))
+        rows = db.session.query(
+            UserTransactionStock._user_id,
+            UserTransactionStock._stock_id,
+            UserTransactionStock._transaction_id,
+            StockTransaction._transaction_type,
+            UserTransactionStock._quantity,
+            UserTransactionStock._price_per_stock,
+            UserTransactionStock._transaction_time,
+        ).join(StockTransaction, StockTransaction.id == UserTransactionStock._transaction_id) \
+         .order_by(UserTransactionStock._transaction_time, UserTransactionStock._transaction_id).all()
+        created = 0
+        for user_id, stock_id, transaction_id, transaction_type, quantity, price, at in rows:
+            if transaction_id in done:
+                continue
+            if transaction_type == 'buy':
+                db.session.add(StockLot(user_id, stock_id, transaction_id, at, price, quantity))
+                created += 1
+            else:
+                db.session.flush()
+                StockLot.consume(user_id, stock_id, transaction_id, quantity, price, at, method)
+        db.session.commit()
+        return created
+
+
+class StockRealizedGain(db.Model):
+    """
+    StockRealizedGain
+
+    Realized gain from closing (part of) one lot in one sell fill.
+    """
+    __tablename__ = 'stock_realized_gains'
+    __table_args__ = (
+        db.Index('ix_stock_realized_gains_user_stock', '_user_id', '_stock_id'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    _user_id = db.Column(db.Integer, db.ForeignKey('stock_users.id', ondelete='CASCADE'), nullable=False)
+    _stock_id = db.Column(db.Integer, db.ForeignKey('table_stocks.id', ondelete='CASCADE'), nullable=False)
+    _transaction_id = db.Column(db.Integer, db.ForeignKey('stock_transactions.id', ondelete='CASCADE'), nullable=False)
+    _lot_id = db.Column(db.Integer, db.ForeignKey('stock_lots.id', ondelete='CASCADE'), nullable=False)
+    _quantity = db.Column(db.Integer, nullable=False)
+    _proceeds = db.Column(db.Float, nullable=False)
+    _cost = db.Column(db.Float, nullable=False)
+    _gain = db.Column(db.Float, nullable=False)
+    _term = db.Column(db.String(5), nullable=False)
+    _realized_at = db.Column(db.DateTime, nullable=False)
+
+    def __init__(self, user_id, stock_id, transaction_id, lot_id, quantity, proceeds, cost, term, realized_at):
+        self._user_id = user_id
+        self._stock_id = stock_id
+        self._transaction_id = transaction_id
+        self._lot_id = lot_id
+        self._quantity = quantity
+        self._proceeds = proceeds
+        self._cost = cost
+        self._gain = proceeds - cost
+        self._term = term
+        self._realized_at = realized_at
+
+    def read(self):
+        return {
+            "transaction_id": self._transaction_id,
+            "lot_id": self._lot_id,
+            "quantity": self._quantity,
+            "proceeds": self._proceeds,
+            "cost": self._cost,
+            "gain": self._gain,
+            "term": self._term,
+            "realized_at": self._realized_at.isoformat(),
+        }
+
+
+def upgrade_stock_schema():
+    """Add _expires_at and its index to an existing stock_users table (create_all only adds new tables)."""
+    db.create_all()
+    try:
+        columns = {column['name'] for column in inspect(db.engine).get_columns('stock_users')}
+        if '_expires_at' not in columns:
+            db.session.execute(text('ALTER TABLE stock_users ADD COLUMN _expires_at DATETIME'))
+        db.session.commit()
+        for index in StockUser.__table__.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+    except Exception as e:
+        db.session.rollback()
+        print(f"Stock schema upgrade skipped: {e}")
@@ -10,7 +10,7 @@ import json
 from __init__ import app, db
 from model.github import GitHubUser
 from model.kasm import KasmUser
-from model.stocks import StockUser
+from model.stocks import StockUser, STARTING_BALANCE
 
 
 """ Helper Functions """
@@ -613,7 +613,7 @@ class User(db.Model, UserMixin):
         Add 1-to-1 stock user to the user's record. 
         """
         if not self.stock_user:
-            self.stock_user = StockUser(uid=self._uid, stockmoney=100000)
+            self.stock_user = StockUser(uid=self._uid, stockmoney=STARTING_BALANCE)
             db.session.commit()
         return self 
             